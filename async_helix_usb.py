@@ -0,0 +1,151 @@
+import asyncio
+from helix_usb import HelixUsb
+from utils.usb_monitor import UsbMonitor
+import logging
+log = logging.getLogger(__name__)
+
+
+class AsyncHelixUsb:
+	# asyncio facade for HelixUsb. USB I/O stays on HelixUsb's own threads, its events are forwarded into the event
+	# loop where they resolve pending requests and feed the event iterators:
+	#   helix = AsyncHelixUsb()
+	#   await helix.start()
+	#   await helix.wait_ready()
+	#   names = await helix.get_preset_names()
+	#   hx_preset = await helix.get_preset(12)
+	#   async for slot_no, slot_info in helix.slot_events():
+	#       ...
+	DEVICE_IDS = ['0e41:4246', '0e41:5055']
+	REQUEST_TIMEOUT = 5.0
+	EVENT_QUEUE_SIZE = 256
+
+	def __init__(self, helix_usb=None):
+		self.helix_usb = helix_usb if helix_usb is not None else HelixUsb()
+		self.usb_monitor = None
+		self.loop = None
+		# event name -> list of (predicate, future) and list of iterator queues, only used in the event loop
+		self.waiters = {}
+		self.event_queues = {}
+		self.ready = None
+		# requests switch the device mode, one at a time
+		self.request_lock = None
+
+		self.helix_usb.register_preset_name_change_cb_fct(lambda *args: self._forward('preset_name', args))
+		self.helix_usb.register_preset_names_change_cb_fct(lambda *args: self._forward('preset_names', args))
+		self.helix_usb.register_preset_received_cb_fct(lambda *args: self._forward('preset', args))
+		self.helix_usb.register_preset_no_change_cb_fct(lambda *args: self._forward('preset_no', args))
+		self.helix_usb.register_slot_data_change_cb_fct(lambda *args: self._forward('slot', args))
+		self.helix_usb.register_knob_value_change_cb_fct(lambda *args: self._forward('knob', args))
+		self.helix_usb.register_snapshot_change_cb_fct(lambda *args: self._forward('snapshot', args))
+
+	async def start(self):
+		self.loop = asyncio.get_running_loop()
+		self.ready = asyncio.Event()
+		self.request_lock = asyncio.Lock()
+		if self.helix_usb.got_preset_names:
+			self.ready.set()
+
+		self.usb_monitor = UsbMonitor(self.DEVICE_IDS)
+		self.usb_monitor.register_device_found_cb(self.helix_usb.usb_device_found_cb)
+		self.usb_monitor.register_device_lost_cb(self.helix_usb.usb_device_lost_cb)
+		self.usb_monitor.start()
+		self.helix_usb.usb_monitor = self.usb_monitor
+
+	async def stop(self):
+		await self.loop.run_in_executor(None, self.helix_usb.shutdown, self.usb_monitor)
+		for waiters in self.waiters.values():
+			for _, future in waiters:
+				if not future.done():
+					future.cancel()
+		self.waiters = {}
+
+	async def wait_ready(self, timeout=None):
+		# the device is connected and the startup requests (current preset, preset names) are done
+		await asyncio.wait_for(self.ready.wait(), timeout)
+
+	async def get_preset_name(self, timeout=REQUEST_TIMEOUT):
+		name, = await self._request('preset_name', lambda: self.helix_usb.switch_mode('RequestPresetName'), timeout)
+		return name
+
+	async def get_preset_names(self, timeout=REQUEST_TIMEOUT):
+		preset_names, = await self._request('preset_names', lambda: self.helix_usb.switch_mode('RequestPresetNames'),
+											timeout, predicate=lambda args: self.helix_usb.got_preset_names)
+		return preset_names
+
+	async def get_preset(self, preset_no=None, timeout=REQUEST_TIMEOUT):
+		# without preset_no (or for the current preset) the current preset data is requested, otherwise the device
+		# switches to preset_no and the preset data is requested by the usual mode sequence
+		if preset_no is None or preset_no == self.helix_usb.current_preset_no:
+			trigger = lambda: self.helix_usb.switch_mode('RequestPreset')
+			predicate = None
+		else:
+			trigger = lambda: self._program_change_or_raise(preset_no)
+			predicate = lambda args: args[0] == preset_no
+		_, hx_preset = await self._request('preset', trigger, timeout, predicate=predicate)
+		return hx_preset
+
+	async def program_change(self, preset_no):
+		# returns False if the program change could not be sent, like HelixUsb.send_midi_program_change
+		return await self.loop.run_in_executor(None, self.helix_usb.send_midi_program_change, preset_no)
+
+	def preset_no_events(self):
+		return self._events('preset_no')
+
+	def slot_events(self):
+		# yields (slot_no, slot_info)
+		return self._events('slot')
+
+	def knob_events(self):
+		# yields (slot_no, parameter_idx, value)
+		return self._events('knob')
+
+	def snapshot_events(self):
+		return self._events('snapshot')
+
+	def _program_change_or_raise(self, preset_no):
+		if not self.helix_usb.send_midi_program_change(preset_no):
+			raise ValueError('Cannot send program change to preset ' + str(preset_no))
+
+	async def _request(self, name, trigger, timeout, predicate=None):
+		async with self.request_lock:
+			future = self.loop.create_future()
+			waiter = (predicate, future)
+			self.waiters.setdefault(name, []).append(waiter)
+			try:
+				await self.loop.run_in_executor(None, trigger)
+				return await asyncio.wait_for(future, timeout)
+			finally:
+				# stop() may have dropped the waiters meanwhile
+				waiters = self.waiters.get(name, [])
+				if waiter in waiters:
+					waiters.remove(waiter)
+
+	async def _events(self, name):
+		queue = asyncio.Queue(maxsize=self.EVENT_QUEUE_SIZE)
+		self.event_queues.setdefault(name, []).append(queue)
+		try:
+			while True:
+				args = await queue.get()
+				yield args if len(args) > 1 else args[0]
+		finally:
+			self.event_queues[name].remove(queue)
+
+	def _forward(self, name, args):
+		# called on the event bus workers
+		loop = self.loop
+		if loop is not None and not loop.is_closed():
+			loop.call_soon_threadsafe(self._on_event, name, args)
+
+	def _on_event(self, name, args):
+		if name == 'preset_names' and self.helix_usb.got_preset_names:
+			self.ready.set()
+
+		for predicate, future in self.waiters.get(name, []):
+			if not future.done() and (predicate is None or predicate(args)):
+				future.set_result(args)
+
+		for queue in self.event_queues.get(name, []):
+			if queue.full():
+				# the iterator is not consumed fast enough, oldest event goes first
+				queue.get_nowait()
+			queue.put_nowait(args)
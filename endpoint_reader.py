@@ -0,0 +1,129 @@
+import collections
+import threading
+import time
+from array import array
+import logging
+log = logging.getLogger(__name__)
+
+
+class EndpointReader:
+	# Reading and processing of an incoming endpoint run on separate threads. The reader thread only reads into a ring
+	# of preallocated buffers and issues the next read right away, the dispatch thread copies each packet out of its
+	# buffer, returns the buffer to the ring and passes the packet to dispatch_fct in arrival order. Slow callbacks
+	# only hold up the reads once every buffer of the ring is waiting for dispatch.
+	def __init__(self, read_fct, dispatch_fct, buffer_size, buffer_cnt=32, error_fct=None, name='endpoint reader'):
+		# read_fct(buffer) reads into buffer and returns the number of bytes read
+		self.read_fct = read_fct
+		self.dispatch_fct = dispatch_fct
+		self.error_fct = error_fct
+		self.name = name
+		self.free_buffers = collections.deque(array('B', bytes(buffer_size)) for _ in range(buffer_cnt))
+		self.received = collections.deque()
+		self.condition = threading.Condition()
+		self.reader_thread = None
+		self.dispatch_thread = None
+		self.do_run = False
+
+		self.read_cnt = 0
+		self.error_cnt = 0
+		self.max_backlog = 0
+		self.stall_cnt = 0
+		self.max_dispatch_time = 0.0
+
+	def start(self):
+		with self.condition:
+			if self.is_running():
+				return
+			self.do_run = True
+			self.dispatch_thread = threading.Thread(target=self.dispatch_thread_fct, name=self.name + ' dispatch', daemon=True)
+			self.reader_thread = threading.Thread(target=self.reader_thread_fct, name=self.name, daemon=True)
+			self.dispatch_thread.start()
+			self.reader_thread.start()
+
+	def stop(self, timeout=1.0):
+		with self.condition:
+			self.do_run = False
+			if len(self.received):
+				log.info(self.name + ': dropping ' + str(len(self.received)) + ' received packet(s)')
+			while len(self.received):
+				self.free_buffers.append(self.received.popleft()[0])
+			self.condition.notify_all()
+
+		# the reader thread may be blocked in a read without timeout, it ends with the next packet or error
+		for thread in [self.dispatch_thread, self.reader_thread]:
+			if thread is not None and thread is not threading.current_thread():
+				thread.join(timeout=timeout)
+		self.dispatch_thread = None
+		self.reader_thread = None
+
+	def is_running(self):
+		return self.do_run and self.reader_thread is not None and self.reader_thread.is_alive()
+
+	def backlog(self):
+		with self.condition:
+			return len(self.received)
+
+	def stats(self):
+		with self.condition:
+			return {
+				'backlog': len(self.received),
+				'max_backlog': self.max_backlog,
+				'read': self.read_cnt,
+				'errors': self.error_cnt,
+				'stalls': self.stall_cnt,
+				'max_dispatch_time': self.max_dispatch_time
+			}
+
+	def reader_thread_fct(self):
+		log.info('Started ' + self.name + ' thread')
+		while True:
+			with self.condition:
+				if self.do_run and len(self.free_buffers) == 0:
+					self.stall_cnt += 1
+					while self.do_run and len(self.free_buffers) == 0:
+						self.condition.wait()
+				if not self.do_run:
+					break
+				buffer = self.free_buffers.popleft()
+
+			try:
+				length = self.read_fct(buffer)
+			except Exception as e:
+				with self.condition:
+					self.free_buffers.append(buffer)
+				self.error_cnt += 1
+				if self.do_run and self.error_fct is not None:
+					self.error_fct(e)
+				continue
+
+			with self.condition:
+				self.read_cnt += 1
+				self.received.append((buffer, length))
+				if len(self.received) > self.max_backlog:
+					self.max_backlog = len(self.received)
+				if len(self.received) == 1:
+					self.condition.notify_all()
+		log.info('Stopped ' + self.name + ' thread')
+
+	def dispatch_thread_fct(self):
+		while True:
+			with self.condition:
+				while self.do_run and len(self.received) == 0:
+					self.condition.wait()
+				if not self.do_run:
+					break
+				buffer, length = self.received.popleft()
+				data = buffer[:length]
+				self.free_buffers.append(buffer)
+				if len(self.free_buffers) == 1:
+					# the reader may be waiting for a buffer
+					self.condition.notify_all()
+
+			start = time.monotonic()
+			try:
+				self.dispatch_fct(data)
+			except Exception as e:
+				log.error(self.name + ': failed to dispatch packet: ' + str(e))
+			dispatch_time = time.monotonic() - start
+			if dispatch_time > self.max_dispatch_time:
+				self.max_dispatch_time = dispatch_time
@@ -0,0 +1,112 @@
+import heapq
+import itertools
+import threading
+import time
+import logging
+log = logging.getLogger(__name__)
+
+
+class EndpointWriter:
+	# Single thread owning an outgoing endpoint. Packets are kept in a heap ordered by (send time, submission
+	# order), so delayed packets don't need a thread of their own and packets due at the same time go out in the
+	# order they were submitted.
+	def __init__(self, write_fct, name='endpoint writer'):
+		self.write_fct = write_fct
+		self.name = name
+		self.queue = []
+		self.submission_cnt = itertools.count()
+		self.condition = threading.Condition()
+		self.thread = None
+		self.do_run = False
+
+		self.max_queue_depth = 0
+		self.sent_cnt = 0
+		self.error_cnt = 0
+		self.last_latency = 0.0
+		self.max_latency = 0.0
+		self.total_latency = 0.0
+
+	def start(self):
+		with self.condition:
+			if self.is_running():
+				return
+			self.do_run = True
+			self.thread = threading.Thread(target=self.writer_thread_fct, name=self.name, daemon=True)
+			self.thread.start()
+
+	def stop(self, timeout=1.0):
+		with self.condition:
+			self.do_run = False
+			if len(self.queue):
+				log.info(self.name + ': dropping ' + str(len(self.queue)) + ' pending packet(s)')
+			self.queue = []
+			self.condition.notify()
+
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout=timeout)
+		self.thread = None
+
+	def is_running(self):
+		return self.do_run and self.thread is not None and self.thread.is_alive()
+
+	def is_writer_thread(self):
+		return self.thread is threading.current_thread()
+
+	def submit(self, data, delay=0.0, silent=False):
+		send_time = time.monotonic() + delay
+		with self.condition:
+			entry = (send_time, next(self.submission_cnt), data, silent)
+			heapq.heappush(self.queue, entry)
+			if len(self.queue) > self.max_queue_depth:
+				self.max_queue_depth = len(self.queue)
+			# only wake up the writer if the new packet is due before the one it is waiting for
+			if self.queue[0] is entry:
+				self.condition.notify()
+
+	def queue_depth(self):
+		with self.condition:
+			return len(self.queue)
+
+	def stats(self):
+		with self.condition:
+			return {
+				'queue_depth': len(self.queue),
+				'max_queue_depth': self.max_queue_depth,
+				'sent': self.sent_cnt,
+				'errors': self.error_cnt,
+				'last_latency': self.last_latency,
+				'max_latency': self.max_latency,
+				'avg_latency': self.total_latency / self.sent_cnt if self.sent_cnt else 0.0
+			}
+
+	def writer_thread_fct(self):
+		log.info('Started ' + self.name + ' thread')
+		while True:
+			with self.condition:
+				while self.do_run:
+					if len(self.queue) == 0:
+						self.condition.wait()
+						continue
+					wait_time = self.queue[0][0] - time.monotonic()
+					if wait_time <= 0:
+						break
+					self.condition.wait(wait_time)
+
+				if not self.do_run:
+					break
+				send_time, _, data, silent = heapq.heappop(self.queue)
+
+			try:
+				self.write_fct(data, silent)
+			except Exception as e:
+				self.error_cnt += 1
+				log.error(self.name + ': failed to write packet: ' + str(e))
+				continue
+
+			latency = time.monotonic() - send_time
+			self.sent_cnt += 1
+			self.last_latency = latency
+			self.total_latency += latency
+			if latency > self.max_latency:
+				self.max_latency = latency
+		log.info('Stopped ' + self.name + ' thread')
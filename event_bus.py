@@ -0,0 +1,187 @@
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+log = logging.getLogger(__name__)
+
+
+class HelixEvent:
+	# State events are coalesced: a newer event replaces one with the same key still waiting in a subscriber's
+	# queue, so a slow subscriber gets the latest state instead of the whole history.
+	coalesce = False
+	__slots__ = ('args',)
+
+	def __init__(self, *args):
+		self.args = args
+
+	def key(self):
+		return type(self) if self.coalesce else None
+
+
+class PresetNameChanged(HelixEvent):
+	# (name)
+	__slots__ = ()
+
+
+class PresetNamesChanged(HelixEvent):
+	# (preset_names)
+	coalesce = True
+	__slots__ = ()
+
+
+class PresetNameDecoded(HelixEvent):
+	# (preset_no, name)
+	__slots__ = ()
+
+
+class PresetNoChanged(HelixEvent):
+	# (preset_no)
+	coalesce = True
+	__slots__ = ()
+
+
+class SlotDataChanged(HelixEvent):
+	# (slot_no, slot_info), latest wins per slot
+	coalesce = True
+	__slots__ = ()
+
+	def key(self):
+		return SlotDataChanged, self.args[0]
+
+
+class PresetReceived(HelixEvent):
+	# (preset_no, hx_preset)
+	__slots__ = ()
+
+
+class PresetChanged(HelixEvent):
+	# (preset_no, changes), the PresetChange list between the previous and the received preset
+	__slots__ = ()
+
+
+class KnobValueChanged(HelixEvent):
+	# (slot_no, parameter_idx, value), latest wins per parameter
+	coalesce = True
+	__slots__ = ()
+
+	def key(self):
+		return KnobValueChanged, self.args[0], self.args[1]
+
+
+class TrailsChanged(HelixEvent):
+	# (slot_no, trails_on)
+	__slots__ = ()
+
+
+class SnapshotChanged(HelixEvent):
+	# (snapshot)
+	coalesce = True
+	__slots__ = ()
+
+
+class Subscriber:
+	def __init__(self, event_type, fct, max_queue_size):
+		self.event_type = event_type
+		self.fct = fct
+		self.max_queue_size = max_queue_size
+		# entries are [event, key], pending maps the key of a queued state event to its entry
+		self.queue = collections.deque()
+		self.pending = {}
+		self.scheduled = False
+		self.dropped_cnt = 0
+
+	def put(self, event):
+		# called with the bus lock held, returns False if the event replaced a queued one
+		key = event.key()
+		if key is not None:
+			entry = self.pending.get(key)
+			if entry is not None:
+				entry[0] = event
+				return False
+
+		if len(self.queue) >= self.max_queue_size:
+			self.forget(self.queue.popleft())
+			self.dropped_cnt += 1
+			if self.dropped_cnt == 1 or self.dropped_cnt % 100 == 0:
+				log.warning('Subscriber ' + str(self.fct) + ' too slow, dropped ' + str(self.dropped_cnt) + ' event(s)')
+
+		entry = [event, key]
+		self.queue.append(entry)
+		if key is not None:
+			self.pending[key] = entry
+		return True
+
+	def take(self):
+		entry = self.queue.popleft()
+		self.forget(entry)
+		return entry[0]
+
+	def forget(self, entry):
+		if entry[1] is not None and self.pending.get(entry[1]) is entry:
+			del self.pending[entry[1]]
+
+
+class EventBus:
+	# Delivers events to the subscribed functions on a small thread pool, the publisher (usually the USB dispatch
+	# thread) only queues them. Each subscriber has its own bounded queue and is drained by at most one worker at a
+	# time, so it sees its events in order and a slow subscriber only delays itself.
+	MAX_WORKERS = 4
+	MAX_QUEUE_SIZE = 256
+
+	def __init__(self, max_workers=MAX_WORKERS, name='event bus'):
+		self.name = name
+		self.subscribers = {}
+		self.lock = threading.Lock()
+		self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+	def subscribe(self, event_type, fct, max_queue_size=MAX_QUEUE_SIZE):
+		subscriber = Subscriber(event_type, fct, max_queue_size)
+		with self.lock:
+			# copy on write, publish() iterates without holding a reference to a list being changed
+			self.subscribers[event_type] = self.subscribers.get(event_type, []) + [subscriber]
+		return subscriber
+
+	def unsubscribe(self, subscriber):
+		with self.lock:
+			subscribers = self.subscribers.get(subscriber.event_type, [])
+			self.subscribers[subscriber.event_type] = [s for s in subscribers if s is not subscriber]
+			subscriber.queue.clear()
+			subscriber.pending.clear()
+
+	def publish(self, event):
+		to_schedule = []
+		with self.lock:
+			if self.executor is None:
+				return
+			for subscriber in self.subscribers.get(type(event), []):
+				if subscriber.put(event) and not subscriber.scheduled:
+					subscriber.scheduled = True
+					to_schedule.append(subscriber)
+			executor = self.executor
+
+		for subscriber in to_schedule:
+			try:
+				executor.submit(self.drain, subscriber)
+			except RuntimeError:
+				# shut down meanwhile
+				return
+
+	def drain(self, subscriber):
+		while True:
+			with self.lock:
+				if len(subscriber.queue) == 0:
+					subscriber.scheduled = False
+					return
+				event = subscriber.take()
+
+			try:
+				subscriber.fct(*event.args)
+			except Exception as e:
+				log.error(self.name + ': ' + type(event).__name__ + ' subscriber ' + str(subscriber.fct) + ' failed: ' + str(e))
+
+	def shutdown(self, wait=False):
+		with self.lock:
+			executor = self.executor
+			self.executor = None
+		if executor is not None:
+			executor.shutdown(wait=wait)
@@ -1,134 +1,190 @@
+import collections
+import os
+import threading
+import time
+from datetime import timedelta
 import xlsxwriter
-from datetime import datetime
 import logging
 log = logging.getLogger(__name__)
 
 
 class ExcelLogger:
-	def __init__(self, out_path='./dump.xlsx'):
+	# log() is called by the USB reader and writer threads, it only queues the raw packet with its time and number.
+	# A background thread writes the queued packets to the workbook, which is opened in constant_memory mode (every
+	# row is flushed to disk once the next one is started). The log rolls over to out_1.xlsx, out_2.xlsx, ... when a
+	# sheet reaches MAX_ROWS rows or MAX_BYTES bytes of packet data. Packets which don't fit into the queue are dropped
+	# and counted, their packet numbers are missing in the log.
+	MAX_QUEUE = 100000
+	MAX_ROWS = 1000000
+	MAX_BYTES = 64 * 1024 * 1024
+	BATCH_SIZE = 256
+
+	# column of the packet data: host to device, device to host
+	COLUMN_OUT = 2
+	COLUMN_IN = 4
+	COLORS = {0x1: 'edf0e0', 0x2: 'f5c9ce', 0x80: 'fbeaa5'}
+
+	def __init__(self, out_path='./dump.xlsx', max_rows=MAX_ROWS, max_bytes=MAX_BYTES, max_queue=MAX_QUEUE):
 		self.out_path = out_path
-		self.excel_workbook = xlsxwriter.Workbook(out_path)
+		self.max_rows = max_rows
+		self.max_bytes = max_bytes
+		self.max_queue = max_queue
 
-		self.format_x1_x10 = self.excel_workbook.add_format()
-		self.format_x2_x10 = self.excel_workbook.add_format()
-		self.format_x80_x10 = self.excel_workbook.add_format()
+		self.queue = collections.deque()
+		self.condition = threading.Condition()
+		self.do_run = True
+		self.packet_count = 0
+		self.dropped_cnt = 0
+		self.max_queue_depth = 0
+		self.session_start_time = time.monotonic()
 
-		self.format_x1_x10.set_pattern(1)
-		self.format_x2_x10.set_pattern(1)
-		self.format_x80_x10.set_pattern(1)
-		self.format_x1_x10.set_bg_color('edf0e0')
-		self.format_x2_x10.set_bg_color('f5c9ce')
-		self.format_x80_x10.set_bg_color('fbeaa5')
+		# used by the writer thread only
+		self.excel_workbook = None
+		self.formats = {}
+		self.worksheet_all_ports = None
+		self.worksheets = {}
+		self.xlsx_row_num = 0
+		self.row_nums = {}
+		self.byte_cnt = 0
+		self.file_no = 0
+		self.paths = []
+		self.written_cnt = 0
+		self.unknown_cnt = 0
+
+		self.open_workbook()
+		self.thread = threading.Thread(target=self.writer_thread_fct, name='excel logger', daemon=True)
+		self.thread.start()
+
+	def file_path(self, file_no):
+		if file_no == 0:
+			return self.out_path
+		root, ext = os.path.splitext(self.out_path)
+		return '{}_{}{}'.format(root, file_no, ext or '.xlsx')
+
+	def open_workbook(self):
+		path = self.file_path(self.file_no)
+		self.excel_workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+		self.paths.append(path)
+
+		self.formats = {}
+		for channel, color in ExcelLogger.COLORS.items():
+			cell_format = self.excel_workbook.add_format()
+			cell_format.set_pattern(1)
+			cell_format.set_bg_color(color)
+			self.formats[channel] = cell_format
 
 		self.worksheet_all_ports = self.excel_workbook.add_worksheet("all")
-		self.worksheet_x1x10 = self.excel_workbook.add_worksheet("x1x10")
-		self.worksheet_x2x10 = self.excel_workbook.add_worksheet("x2x10")
-		self.worksheet_x80x10 = self.excel_workbook.add_worksheet("x80x10")
-
+		self.worksheets = {
+			0x1: self.excel_workbook.add_worksheet("x1x10"),
+			0x2: self.excel_workbook.add_worksheet("x2x10"),
+			0x80: self.excel_workbook.add_worksheet("x80x10")
+		}
 		self.xlsx_row_num = 0
-		self.x1_x10_row_num = 0
-		self.x2_x10_row_num = 0
-		self.x80_x10_row_num = 0
+		self.row_nums = {channel: 0 for channel in self.worksheets}
+		self.byte_cnt = 0
 
-		self.session_start_time = datetime.now()
-		self.packet_count = 0
-
-	def save(self):
+	def close_workbook(self):
 		self.excel_workbook.close()
 		self.excel_workbook = None
-		log.info("Saved Excel sheet at: " + str(self.out_path))
-
-	def log(self, data):
-		if self.excel_workbook is None:
-			return
-
-		time_offset = datetime.now() - self.session_start_time
-		full_data_str = ''
-
-		for i, d in enumerate(data):
-			e = hex(d)
-			if i == 9:
-				full_data_str += (e + ', ')
-			else:
-				full_data_str += (e + ', ')
-
-		if full_data_str.endswith(', '):
-			full_data_str = full_data_str[:-2]
-
-		# OUT (Host to Device)
-		if data[4] == 0x1:
-
-			self.worksheet_all_ports.write('A' + str(self.xlsx_row_num), self.packet_count)
-			self.worksheet_all_ports.write('B' + str(self.xlsx_row_num), str(time_offset))
-			self.worksheet_all_ports.write('C' + str(self.xlsx_row_num), full_data_str, self.format_x1_x10)
-
-			self.worksheet_x1x10.write('A' + str(self.x1_x10_row_num), self.packet_count)
-			self.worksheet_x1x10.write('B' + str(self.x1_x10_row_num), str(time_offset))
-			self.worksheet_x1x10.write('C' + str(self.x1_x10_row_num), full_data_str, self.format_x1_x10)
-
-			self.x1_x10_row_num += 1
-
-		elif data[4] == 0x2:
+		log.info("Saved Excel sheet at: " + str(self.paths[-1]))
 
-			self.worksheet_all_ports.write('A' + str(self.xlsx_row_num), self.packet_count)
-			self.worksheet_all_ports.write('B' + str(self.xlsx_row_num), str(time_offset))
-			self.worksheet_all_ports.write('C' + str(self.xlsx_row_num), full_data_str, self.format_x2_x10)
-
-			self.worksheet_x2x10.write('A' + str(self.x2_x10_row_num), self.packet_count)
-			self.worksheet_x2x10.write('B' + str(self.x2_x10_row_num), str(time_offset))
-			self.worksheet_x2x10.write('C' + str(self.x2_x10_row_num), full_data_str, self.format_x2_x10)
-
-			self.x2_x10_row_num += 1
-
-		elif data[4] == 0x80:
-
-			self.worksheet_all_ports.write('A' + str(self.xlsx_row_num), self.packet_count)
-			self.worksheet_all_ports.write('B' + str(self.xlsx_row_num), str(time_offset))
-			self.worksheet_all_ports.write('C' + str(self.xlsx_row_num), full_data_str, self.format_x80_x10)
-
-
-			self.worksheet_x80x10.write('A' + str(self.x80_x10_row_num), self.packet_count)
-			self.worksheet_x80x10.write('B' + str(self.x80_x10_row_num), str(time_offset))
-			self.worksheet_x80x10.write('C' + str(self.x80_x10_row_num), full_data_str, self.format_x80_x10)
-
-			self.x80_x10_row_num += 1
-
-		# IN (Device to Host)
-		elif data[6] == 0x1:
-			self.worksheet_all_ports.write('A' + str(self.xlsx_row_num), self.packet_count)
-			self.worksheet_all_ports.write('B' + str(self.xlsx_row_num), str(time_offset))
-			self.worksheet_all_ports.write('E' + str(self.xlsx_row_num), full_data_str, self.format_x1_x10)
-
-			self.worksheet_x1x10.write('A' + str(self.x1_x10_row_num), self.packet_count)
-			self.worksheet_x1x10.write('B' + str(self.x1_x10_row_num), str(time_offset))
-			self.worksheet_x1x10.write('E' + str(self.x1_x10_row_num), full_data_str, self.format_x1_x10)
-
-			self.x1_x10_row_num += 1
-		elif data[6] == 0x2:
-			self.worksheet_all_ports.write('A' + str(self.xlsx_row_num), self.packet_count)
-			self.worksheet_all_ports.write('B' + str(self.xlsx_row_num), str(time_offset))
-			self.worksheet_all_ports.write('E' + str(self.xlsx_row_num), full_data_str, self.format_x2_x10)
-
-			self.worksheet_x2x10.write('A' + str(self.x2_x10_row_num), self.packet_count)
-			self.worksheet_x2x10.write('B' + str(self.x2_x10_row_num), str(time_offset))
-			self.worksheet_x2x10.write('E' + str(self.x2_x10_row_num), full_data_str, self.format_x2_x10)
-			self.x2_x10_row_num += 1
-
-		elif data[6] == 0x80:
-			self.worksheet_all_ports.write('A' + str(self.xlsx_row_num), self.packet_count)
-			self.worksheet_all_ports.write('B' + str(self.xlsx_row_num), str(time_offset))
-			self.worksheet_all_ports.write('E' + str(self.xlsx_row_num), full_data_str, self.format_x80_x10)
+	def roll_over(self):
+		self.close_workbook()
+		self.file_no += 1
+		self.open_workbook()
+		log.info("Excel log continues in: " + str(self.paths[-1]))
 
+	def save(self):
+		with self.condition:
+			if not self.do_run:
+				return
+			self.do_run = False
+			self.condition.notify_all()
+		if self.thread is not threading.current_thread():
+			self.thread.join()
+		stats = self.stats()
+		log.info('Excel log: {} packet(s) written to {} file(s), {} dropped, max queue depth {}'.format(
+			stats['written'], len(self.paths), stats['dropped'], stats['max_queue_depth']))
+
+	def stats(self):
+		with self.condition:
+			return {
+				'logged': self.packet_count,
+				'written': self.written_cnt,
+				'dropped': self.dropped_cnt,
+				'queued': len(self.queue),
+				'max_queue_depth': self.max_queue_depth,
+				'files': list(self.paths)
+			}
+
+	def log(self, data, timestamp=None, wait=False):
+		# timestamp: time.monotonic() based, wait: block while the queue is full instead of dropping (offline use)
+		if timestamp is None:
+			timestamp = time.monotonic()
+		with self.condition:
+			if not self.do_run:
+				return
+			packet_no = self.packet_count
+			self.packet_count += 1
+			while wait and self.do_run and len(self.queue) >= self.max_queue:
+				self.condition.wait()
+			if len(self.queue) >= self.max_queue:
+				self.dropped_cnt += 1
+				return
+			self.queue.append((packet_no, timestamp, bytes(data)))
+			if len(self.queue) > self.max_queue_depth:
+				self.max_queue_depth = len(self.queue)
+			if len(self.queue) == 1:
+				self.condition.notify_all()
+
+	def writer_thread_fct(self):
+		while True:
+			with self.condition:
+				while self.do_run and len(self.queue) == 0:
+					self.condition.wait()
+				if not self.do_run and len(self.queue) == 0:
+					break
+				if len(self.queue) >= self.max_queue:
+					# log() may wait for room
+					self.condition.notify_all()
+				batch = [self.queue.popleft() for _ in range(min(len(self.queue), ExcelLogger.BATCH_SIZE))]
+
+			for packet_no, timestamp, data in batch:
+				try:
+					self.write(packet_no, timestamp, data)
+				except Exception as e:
+					log.error('Excel log: cannot write packet ' + str(packet_no) + ': ' + str(e))
+			with self.condition:
+				self.written_cnt += len(batch)
+
+		self.close_workbook()
+
+	def write(self, packet_no, timestamp, data):
+		# OUT (Host to Device) has the channel in byte 4, IN (Device to Host) in byte 6
+		if data[4] in self.worksheets:
+			channel = data[4]
+			column = ExcelLogger.COLUMN_OUT
+		elif data[6] in self.worksheets:
+			channel = data[6]
+			column = ExcelLogger.COLUMN_IN
+		else:
+			self.unknown_cnt += 1
+			log.warning("Unknown communication path in packet " + str(packet_no))
+			return
 
-			self.worksheet_x80x10.write('A' + str(self.x80_x10_row_num), self.packet_count)
-			self.worksheet_x80x10.write('B' + str(self.x80_x10_row_num), str(time_offset))
-			self.worksheet_x80x10.write('E' + str(self.x80_x10_row_num), full_data_str, self.format_x80_x10)
+		if self.xlsx_row_num >= self.max_rows or self.row_nums[channel] >= self.max_rows or \
+				self.byte_cnt >= self.max_bytes:
+			self.roll_over()
 
-			self.x80_x10_row_num += 1
+		time_offset = str(timedelta(seconds=timestamp - self.session_start_time))
+		full_data_str = ', '.join([hex(d) for d in data])
+		cell_format = self.formats[channel]
 
-		else:
-			print("WARNING: Unknown communication path in endpoint 0x1")
+		for worksheet, row_num in [(self.worksheet_all_ports, self.xlsx_row_num), (self.worksheets[channel], self.row_nums[channel])]:
+			worksheet.write_number(row_num, 0, packet_no)
+			worksheet.write_string(row_num, 1, time_offset)
+			worksheet.write_string(row_num, column, full_data_str, cell_format)
 
 		self.xlsx_row_num += 1
-		self.packet_count += 1
-
+		self.row_nums[channel] += 1
+		self.byte_cnt += len(data)
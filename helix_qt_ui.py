@@ -169,6 +169,7 @@ class SignalChainPanel(QFrame):
 
 class HelixBridge(QObject):
 	preset_names_changed = Signal(list)
+	preset_name_decoded = Signal(int, str)
 	preset_no_changed = Signal(int)
 	slot_data_changed = Signal(int, object)
 	connection_changed = Signal(bool)
@@ -182,6 +183,7 @@ class HelixBridge(QObject):
 		self._requested_initial_names = False
 
 		self.helix.register_preset_names_change_cb_fct(self._on_preset_names)
+		self.helix.register_preset_name_decoded_cb_fct(self._on_preset_name_decoded)
 		self.helix.register_preset_no_change_cb_fct(self._on_preset_no)
 		self.helix.register_slot_data_change_cb_fct(self._on_slot_data)
 
@@ -231,6 +233,9 @@ class HelixBridge(QObject):
 	def _on_preset_names(self, preset_names):
 		self.preset_names_changed.emit(list(preset_names))
 
+	def _on_preset_name_decoded(self, preset_no, name):
+		self.preset_name_decoded.emit(preset_no, name)
+
 	def _on_preset_no(self, preset_no):
 		self.preset_no_changed.emit(preset_no)
 
@@ -481,6 +486,7 @@ class MainWindow(QMainWindow):
 		self.chk_show_debug_console.toggled.connect(self.log_view.setVisible)
 
 		self.bridge.preset_names_changed.connect(self._on_preset_names_changed)
+		self.bridge.preset_name_decoded.connect(self._on_preset_name_decoded)
 		self.bridge.preset_no_changed.connect(self._on_preset_no_changed)
 		self.bridge.slot_data_changed.connect(self._on_slot_data_changed)
 		self.bridge.connection_changed.connect(self._on_connection_changed)
@@ -595,6 +601,18 @@ class MainWindow(QMainWindow):
 			self.lbl_connection.setText("Connection: Waiting for device")
 			self.lbl_connection.setStyleSheet("#statusPill { background: #4d3030; border: 1px solid #764242; }")
 
+	def _on_preset_name_decoded(self, preset_no, name):
+		# fill the list while the names are still coming in, the complete list replaces it at the end
+		if not 0 <= preset_no < PRESET_LIST_COUNT:
+			return
+		if self.preset_list.count() != PRESET_LIST_COUNT:
+			self.preset_list.clear()
+			for idx in range(PRESET_LIST_COUNT):
+				item = QListWidgetItem(f"{idx:03d}: {PRESET_PLACEHOLDER_NAME}")
+				item.setData(Qt.ItemDataRole.UserRole, idx)
+				self.preset_list.addItem(item)
+		self.preset_list.item(preset_no).setText(f"{preset_no:03d}: {name}")
+
 	def _on_preset_names_changed(self, preset_names):
 		normalized_names = list(preset_names[:PRESET_LIST_COUNT])
 		if len(normalized_names) < PRESET_LIST_COUNT:
@@ -9,9 +9,23 @@ import struct
 import binascii
 from utils.formatter import ca_splitter
 from utils.simple_filter import EmptySlotInfo
+from utils.live_preset import LivePreset
+from utils.preset_diff import PresetDiff
+from utils.msgpack_decoder import MsgPackDecodeError
+from utils.preset_parser import HxPreset
 from excel_logger import ExcelLogger
+from session_capture import SessionCapture
+from packet_dispatcher import PacketDispatcher, PacketSignature
+from endpoint_writer import EndpointWriter
+from endpoint_reader import EndpointReader
+from packet_templates import Packet, PacketTemplate
+from periodic_scheduler import PeriodicScheduler
+from request_scheduler import RequestScheduler
+from preset_cache import PresetCache
+from preset_backup import PresetBackup
+from event_bus import EventBus, PresetNameChanged, PresetNamesChanged, PresetNameDecoded, PresetNoChanged, \
+	SlotDataChanged, SnapshotChanged, PresetReceived, PresetChanged, KnobValueChanged, TrailsChanged
 import logging
-import copy
 import getopt
 from modes.connect import Connect
 from modes.reconfigure_x1 import ReconfigureX1
@@ -89,10 +103,67 @@ class HelixUsb:
 		"EmulateFS5": 53
 	}
 
+	# keep-alive responses per channel, resolved to the channel id
+	KEEP_ALIVE_RESPONSES = PacketDispatcher()
+	KEEP_ALIVE_RESPONSES.register([0x8, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x10], length=12, handler=0x1)
+	KEEP_ALIVE_RESPONSES.register([0x8, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x10], length=12, handler=0x2)
+	KEEP_ALIVE_RESPONSES.register([0x8, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x10], length=12, handler=0x80)
+
+	X2X10_KEEP_ALIVE = PacketSignature([0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0], length=16)
+
+	X1X10_KEEP_ALIVE_PACKET = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x72, 0x1e, 0x0, 0x0])
+	X2X10_KEEP_ALIVE_PACKET = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0])
+	X80X10_KEEP_ALIVE_PACKET = PacketTemplate(
+		[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x10, 0x0, 0x0, 0x0, 0x0],
+		fields={'session_no': 12, 'packet_double': (13, 2)})
+
+	SET_MIDI_CC_PACKET = PacketTemplate(
+		[0x21, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0xb0, 0x1c, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x11, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf2, 0x64, 0x44, 0x65, 0x84, 0x18, 0x6, 0x4d, 0x2, 0x1c, 0x2, 0x51, 0x33, 0x0, 0x0, 0x0],
+		fields={'switch': 34, 'cc': 40})
+	SET_MIDI_CHANNEL_PACKET = PacketTemplate(
+		[0x21, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x42, 0x1b, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x11, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf3, 0x64, 0x44, 0x65, 0x84, 0x18, 0x6, 0x4d, 0x1, 0x1c, 0x1, 0x51, 0x1, 0x0, 0x0, 0x0],
+		fields={'switch': 34, 'midi_channel': 40})
+	SET_HOTKEY_FUNCTION_PACKET = PacketTemplate(
+		[0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x87, 0x1b, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf6, 0x64, 0x43, 0x65, 0x82, 0x18, 0x6, 0x4d, 0x2, 0x0, 0x0, 0x0],
+		fields={'switch': 34})
+	SET_CUSTOM_FUNCTION_PACKET = PacketTemplate(
+		[0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x42, 0x27, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x43, 0x64, 0x43, 0x65, 0x82, 0x18, 0x6, 0x4d, 0x0, 0x0, 0x0, 0x0],
+		fields={'switch': 34, 'function_code': 36})
+	# 0xa6 at offset 27 is a legacy counter value
+	SET_COLOR_PACKET = PacketTemplate(
+		[0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x0, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0xa6, 0xf0, 0x64, 0x3d, 0x65, 0x82, 0x66, 0x0, 0x42, 0x0, 0x0, 0x7f, 0x0],
+		fields={'session': (12, 4), 'switch': 34, 'color_id': 36})
+	# the label text follows as payload
+	SET_LABEL_PACKET = PacketTemplate(
+		[0x1e, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x0, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xe, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf0, 0x64, 0x3b, 0x65, 0x82, 0x66, 0x0, 0x6d, 0xa1],
+		fields={'msg_size': 0, 'session': (12, 4), 'second_length': 20, 'switch': 34, 'text_length': 36})
+	HIGHLIGHT_SLOT_PACKET = PacketTemplate(
+		[0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x44, 0x26, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x34, 0x64, 0x4e, 0x65, 0x82, 0x62, 0x1, 0x1a, 0x0, 0x0, 0x0, 0x0],
+		fields={'slot_no': 34})
+	SET_FS_FUNCTION_PACKET = PacketTemplate(
+		[0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0xc6, 0x1e, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x4, 0x64, 0x19, 0x65, 0x82, 0x76, 0x0, 0x77, 0x0, 0x0, 0x0, 0x0],
+		fields={'foot_switch_id': 34, 'function_id': 36})
+	# the preset name follows as payload
+	SET_PRESET_LABEL_PACKET = PacketTemplate(
+		[0x20, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x77, 0x1e, 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, 0x10, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xed, 0x64, 0x6, 0x65, 0x83, 0x6b, 0x0, 0x6c, 0x0, 0x6d, 0xa1],
+		fields={'msg_size': 0, 'second_length': 20, 'prog_no': 36, 'text_length': 38})
+
+	KEEP_ALIVE_PERIOD = 1.04
+	X1X10_KEEP_ALIVE_TASK = 'x1x10 keep-alive'
+	X2X10_KEEP_ALIVE_TASK = 'x2x10 keep-alive'
+	X80X10_KEEP_ALIVE_TASK = 'x80x10 keep-alive'
+
+	# preset name and data are only requested once no further preset switch came in for this long
+	PRESET_SETTLE_TIME = 0.15
+	PRESET_SETTLE_TASK = 'preset settle'
+
 	MIDI_PROGRAM_MIN = 0
 	MIDI_PROGRAM_MAX = 125
 	MIDI_PROGRAM_CHANGE_CHANNEL = 0  # MIDI ch1, zero-based in status byte
 
+	# -b waits this long for the device to connect and send its preset names
+	BACKUP_READY_TIMEOUT = 30.0
+
 	def __init__(self):
 
 		self.preset_no = 0
@@ -114,6 +185,7 @@ class HelixUsb:
 		self.endpoint_0x82_bulk_in = None
 		self.endpoint_0x3_isochronous_out = None
 		self.endpoint_0x83_isochronous_in = None
+		self.endpoint_0x1_writer = EndpointWriter(self.endpoint_0x1_write, name='0x1 writer')
 
 		self.usb_io_exception_cb = self.on_usb_io_exception
 
@@ -126,9 +198,7 @@ class HelixUsb:
 		self.stop_communication = False
 		self.stop_x80x10_communication = False
 
-		self.x80x10_keep_alive_thread = None
-		self.x1x10_keep_alive_thread = None
-		self.x2x10_keep_alive_thread = None
+		self.keep_alive_scheduler = PeriodicScheduler(name='keep-alive scheduler')
 
 		self.x1x10_cnt = 0x2
 		self.x2x10_cnt = 0x2
@@ -144,32 +214,45 @@ class HelixUsb:
 
 		self.session_quadruple = [0xf4, 0x1e, 0x00, 0x00]
 
-		self.active_mode = None
+		# callbacks run on the event bus workers, not on the USB threads
+		self.event_bus = EventBus()
+
+		# requests run on the request scheduler, the active mode gets all packets no request is waiting for
+		self.active_mode = Standard(self, name="standard")
+		self.request_scheduler = RequestScheduler(self.on_requests_idle)
 		self.connected = False
 		self.reconfigured_x1 = False
 		self.got_preset_name = False
 		self.got_preset = False
 		self.got_preset_names = False
 		self.preset_names = []
-		self.preset_names_change_cb_fct_list = list()
 
 		self.preset_name = ''
-		self.preset_name_change_cb_fct_list = list()
-		self.preset_no_change_cb_fct_list = list()
+		self.hx_preset = None
+		# parameters of the current preset, knob changes on the device are applied to it
+		self.live_preset = LivePreset()
+
+		self.device_serial = None
+		self.preset_cache = PresetCache()
+		# set by slot changes on the device, the cached data of the current preset is outdated until the next switch
+		self.current_preset_edited = False
 
 		self.slot_data = []
 		for i in range(0, 16):
 			si = EmptySlotInfo()
 			si.slot_no = i
 			self.slot_data.append(si)
-		self.slot_data_change_cb_fct_list = list()
-		self.snapshot_change_cb_fct_list = list()
 
 		self.excel_logger = None
+		self.session_capture = None
 		self.usb_monitor = None
 		self.shutdown_done = False
 
 		self.preset_change_cnt = 0
+		# 0 requests preset name and data right after every switch
+		self.preset_settle_time = HelixUsb.PRESET_SETTLE_TIME
+		# publish the cached data of a preset right after switching to it, the transfer revalidates it
+		self.serve_cached_presets = True
 
 		# Modes
 		self.request_preset_mode = RequestPreset(self)
@@ -180,6 +263,13 @@ class HelixUsb:
 		else:
 			self.excel_logger = None
 
+	def set_session_capture(self, capture_path):
+		if self.session_capture is not None:
+			self.session_capture.close()
+			self.session_capture = None
+		if capture_path:
+			self.session_capture = SessionCapture(capture_path).open()
+
 	def switch_callback(self, id, val):
 		log.info('switch: ' + str(id) + ', value: ' + str(val))
 		if val == 0:
@@ -201,29 +291,64 @@ class HelixUsb:
 
 	def register_snapshot_change_cb_fct(self, p_cb_fct):
 		if p_cb_fct is not None:
-			self.snapshot_change_cb_fct_list.append(p_cb_fct)
+			self.event_bus.subscribe(SnapshotChanged, p_cb_fct)
 
 	def register_preset_name_change_cb_fct(self, p_cb_fct):
 		if p_cb_fct is not None:
-			self.preset_name_change_cb_fct_list.append(p_cb_fct)
+			self.event_bus.subscribe(PresetNameChanged, p_cb_fct)
 
 	def register_preset_no_change_cb_fct(self, p_cb_fct):
 		if p_cb_fct is not None:
-			self.preset_no_change_cb_fct_list.append(p_cb_fct)
+			self.event_bus.subscribe(PresetNoChanged, p_cb_fct)
 
 	def register_preset_names_change_cb_fct(self, p_cb_fct):
 		if p_cb_fct is not None:
-			self.preset_names_change_cb_fct_list.append(p_cb_fct)
+			self.event_bus.subscribe(PresetNamesChanged, p_cb_fct)
+
+	def register_preset_name_decoded_cb_fct(self, p_cb_fct):
+		# called with (preset_no, name) for every name while the preset names are still being received
+		if p_cb_fct is not None:
+			self.event_bus.subscribe(PresetNameDecoded, p_cb_fct)
 
 	def register_slot_data_change_cb_fct(self, p_cb_fct):
 		if p_cb_fct is not None:
-			self.slot_data_change_cb_fct_list.append(p_cb_fct)
+			self.event_bus.subscribe(SlotDataChanged, p_cb_fct)
+
+	def register_preset_received_cb_fct(self, p_cb_fct):
+		# called with (preset_no, hx_preset) for every parsed preset
+		if p_cb_fct is not None:
+			self.event_bus.subscribe(PresetReceived, p_cb_fct)
+
+	def register_preset_changes_cb_fct(self, p_cb_fct):
+		# called with (preset_no, changes) for each received preset, changes lists what differs from the previous one
+		if p_cb_fct is not None:
+			self.event_bus.subscribe(PresetChanged, p_cb_fct)
+
+	def register_knob_value_change_cb_fct(self, p_cb_fct):
+		# called with (slot_no, parameter_idx, value)
+		if p_cb_fct is not None:
+			self.event_bus.subscribe(KnobValueChanged, p_cb_fct)
+
+	def register_trails_change_cb_fct(self, p_cb_fct):
+		if p_cb_fct is not None:
+			self.event_bus.subscribe(TrailsChanged, p_cb_fct)
 
 	def set_preset_name(self, name):
 		self.got_preset_name = True
 		self.preset_name = name
-		for cb_fct in self.preset_name_change_cb_fct_list:
-			cb_fct(self.preset_name)
+		self.event_bus.publish(PresetNameChanged(self.preset_name))
+
+		# a renamed preset shows up here first
+		preset_no = self.known_preset_no()
+		if preset_no is not None and preset_no < len(self.preset_names) and self.preset_names[preset_no] != name:
+			log.info('Preset ' + str(preset_no) + ' renamed from ' + self.preset_names[preset_no] + ' to ' + name)
+			self.preset_names[preset_no] = name
+			self.preset_cache.set_preset_name(preset_no, name)
+			self.set_decoded_preset_name(preset_no, name)
+			self.event_bus.publish(PresetNamesChanged(list(self.preset_names)))
+
+	def set_decoded_preset_name(self, preset_no, name):
+		self.event_bus.publish(PresetNameDecoded(preset_no, name))
 
 	def set_preset_names(self, preset_names):
 		normalized_names = list(preset_names[:HelixUsb.PRESET_LIST_COUNT])
@@ -236,10 +361,59 @@ class HelixUsb:
 			log.warning('Preset-name list longer than expected (%d > %d); truncating extra entries',
 						len(preset_names), HelixUsb.PRESET_LIST_COUNT)
 
+		self.preset_cache.set_preset_names(normalized_names)
 		self.preset_names = normalized_names
 		self.got_preset_names = True
-		for cb_fct in self.preset_names_change_cb_fct_list:
-			cb_fct(self.preset_names)
+		self.event_bus.publish(PresetNamesChanged(list(self.preset_names)))
+
+	def load_preset_cache(self):
+		# serves the preset names of a known device right away, the names transfer still runs to revalidate them
+		if self.device_serial is None or not self.preset_cache.open(self.device_serial):
+			return
+		preset_names = self.preset_cache.get_preset_names(HelixUsb.PRESET_LIST_COUNT)
+		if preset_names is None:
+			return
+		log.info('Using cached preset names for device ' + str(self.device_serial))
+		self.preset_names = preset_names
+		self.event_bus.publish(PresetNamesChanged(list(self.preset_names)))
+
+	def known_preset_no(self):
+		if 0 <= self.current_preset_no < HelixUsb.PRESET_LIST_COUNT:
+			return self.current_preset_no
+		return None
+
+	def cache_preset_data(self, preset_no, preset_data):
+		if 0 <= preset_no < HelixUsb.PRESET_LIST_COUNT and not self.current_preset_edited:
+			self.preset_cache.set_preset_data(preset_no, preset_data)
+
+	def get_cached_preset_data(self, preset_no):
+		return self.preset_cache.get_preset_data(preset_no)
+
+	def serve_cached_preset(self):
+		# publishes the cached data of the current preset, the preset data transfer still runs and replaces it
+		# (PresetChanged reports what differs). Returns False if the preset isn't cached.
+		preset_no = self.known_preset_no()
+		if not self.serve_cached_presets or preset_no is None or self.current_preset_edited:
+			return False
+		preset_data = self.get_cached_preset_data(preset_no)
+		if preset_data is None:
+			return False
+		preset_name = self.preset_names[preset_no] if preset_no < len(self.preset_names) else ''
+		try:
+			hx_preset = HxPreset(data_in=preset_data, preset_no=preset_no, preset_name=preset_name)
+		except ValueError as e:
+			log.warning('Dropping cached data of preset ' + str(preset_no) + ': ' + str(e))
+			self.preset_cache.invalidate_preset_data(preset_no)
+			return False
+		log.info('Using cached data for preset ' + str(preset_no) + ' until it is received')
+		self.set_hx_preset(preset_no, hx_preset)
+		return True
+
+	def invalidate_cached_preset(self):
+		self.current_preset_edited = True
+		preset_no = self.known_preset_no()
+		if preset_no is not None:
+			self.preset_cache.invalidate_preset_data(preset_no)
 
 	def set_slot_info(self, slot_info_list):
 
@@ -256,14 +430,35 @@ class HelixUsb:
 			if self.slot_data[i] == slot_info_list[i]:
 				pass
 			else:
-				for cb_fct in self.slot_data_change_cb_fct_list:
-					cb_fct(i, slot_info_list[i])
+				self.event_bus.publish(SlotDataChanged(i, slot_info_list[i]))
 		self.slot_data = slot_info_list
 
+	def set_hx_preset(self, preset_no, hx_preset):
+		try:
+			changes = PresetDiff.diff(self.hx_preset, hx_preset)
+		except (KeyError, ValueError, MsgPackDecodeError) as e:
+			log.warning('Cannot compare preset ' + str(preset_no) + ' to the previous one: ' + str(e))
+			changes = None
+		self.hx_preset = hx_preset
+		self.live_preset.seed(preset_no, hx_preset)
+		self.event_bus.publish(PresetReceived(preset_no, hx_preset))
+		if changes is not None:
+			self.event_bus.publish(PresetChanged(preset_no, changes))
+
+	def set_parameter_value(self, slot_no, parameter_idx, value):
+		# the edit is applied in place, the preset data is not fetched again but the cached copy is stale now
+		self.invalidate_cached_preset()
+		if self.live_preset.set_parameter(slot_no, parameter_idx, value) != value:
+			self.event_bus.publish(KnobValueChanged(slot_no, parameter_idx, value))
+
+	def set_trails(self, slot_no, trails_on):
+		self.invalidate_cached_preset()
+		self.live_preset.set_trails(slot_no, trails_on)
+		self.event_bus.publish(TrailsChanged(slot_no, trails_on))
+
 	def set_snapshot(self, current_snapshot):
 		self.current_snapshot = current_snapshot
-		for cb_fct in self.snapshot_change_cb_fct_list:
-			cb_fct(self.current_snapshot)
+		self.event_bus.publish(SnapshotChanged(self.current_snapshot))
 
 	def increase_session_quadruple_x11(self):
 		self.session_quadruple[0] += 0x11
@@ -278,23 +473,17 @@ class HelixUsb:
 					self.session_quadruple[3] += 0x1
 
 	def check_keep_alive_response(self, data):
-		x1_pattern = [0x8, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x10]
-		x2_pattern = [0x8, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x10]
-		x80_pattern = [0x8, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x10]
+		channel = HelixUsb.KEEP_ALIVE_RESPONSES.resolve(data)
+		if channel is None:
+			return False
 
-		if self.my_byte_cmp(left=data, right=x1_pattern, length=12):
+		if channel == 0x1:
 			self.expecting_x1_x10_response = False
-			return True
-
-		if self.my_byte_cmp(left=data, right=x2_pattern, length=12):
+		elif channel == 0x2:
 			self.expecting_x2_x10_response = False
-			return True
-
-		if self.my_byte_cmp(left=data, right=x80_pattern, length=12):
+		elif channel == 0x80:
 			self.expecting_x80_x10_response = False
-			return True
-
-		return False
+		return True
 
 	def config(self, usb_device):
 		self.usb_device = usb_device
@@ -304,6 +493,9 @@ class HelixUsb:
 			return 1
 		# self.usb_device.set_configuration()
 
+		if getattr(self.usb_device, 'is_virtual', False):
+			return self.config_virtual()
+
 		self.active_configuration = self.usb_device.get_active_configuration()
 		self.interface = self.active_configuration[(0, 0)]
 
@@ -348,12 +540,38 @@ class HelixUsb:
 		except usb.core.USBError as e:
 			log.error('While trying to claim interface')
 
-		self.x81_reader = threading.Thread(target=self.endpoint_listener, args=('0x81', self.endpoint_0x81_bulk_in))
+		if self.x81_reader is not None:
+			self.x81_reader.stop()
+		self.x81_reader = EndpointReader(
+			self.endpoint_0x81_read, self.endpoint_0x81_dispatch, self.endpoint_0x81_bulk_in.wMaxPacketSize,
+			error_fct=self.on_endpoint_0x81_read_error, name='0x81 reader')
 
 		return 0
 
+	def config_virtual(self):
+		# VirtualHelix in place of the pyusb device, its endpoints offer the same read/write calls
+		self.endpoint_0x1_bulk_out = self.usb_device.endpoint_0x1
+		self.endpoint_0x81_bulk_in = self.usb_device.endpoint_0x81
+		self.endpoint_0x2_bulk_out = self.usb_device.endpoint_0x2
+
+		if self.x81_reader is not None:
+			self.x81_reader.stop()
+		self.x81_reader = EndpointReader(
+			self.endpoint_0x81_read, self.endpoint_0x81_dispatch, self.endpoint_0x81_bulk_in.wMaxPacketSize,
+			error_fct=self.on_endpoint_0x81_read_error, name='0x81 reader')
+		return 0
+
 	def begin(self):
 		self.stop_threads = False
+		if getattr(self.usb_device, 'is_virtual', False):
+			self.device_serial = self.usb_device.serial
+			self.load_preset_cache()
+			self.midi_interface_claimed = True
+			self.endpoint_0x1_writer.start()
+			self.keep_alive_scheduler.start()
+			self.x81_reader.start()
+			return
+
 		for request_string_id in [self.GET_STRING_VENDOR, self.GET_STRING_PRODUCT, self.GET_STRING_SERIAL,
 								  self.GET_STRING_APP, self.GET_STRING_VERSION, self.GET_STRING_CPU_ID,
 								  self.GET_STRING_MAC_ADDR, self.GET_STRING_VMGR, self.GET_STRING_VDEF,
@@ -361,10 +579,14 @@ class HelixUsb:
 			try:
 				tst = usb.util.get_string(self.usb_device, request_string_id, langid=0x0409)
 				log.info(tst)
+				if request_string_id == self.GET_STRING_SERIAL:
+					self.device_serial = tst
 			except usb.core.USBError as e:
 				log.warning("Caught exception while trying to get string (" + str(request_string_id) + "): " + str(e))
 				pass
 
+		self.load_preset_cache()
+
 		# very important for usb.control.clear_feature to work
 		try:
 			usb.util.claim_interface(self.usb_device, self.interface)
@@ -415,6 +637,8 @@ class HelixUsb:
 		usb.control.clear_feature(
 			dev=self.usb_device, feature=usb.control.ENDPOINT_HALT, recipient=self.endpoint_0x81_bulk_in)
 
+		self.endpoint_0x1_writer.start()
+		self.keep_alive_scheduler.start()
 		self.x81_reader.start()
 
 	def on_usb_io_exception(self, exc):
@@ -458,38 +682,14 @@ class HelixUsb:
 		# log.info("x80x10: " + str(next_no))
 		return next_no
 
-	def x80x10_keep_alive_thread_fct(self, start_delay):
-		log.info("Starting x80x10_keep_alive_thread, delay is: " + str(start_delay))
-		time.sleep(start_delay)
-
-		t = threading.currentThread()
+	def send_x80x10_keep_alive(self):
+		if self.expecting_x80_x10_response:
+			log.error('No x80x10 response!')
 
-		if start_delay < 1.04:
-			preset_data_packet_double = self.preset_data_packet_double()
-			self.endpoint_0x1_out(
-				[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x10, self.maybe_session_no, preset_data_packet_double[0], preset_data_packet_double[1], 0x0],
-				silent=True
-			)
-			self.expecting_x80_x10_response = True
-			self.last_x80_x10_keep_alive_out = time.time()
-
-		while getattr(t, "do_run", True):
-
-			while self.last_x80_x10_keep_alive_out + 1.04 > time.time():
-				time.sleep(0.05)
-				# log.info('Delayed x80_x10_ timer')
-			# if self.awaiting_preset_name_data is False and self.awaiting_preset_data is False:
-			if self.expecting_x80_x10_response:
-				log.error('No x80x10 response!')
-
-			preset_data_packet_double = self.preset_data_packet_double()
-			self.endpoint_0x1_out(
-				[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x10, self.maybe_session_no, preset_data_packet_double[0], preset_data_packet_double[1], 0x0],
-				silent=True
-			)
-			self.expecting_x80_x10_response = True
-			time.sleep(1.04)
-		log.info("Finished x80x10_keep_alive_thread")
+		packet = HelixUsb.X80X10_KEEP_ALIVE_PACKET.render(
+			session_no=self.maybe_session_no, packet_double=self.preset_data_packet_double())
+		self.endpoint_0x1_out(packet, silent=True)
+		self.expecting_x80_x10_response = True
 
 	def next_x1x10_packet_no(self):
 		next_no = self.x1x10_cnt
@@ -499,18 +699,12 @@ class HelixUsb:
 		# self.x1x10_cnt %= 0xFF
 		return next_no
 
-	def x1x10_keep_alive_thread_fct(self, start_delay):
-		log.info("Starting x1x10_keep_alive_thread, delay is: " + str(start_delay))
-		time.sleep(start_delay)
-		while self.stop_communication is False:
-			if self.expecting_x1_x10_response:
-				log.error('No x1x10 response!')
+	def send_x1x10_keep_alive(self):
+		if self.expecting_x1_x10_response:
+			log.error('No x1x10 response!')
 
-			self.endpoint_0x1_out(
-				[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x72, 0x1e, 0x0, 0x0],
-				silent=True)
-			self.expecting_x1_x10_response = True
-			time.sleep(1.04)
+		self.endpoint_0x1_out(HelixUsb.X1X10_KEEP_ALIVE_PACKET.render(), silent=True)
+		self.expecting_x1_x10_response = True
 
 	def next_x2x10_packet_no(self):
 		next_no = self.x2x10_cnt
@@ -520,130 +714,126 @@ class HelixUsb:
 		# self.x2x10_cnt %= 0xFF
 		return next_no
 
-	def x2x10_keep_alive_thread_fct(self, start_delay):
-		log.info("Starting x2x10_keep_alive_thread, delay is: " + str(start_delay))
-		time.sleep(start_delay)
-
-		t = threading.currentThread()
-
-		if start_delay < 1.04:
-			self.endpoint_0x1_out(
-				[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0],
-				silent=True)
-			self.expecting_x2_x10_response = True
-			self.last_x2_x10_keep_alive_out = time.time()
+	def send_x2x10_keep_alive(self):
+		if self.expecting_x2_x10_response:
+			log.error('No x2x10 response!')
 
-		while getattr(t, "do_run", True):
-
-			while self.last_x2_x10_keep_alive_out + 1.04 > time.time():
-				time.sleep(0.05)
-
-			if self.expecting_x2_x10_response:
-				log.error('No x2x10 response!')
-
-			self.endpoint_0x1_out(
-				[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0],
-				silent=True)
-			self.expecting_x2_x10_response = True
-			time.sleep(1.04)
-		log.info("Finished x2x10_keep_alive_thread")
+		self.endpoint_0x1_out(HelixUsb.X2X10_KEEP_ALIVE_PACKET.render(), silent=True)
+		self.expecting_x2_x10_response = True
 
 	def start_x1x10_keep_alive_thread(self, delay=0.0):
-		self.x1x10_keep_alive_thread = threading.Thread(target=self.x1x10_keep_alive_thread_fct, args=(delay,))
-		self.x1x10_keep_alive_thread.start()
+		# x1x10 keep-alives are sent every period, no matter what else is sent on x1
+		log.info("Starting x1x10 keep-alive, delay is: " + str(delay))
+		self.keep_alive_scheduler.schedule(
+			HelixUsb.X1X10_KEEP_ALIVE_TASK, self.send_x1x10_keep_alive, HelixUsb.KEEP_ALIVE_PERIOD, delay)
 
 	def start_x2x10_keep_alive_thread(self, delay=0.0):
-		self.x2x10_keep_alive_thread = threading.Thread(target=self.x2x10_keep_alive_thread_fct, args=(delay,))
-		self.x2x10_keep_alive_thread.start()
+		log.info("Starting x2x10 keep-alive, delay is: " + str(delay))
+		self.keep_alive_scheduler.schedule(
+			HelixUsb.X2X10_KEEP_ALIVE_TASK, self.send_x2x10_keep_alive, HelixUsb.KEEP_ALIVE_PERIOD, delay)
 
 	def start_x80x10_keep_alive_thread(self, delay=1.0):
-		if self.x80x10_keep_alive_thread is not None:
+		if self.keep_alive_scheduler.is_scheduled(HelixUsb.X80X10_KEEP_ALIVE_TASK):
 			return
+		log.info("Starting x80x10 keep-alive, delay is: " + str(delay))
 		self.stop_x80x10_communication = False
-		self.x80x10_keep_alive_thread = threading.Thread(target=self.x80x10_keep_alive_thread_fct, args=(delay,))
-		self.x80x10_keep_alive_thread.start()
+		self.keep_alive_scheduler.schedule(
+			HelixUsb.X80X10_KEEP_ALIVE_TASK, self.send_x80x10_keep_alive, HelixUsb.KEEP_ALIVE_PERIOD, delay)
 
 	def start_keep_alive_messages(self, delay_x80x10=0.3, delay_x1x10=0.3, delayx2_x10=0.7):
 
-		if self.x80x10_keep_alive_thread is not None:
+		if self.keep_alive_scheduler.is_scheduled(HelixUsb.X80X10_KEEP_ALIVE_TASK):
 			return
 
 		self.stop_communication = False
 		self.stop_x80x10_communication = False
 
-		self.x80x10_keep_alive_thread = threading.Thread(target=self.x80x10_keep_alive_thread_fct, args=(delay_x80x10,))
-		self.x1x10_keep_alive_thread = threading.Thread(target=self.x1x10_keep_alive_thread_fct, args=(delay_x1x10,))
-		self.x2x10_keep_alive_thread = threading.Thread(target=self.x2x10_keep_alive_thread_fct, args=(delayx2_x10,))
-
-		self.x80x10_keep_alive_thread.start()
-		self.x1x10_keep_alive_thread.start()
-		self.x2x10_keep_alive_thread.start()
+		self.start_x80x10_keep_alive_thread(delay_x80x10)
+		self.start_x1x10_keep_alive_thread(delay_x1x10)
+		self.start_x2x10_keep_alive_thread(delayx2_x10)
 
 	def switch_mode(self, mode_name="Standard"):
-		if self.active_mode is not None:
-			self.active_mode.shutdown()
-
+		# "Standard" continues the connection sequence, any other mode name queues that request
 		if mode_name == "Standard":
-			'''
-			self.connected = False
-			self.reconfigured_x1 = False
-			self.got_preset_name = False
-			self.got_preset = False
-			self.got_preset_names = False
-			'''
-			if self.connected is False:
-				self.active_mode = Connect(self)
-				self.active_mode.start()
-			elif self.connected is True and self.reconfigured_x1 is False:
-				self.active_mode = ReconfigureX1(self)
-				self.active_mode.start()
-			elif self.reconfigured_x1 is True and self.got_preset_name is False:
-				self.active_mode = RequestPresetName(self)
-				self.active_mode.start()
-			elif self.got_preset_name is True and self.got_preset is False:
-				self.active_mode = self.request_preset_mode
-				self.active_mode.start()
-			elif self.got_preset is True and self.got_preset_names is False:
-				self.active_mode = RequestPresetNames(self)
-				self.active_mode.start()
-			else:
-				self.active_mode = Standard(self, name="standard")
-				self.active_mode.start()
-		elif mode_name == "Connect":
-			self.active_mode = Connect(self)
-			self.active_mode.start()
+			self.request_missing_data()
+			return
+
+		mode = self.create_mode(mode_name)
+		if mode is None:
+			log.error('Unknown mode: ' + mode_name)
+			return
+		self.request_scheduler.request(mode)
+
+	def create_mode(self, mode_name):
+		if mode_name == "Connect":
+			return Connect(self)
 		elif mode_name == "ReconfigureX1":
-			self.active_mode = ReconfigureX1(self)
-			self.active_mode.start()
+			return ReconfigureX1(self)
 		elif mode_name == "RequestPreset":
-			self.active_mode = RequestPreset(self)
-			self.active_mode.start()
+			return self.request_preset_mode
 		elif mode_name == "RequestPresetNames":
-			self.active_mode = RequestPresetNames(self)
-			self.active_mode.start()
+			return RequestPresetNames(self)
 		elif mode_name == "RequestPresetName":
-			self.active_mode = RequestPresetName(self)
-			self.active_mode.start()
-		elif mode_name == "Standard":
-			self.active_mode = Standard(self, name="standard")
-			self.active_mode.start()
+			return RequestPresetName(self)
+		return None
+
+	def request_missing_data(self):
+		# requests everything the connection sequence still lacks, the x1 and x80 requests run side by side.
+		# Called by the settle task and the dispatch thread, the flags are checked under the scheduler lock so only
+		# one of them queues a fetch.
+		with self.request_scheduler.lock:
+			if self.connected is False:
+				self.switch_mode("Connect")
+			elif self.reconfigured_x1 is False:
+				self.switch_mode("ReconfigureX1")
+			else:
+				if not self.keep_alive_scheduler.is_scheduled(HelixUsb.PRESET_SETTLE_TASK):
+					if self.got_preset_name is False:
+						self.switch_mode("RequestPresetName")
+					if self.got_preset is False:
+						self.switch_mode("RequestPreset")
+				if self.got_preset_names is False:
+					self.switch_mode("RequestPresetNames")
+
+	def preset_switched(self):
+		# fetches for the previous preset are useless now, fetching the new one waits until switching has settled
+		self.got_preset_name = False
+		self.got_preset = False
+		self.live_preset.clear()
+		self.request_scheduler.cancel((RequestPresetName, RequestPreset))
+		self.serve_cached_preset()
+
+		scheduler = self.keep_alive_scheduler
+		if self.preset_settle_time <= 0 or not scheduler.is_running():
+			self.switch_mode()
+		elif scheduler.is_scheduled(HelixUsb.PRESET_SETTLE_TASK):
+			scheduler.touch(HelixUsb.PRESET_SETTLE_TASK)
 		else:
-			log.error('Unknown mode: ' + mode_name)
+			scheduler.schedule(HelixUsb.PRESET_SETTLE_TASK, self.on_preset_settled,
+							   period=self.preset_settle_time, delay=self.preset_settle_time)
 
-	def endpoint_listener(self, description, endpoint):
+	def on_preset_settled(self):
+		self.keep_alive_scheduler.cancel(HelixUsb.PRESET_SETTLE_TASK)
+		log.info('Preset switch settled at preset ' + str(self.current_preset_no))
+		self.switch_mode()
 
-		log.info('Started ' + description + ' thread')
-		while self.stop_threads is False:
-			try:
-				data = endpoint.read(size_or_buffer=endpoint.wMaxPacketSize, timeout=0)
-				self.data_in(description, data)
-			except ValueError as _:
-				pass
-			except usb.core.USBError as e:
-				if self.usb_io_exception_cb is not None:
-					self.usb_io_exception_cb(str(e))
-		log.info('Stopped thread reading endpoint data!')
-		# self.x81_reader = threading.Thread(target=self.endpoint_listener, args=())
+	def mode_finished(self, mode):
+		self.request_scheduler.finished(mode)
+
+	def on_requests_idle(self):
+		# a request may have failed or the data may have been invalidated while it was running
+		self.request_missing_data()
+
+	def endpoint_0x81_read(self, buffer):
+		return self.endpoint_0x81_bulk_in.read(size_or_buffer=buffer, timeout=0)
+
+	def endpoint_0x81_dispatch(self, data):
+		if self.stop_threads is False:
+			self.data_in('0x81', data)
+
+	def on_endpoint_0x81_read_error(self, e):
+		if isinstance(e, usb.core.USBError) and self.usb_io_exception_cb is not None:
+			self.usb_io_exception_cb(str(e))
 
 	@staticmethod
 	def my_byte_cmp(left, right, length=-1):
@@ -692,15 +882,31 @@ class HelixUsb:
 		log.info(hex_str)
 
 	def out_packet_to_endpoint_0x1(self, out_packet, silent=False):
-		data_to_send = copy.deepcopy(out_packet.data)
-		if out_packet.delay == 0.0:
-			self.endpoint_0x1_out(data_to_send, silent)
+		# packets rendered from a PacketTemplate are fresh copies and are sent as they are
+		packet = out_packet.data
+		if not isinstance(packet, Packet):
+			packet = Packet.from_list(packet)
+
+		if self.endpoint_0x1_writer.is_running():
+			self.endpoint_0x1_writer.submit(packet, out_packet.delay, silent)
+		elif out_packet.delay == 0.0:
+			self.endpoint_0x1_write(packet, silent)
 		else:
-			threading.Timer(out_packet.delay, self.endpoint_0x1_out, [data_to_send]).start()
+			threading.Timer(out_packet.delay, self.endpoint_0x1_write, [packet]).start()
 
 	def endpoint_0x1_out(self, data, silent=False):
+		if not isinstance(data, Packet):
+			data = Packet.from_list(data)
 
-		if data[9] == "XX":
+		# all packets go through the writer thread, so sequence numbers are assigned in the order packets are sent
+		if self.endpoint_0x1_writer.is_running() and not self.endpoint_0x1_writer.is_writer_thread():
+			self.endpoint_0x1_writer.submit(data, 0.0, silent)
+		else:
+			self.endpoint_0x1_write(data, silent)
+
+	def endpoint_0x1_write(self, data, silent=False):
+
+		if data.sequenced:
 			if data[4] == 0x1:
 				data[9] = self.next_x1x10_packet_no()
 			elif data[4] == 0x2:
@@ -710,6 +916,8 @@ class HelixUsb:
 		if not silent:
 			self.log_data_out(data)
 			# hex_str = ''.join('{:02x} '.format(x) for x in out_data)
+		if self.session_capture:
+			self.session_capture.record(SessionCapture.OUT, 0x1, data)
 		if self.excel_logger:
 			self.excel_logger.log(data)
 		if data[4] == 0x1:
@@ -717,19 +925,26 @@ class HelixUsb:
 		elif data[4] == 0x2:
 			# Only keep-alive packets should drive the x2 keep-alive watchdog timer.
 			# Other x2 traffic (e.g. preset-step commands) must not shift this clock.
-			if self.my_byte_cmp(left=data, right=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0], length=16):
+			if HelixUsb.X2X10_KEEP_ALIVE.matches(data):
 				self.last_x2_x10_keep_alive_out = time.time()
+				self.keep_alive_scheduler.touch(HelixUsb.X2X10_KEEP_ALIVE_TASK)
 		elif data[4] == 0x80:
 			self.last_x80_x10_keep_alive_out = time.time()
+			self.keep_alive_scheduler.touch(HelixUsb.X80X10_KEEP_ALIVE_TASK)
 
 		self.endpoint_0x1_bulk_out.write(data)
 
 	def data_in(self, endpoint_id, data):
 		if endpoint_id == '0x81':
+			if self.session_capture:
+				self.session_capture.record(SessionCapture.IN, 0x81, data)
 			if self.excel_logger:
 				self.excel_logger.log(data)
 			try:
-				print_to_console = self.active_mode.data_in(data)
+				mode = self.request_scheduler.mode_for_channel(data[6])
+				if mode is None:
+					mode = self.active_mode
+				print_to_console = mode.data_in(data)
 				# if print_to_console:
 				# 	self.log_data_in(data)
 
@@ -767,15 +982,12 @@ class HelixUsb:
 		if switch_no not in [0, 1, 2]:
 			log.error("switch_no must be either 0, 1 or 2")
 			return
-		      # 0x21, 0x0, 0x0, 0x18, 0x03, 0x10, 0xed, 0x3, 0x0, 0x4a, 0x0, 0x4, 0xb0, 0x1c, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x11, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf2, 0x64, 0x44, 0x65, 0x84, 0x18, 0x6            , 0x4d, 0x2, 0x1c, 0x2, 0x51, 0x33, 0x00, 0x00, 0x00   0x51 = i[39]
-		data = [0x21, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x42, 0x1b, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x11, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf3, 0x64, 0x44, 0x65, 0x84, 0x18, 0x6 + switch_no, 0x4d, 0x1, 0x1c, 0x2, 0x51, 0x2, 0x0, 0x0, 0x0]
-		data = [0x21, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0xb0, 0x1c, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x11, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf2, 0x64, 0x44, 0x65, 0x84, 0x18, 0x6 + switch_no, 0x4d, 0x2, 0x1c, 0x2, 0x51, 0x33, 0x0, 0x0, 0x0]
 
 		try:
-			data[40] = int(cc)
-			self.endpoint_0x1_out(data)
+			packet = HelixUsb.SET_MIDI_CC_PACKET.render(switch=0x6 + switch_no, cc=int(cc))
+			self.endpoint_0x1_out(packet)
 		except ValueError:
-			log.error('Given midi channel is no integer: ' + str(midi_channel))
+			log.error('Given midi cc is no integer: ' + str(cc))
 			return
 
 	def set_midi_channel(self, switch_no, midi_channel):
@@ -783,11 +995,9 @@ class HelixUsb:
 			log.error("switch_no must be either 0, 1 or 2")
 			return
 
-		data = [0x21, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x42, 0x1b, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x11, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf3, 0x64, 0x44, 0x65, 0x84, 0x18, 0x6 + switch_no, 0x4d, 0x1, 0x1c, 0x1, 0x51, 0x1, 0x0, 0x0, 0x0]
-
 		try:
-			data[40] = int(midi_channel)
-			self.endpoint_0x1_out(data)
+			packet = HelixUsb.SET_MIDI_CHANNEL_PACKET.render(switch=0x6 + switch_no, midi_channel=int(midi_channel))
+			self.endpoint_0x1_out(packet)
 		except ValueError:
 			log.error('Given midi channel is no integer: ' + str(midi_channel))
 			return
@@ -800,11 +1010,10 @@ class HelixUsb:
 			function_code = int(function_code)
 			if function_code == 5:
 				# Hotkey
-				data = [0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x87, 0x1b, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf6, 0x64, 0x43, 0x65, 0x82, 0x18, 0x6 + switch_no, 0x4d, 0x2, 0x0, 0x0, 0x0]
+				packet = HelixUsb.SET_HOTKEY_FUNCTION_PACKET.render(switch=0x6 + switch_no)
 			else:
-				data = [0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x42, 0x27, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x43, 0x64, 0x43, 0x65, 0x82, 0x18, 0x6 + switch_no, 0x4d, 0x0, 0x0, 0x0, 0x0]
-				data[36] = function_code
-			self.endpoint_0x1_out(data)
+				packet = HelixUsb.SET_CUSTOM_FUNCTION_PACKET.render(switch=0x6 + switch_no, function_code=function_code)
+			self.endpoint_0x1_out(packet)
 		except ValueError:
 			log.error('Given function_codeis no integer: ' + str(function_code))
 			return
@@ -814,10 +1023,8 @@ class HelixUsb:
 			log.error("switch_no must be either 0, 1 or 2")
 			return
 
-		alt_cnt = 0xa6  # it's a legacy variable
-
-		data = [0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, self.session_quadruple[0], self.session_quadruple[1], self.session_quadruple[2], self.session_quadruple[3], 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, alt_cnt, 0xf0, 0x64, 0x3d, 0x65, 0x82, 0x66, switch_no, 0x42, color_id, 0x0, 0x7f, 0x0]
-		self.endpoint_0x1_out(data)
+		packet = HelixUsb.SET_COLOR_PACKET.render(session=self.session_quadruple, switch=switch_no, color_id=color_id)
+		self.endpoint_0x1_out(packet)
 
 	def set_label(self, switch_no, text):
 		if switch_no not in [0, 1, 2]:
@@ -828,21 +1035,18 @@ class HelixUsb:
 		length_byte = 0xa1 + len(text)
 		second_length_byte = msg_size_byte - 0x10
 
-		data = [msg_size_byte, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, self.session_quadruple[0], self.session_quadruple[1], self.session_quadruple[2], self.session_quadruple[3], 0x1, 0x0, 0x6, 0x0, second_length_byte, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xf0, 0x64, 0x3b, 0x65, 0x82, 0x66, switch_no, 0x6d, length_byte]
-		for character in text:
-			data.append(ord(character))
-
-		while len(data) < msg_size_byte + 9 + 2:
-			data.append(0x0)
+		payload = bytearray(ord(character) for character in text)
+		payload += bytes(msg_size_byte + 9 + 2 - len(HelixUsb.SET_LABEL_PACKET) - len(payload))
 
-		self.endpoint_0x1_out(data)
+		packet = HelixUsb.SET_LABEL_PACKET.render(
+			payload, msg_size=msg_size_byte, session=self.session_quadruple, second_length=second_length_byte,
+			switch=switch_no, text_length=length_byte)
+		self.endpoint_0x1_out(packet)
 
 	def highlight_slot(self, slot_no):
-		data = [0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x44, 0x26, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x34, 0x64, 0x4e, 0x65, 0x82, 0x62, 0x1, 0x1a, 0x0, 0x0, 0x0, 0x0]
-
 		try:
-			data[34] = int(slot_no)
-			self.endpoint_0x1_out(data)
+			packet = HelixUsb.HIGHLIGHT_SLOT_PACKET.render(slot_no=int(slot_no))
+			self.endpoint_0x1_out(packet)
 		except ValueError:
 			log.error('Given function_code is no integer: ' + str(slot_no))
 			return
@@ -862,26 +1066,27 @@ class HelixUsb:
 			return
 
 		log.info(foot_switch_name + ": setting foot switch function to: " + function_name)
-		data = [0x1d, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0xc6, 0x1e, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x4, 0x64, 0x19, 0x65, 0x82, 0x76, foot_switch_id, 0x77, foot_switch_function_id, 0x0, 0x0, 0x0]
-		self.endpoint_0x1_out(data)
+		packet = HelixUsb.SET_FS_FUNCTION_PACKET.render(foot_switch_id=foot_switch_id, function_id=foot_switch_function_id)
+		self.endpoint_0x1_out(packet)
 
 	def set_preset_label_be_careful(self, prog_no, text):
 		msg_size_byte = 0x20 + len(text)
 		length_byte = 0xa1 + len(text)
 		second_length_byte = msg_size_byte - 0x10
-		data = [msg_size_byte, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x77, 0x1e, 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, second_length_byte, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xed, 0x64, 0x6, 0x65, 0x83, 0x6b, 0x0, 0x6c, prog_no, 0x6d, length_byte]
-
-		for character in text:
-			data.append(ord(character))
 
-		while len(data) < msg_size_byte + 9 + 2:
-			data.append(0x0)
+		payload = bytearray(ord(character) for character in text)
+		payload += bytes(msg_size_byte + 9 + 2 - len(HelixUsb.SET_PRESET_LABEL_PACKET) - len(payload))
 
-		self.endpoint_0x1_out(data)
+		packet = HelixUsb.SET_PRESET_LABEL_PACKET.render(
+			payload, msg_size=msg_size_byte, second_length=second_length_byte, prog_no=prog_no, text_length=length_byte)
+		self.endpoint_0x1_out(packet)
 
 	def on_preset_name_update(self, preset_name):
 		log.info("*************************** Preset Name: " + preset_name)
 
+	def on_preset_name_decoded(self, preset_no, name):
+		log.debug('Preset name ' + str(preset_no) + ': ' + name)
+
 	def on_slot_update(self, slot_no, slot_info):
 		log.info('Slot ' + str(slot_no) + ' change: ' + slot_info.to_string())
 
@@ -890,8 +1095,9 @@ class HelixUsb:
 
 	def set_preset(self, preset_no):
 		self.current_preset_no = preset_no
-		for cb_fct in self.preset_no_change_cb_fct_list:
-			cb_fct(self.current_preset_no)
+		# unsaved edits are discarded by a preset switch
+		self.current_preset_edited = False
+		self.event_bus.publish(PresetNoChanged(self.current_preset_no))
 
 	def _get_effective_current_preset_no(self):
 		if HelixUsb.MIDI_PROGRAM_MIN <= self.current_preset_no <= HelixUsb.MIDI_PROGRAM_MAX:
@@ -929,6 +1135,8 @@ class HelixUsb:
 		status = 0xC0 | (HelixUsb.MIDI_PROGRAM_CHANGE_CHANNEL & 0x0F)
 		midi_event_packet = [0x0C, status, program_no, 0x00]
 
+		if self.session_capture:
+			self.session_capture.record(SessionCapture.OUT, 0x2, bytes(midi_event_packet))
 		try:
 			self.endpoint_0x2_bulk_out.write(midi_event_packet)
 		except usb.core.USBError as e:
@@ -961,6 +1169,23 @@ class HelixUsb:
 			return
 		self.send_midi_program_change(target)
 
+	def backup_presets(self, path, first=None, last=None):
+		# downloads presets first..last (default: all) into the zip archive at path, blocks until done
+		backup = PresetBackup(self, path, first=first, last=last)
+		try:
+			return backup.run()
+		except KeyboardInterrupt:
+			backup.stop()
+			raise
+
+	def wait_ready(self, timeout):
+		deadline = time.time() + timeout
+		while not (self.connected and self.reconfigured_x1 and self.got_preset_names):
+			if time.time() >= deadline:
+				return False
+			time.sleep(0.1)
+		return True
+
 	def signal_handler(self, sig, frame):
 		raise KeyboardInterrupt
 
@@ -980,10 +1205,8 @@ class HelixUsb:
 		self.stop_communication = True
 		self.stop_x80x10_communication = True
 
-		if self.x80x10_keep_alive_thread is not None:
-			self.x80x10_keep_alive_thread.do_run = False
-		if self.x2x10_keep_alive_thread is not None:
-			self.x2x10_keep_alive_thread.do_run = False
+		self.keep_alive_scheduler.stop()
+		self.request_scheduler.stop()
 
 		if self.active_mode is not None:
 			try:
@@ -991,14 +1214,30 @@ class HelixUsb:
 			except Exception as e:
 				log.warning('Failed to shutdown active mode: ' + str(e))
 
-		for thread in [self.x81_reader, self.x1x10_keep_alive_thread, self.x2x10_keep_alive_thread, self.x80x10_keep_alive_thread]:
-			if thread is not None and thread.is_alive():
-				thread.join(timeout=1.0)
+		if getattr(self.usb_device, 'is_virtual', False):
+			# ends the blocking read of the reader thread
+			self.usb_device.close()
+
+		if self.x81_reader is not None:
+			self.x81_reader.stop()
+			stats = self.x81_reader.stats()
+			log.info('0x81 reader: read %d packet(s), max backlog %d, %d stall(s), max dispatch time %.2f ms',
+				stats['read'], stats['max_backlog'], stats['stalls'], stats['max_dispatch_time'] * 1000.0)
+
+		stats = self.endpoint_0x1_writer.stats()
+		log.info('0x1 writer: sent %d packet(s), max queue depth %d, avg latency %.2f ms, max latency %.2f ms',
+			stats['sent'], stats['max_queue_depth'], stats['avg_latency'] * 1000.0, stats['max_latency'] * 1000.0)
+		self.endpoint_0x1_writer.stop()
 
 		if self.excel_logger:
 			self.excel_logger.save()
+		if self.session_capture:
+			self.session_capture.close()
 
-		if self.usb_device is not None:
+		self.preset_cache.close()
+		self.event_bus.shutdown()
+
+		if self.usb_device is not None and not getattr(self.usb_device, 'is_virtual', False):
 			if self.interface_4 is not None and self.midi_interface_claimed:
 				try:
 					usb.util.release_interface(self.usb_device, self.interface_4)
@@ -1037,6 +1276,10 @@ def print_usage(p_b_exit=True):
 	print("Options:")
 	print('\t-h\t\tShow this help text and exit')
 	print('\t-x <file.xlsx>\tDump session traffic to an Excel file (logged while running)')
+	print('\t-c <file.hxcap>\tCapture session traffic to a compact binary file (see utils/capture_convert.py)')
+	print('\t-s <seconds>\tWait this long after the last preset switch before fetching the preset (default: ' +
+		  str(HelixUsb.PRESET_SETTLE_TIME) + ', 0 fetches after every switch)')
+	print('\t-b <file.zip>\tBackup all presets to a zip archive once the device is ready, then exit')
 	print()
 	print("Interactive commands (at the 'command:' prompt):")
 	print('\t0\tRequest current preset name')
@@ -1045,6 +1288,7 @@ def print_usage(p_b_exit=True):
 	print('\tpu\tPreset up: send MIDI Program Change to current+1 (clamped 0..125)')
 	print('\tpd\tPreset down: send MIDI Program Change to current-1 (clamped 0..125)')
 	print('\tp <n>\tDirect preset select via MIDI Program Change, where n is 0..125')
+	print('\tbackup <file.zip>\tDownload all presets into a zip archive')
 	print('\tsave\tFlush Excel log data to disk (only relevant with -x)')
 	print('\tq | quit | exit\tStop loop and perform clean shutdown')
 	print()
@@ -1073,13 +1317,25 @@ def main(argv):
 		datefmt="%Y-%m-%d %H:%M:%S")
 
 	excel_log_path = None
+	capture_path = None
+	backup_path = None
+	preset_settle_time = HelixUsb.PRESET_SETTLE_TIME
 	try:
-		opts, args = getopt.getopt(argv[1:], 'x:h', [])
+		opts, args = getopt.getopt(argv[1:], 'x:c:s:b:h', [])
 		for opt, arg in opts:
 			if opt in '-h':
 				print_usage()
 			elif opt in '-x':
 				excel_log_path = arg
+			elif opt in '-c':
+				capture_path = arg
+			elif opt in '-s':
+				try:
+					preset_settle_time = float(arg)
+				except ValueError:
+					print_usage()
+			elif opt in '-b':
+				backup_path = arg
 			else:
 				print_usage()
 	except getopt.GetoptError as e:
@@ -1088,7 +1344,10 @@ def main(argv):
 
 	helix_usb = HelixUsb()
 	helix_usb.set_excel_logger(excel_log_path)
+	helix_usb.set_session_capture(capture_path)
+	helix_usb.preset_settle_time = preset_settle_time
 	helix_usb.register_preset_name_change_cb_fct(helix_usb.on_preset_name_update)
+	helix_usb.register_preset_name_decoded_cb_fct(helix_usb.on_preset_name_decoded)
 	helix_usb.register_slot_data_change_cb_fct(helix_usb.on_slot_update)
 	helix_usb.register_snapshot_change_cb_fct(helix_usb.on_snapshot_change)
 	helix_usb.register_preset_no_change_cb_fct(helix_usb.on_preset_change)
@@ -1103,6 +1362,17 @@ def main(argv):
 	usb_monitor.start()
 	helix_usb.usb_monitor = usb_monitor
 
+	if backup_path is not None:
+		try:
+			if helix_usb.wait_ready(HelixUsb.BACKUP_READY_TIMEOUT):
+				helix_usb.backup_presets(backup_path)
+			else:
+				log.error('Device not ready, no backup written')
+		except KeyboardInterrupt:
+			pass
+		helix_usb.shutdown(usb_monitor)
+		return 0
+
 	while True:
 
 		try:
@@ -1153,6 +1423,10 @@ def main(argv):
 					helix_usb.send_midi_program_change(program_no)
 					continue
 
+				if tokens[0].lower() == 'backup':
+					helix_usb.backup_presets(tokens[1])
+					continue
+
 				try:
 					switch_id = int(tokens[0])
 				except ValueError:
@@ -1,10 +1,26 @@
 from modes.standard import Standard
 from out_packet import OutPacket
+from packet_dispatcher import PacketDispatcher
+from packet_templates import PacketTemplate
 import logging
 log = logging.getLogger(__name__)
 
 
 class Connect(Standard):
+	packets = PacketDispatcher()
+
+	X1X10_OPEN = PacketTemplate([0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
+	X1X10_OPEN_REPLY = PacketTemplate([0x11, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x5, 0x0, 0x1, 0x0, 0x0, 0x0, 0x5, 0x0, 0x0, 0x0])
+	X1X10_INFO_ACK = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x20, 0x10, 0x0, 0x0])
+	X1X10_ACK_3_REPLY = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x2, 0x20, 0x10, 0x0, 0x0])
+	X80X10_OPEN = PacketTemplate([0xc, 0x0, 0x0, 0x28, 0x80, 0x10, 0xed, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
+	X80X10_OPEN_REPLY = PacketTemplate([0x11, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x1, 0x0, 0x0, 0x0, 0x6, 0x0, 0x0, 0x0])
+	X2X10_OPEN = PacketTemplate([0xc, 0x0, 0x0, 0x28, 0x2, 0x10, 0xf0, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
+	X2X10_OPEN_REPLY = PacketTemplate([0x11, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x4, 0x0, 0x1, 0x0, 0x0, 0x0, 0x4, 0x0, 0x0, 0x0])
+	X80X10_REQUEST_0x19 = PacketTemplate([0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x9, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe8, 0x64, 0x4c, 0x65, 0x80, 0x0, 0x0, 0x0])
+	X80X10_REQUEST_0x1c = PacketTemplate([0x1c, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, 0x55, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xc, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe9, 0x64, 0x18, 0x65, 0x81, 0x76, 0xcc, 0x80])
+	X80X10_REQUEST_0x19_c0 = PacketTemplate([0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, 0x6c, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xea, 0x64, 0x17, 0x65, 0xc0, 0x0, 0x0, 0x0])
+
 	def __init__(self, helix_usb):
 		Standard.__init__(self, helix_usb=helix_usb, name="connect")
 		self.alive_msg_counter = [0, 0, 0]
@@ -21,71 +37,15 @@ class Connect(Standard):
 		self.helix_usb.x80x10_cnt = 0x2
 		self.reset_x1x10_done = False
 
-		data = [0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0]
-		self.helix_usb.endpoint_0x1_out(data)
+		self.helix_usb.endpoint_0x1_out(self.X1X10_OPEN.render())
 
 	def shutdown(self):
 		log.info('Shutting down mode')
 
 	def data_in(self, data):
-
-		if self.helix_usb.my_byte_cmp(left=data, right=[0xc, 0x0, 0x0, 0x28, 0xef, 0x3, 0x1, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20):
-			out = OutPacket(data=[0x11, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x5, 0x0, 0x1, 0x0, 0x0, 0x0, 0x5, 0x0, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x28, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x2, 0x0, 0x4, 0x9, 0x2], length=14):
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x20, 0x10, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x8, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x3, 0x0, "XX", 0x9, 0x2, 0x0, 0x0], length=16):
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x2, 0x20, 0x10, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-			# later - after reconfiguraion
-			# self.helix_usb.start_x1x10_keep_alive_thread(delay=0.0)
-
-		# start 80x10
-		# ToDo falsche Response (falscher Kanal)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x8, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x4, 0x0, "XX", 0x9, 0x2, 0x0, 0x0], length=16):
-			out = OutPacket(data=[0xc, 0x0, 0x0, 0x28, 0x80, 0x10, 0xed, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0], delay=0.0)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0xc, 0x0, 0x0, 0x28, 0xed, 0x3, 0x80, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20):
-			out = OutPacket(data=[0x11, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x1, 0x0, 0x0, 0x0, 0x6, 0x0, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		# ToDo falsche Response (falscher Kanal)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x11, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, 0x2], length=10):
-			self.received_x11_on_x80 = True
-			out = OutPacket(data=[0xc, 0x0, 0x0, 0x28, 0x2, 0x10, 0xf0, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0], delay=0.0)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-			self.helix_usb.start_x80x10_keep_alive_thread(delay=0.0)
-
-		# ToDo falsche Response (falscher Kanal)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0xc, 0x0, 0x0, 0x28, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20):
-			# out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, 0x3, 0x0, 0x8, 0x9, 0x10, 0x0, 0x0])
-			# self.helix_usb.out_packet_to_endpoint_0x1(out)
-			out = OutPacket(data=[0x11, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x4, 0x0, 0x1, 0x0, 0x0, 0x0, 0x4, 0x0, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		# ToDo falsche Response (falscher Kanal)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x11, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x2, 0x0, 0x4, 0x9, 0x2], length=14):
-			self.received_x11_on_x2 = True
-			self.helix_usb.start_x2x10_keep_alive_thread()
-			# out = OutPacket(data=[0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
-			# self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		# ToDo falsche Response (falscher Kanal)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x8, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x3, 0x0, 0x8, 0x9, 0x2, 0x0, 0x0], length=16):
-			out = OutPacket(data=[0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x9, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe8, 0x64, 0x4c, 0x65, 0x80, 0x0, 0x0, 0x0], delay=0.140)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x54, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0], length=9):
-			out = OutPacket(data=[0x1c, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, 0x55, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0xc, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe9, 0x64, 0x18, 0x65, 0x81, 0x76, 0xcc, 0x80])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x1f, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x4, 0x2e, 0x2, 0x0, 0x0, 0x0, 0x0, 0x6, 0x0, 0xf, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe9, 0x67, 0x0, 0x68, 0x82, 0x76, 0xcd, 0x0, 0x80, 0x77, 0x0, 0xdc], length=9):
-			out = OutPacket(data=[0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, 0x6c, 0x10, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xea, 0x64, 0x17, 0x65, 0xc0, 0x0, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
+		handler = self.packets.resolve(data)
+		if handler is not None:
+			handler(self, data)
 		elif self.helix_usb.check_keep_alive_response(data):
 			return False  # don't print incoming message to console
 		else:
@@ -94,7 +54,7 @@ class Connect(Standard):
 
 		if self.received_x11_on_x2 and self.received_x11_on_x80:
 			self.helix_usb.connected = True
-			self.helix_usb.switch_mode()
+			self.helix_usb.mode_finished(self)
 
 		return True  # print incoming message to console
 		'''
@@ -156,4 +116,73 @@ class Connect(Standard):
 				self.helix_usb.x1x10_cnt = 0x2
 				out = OutPacket(data=[0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
 				self.helix_usb.out_packet_to_endpoint_0x1(out)
-		'''
\ No newline at end of file
+		'''
+
+	@packets.on([0xc, 0x0, 0x0, 0x28, 0xef, 0x3, 0x1, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20)
+	def _on_x1x10_open(self, data):
+		out = OutPacket(data=self.X1X10_OPEN_REPLY.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	@packets.on([0x28, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x2, 0x0, 0x4, 0x9, 0x2], length=14)
+	def _on_x1x10_info(self, data):
+		out = OutPacket(data=self.X1X10_INFO_ACK.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	@packets.on([0x8, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x3, 0x0, "XX", 0x9, 0x2, 0x0, 0x0], length=16)
+	def _on_x1x10_ack_3(self, data):
+		out = OutPacket(data=self.X1X10_ACK_3_REPLY.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+		# later - after reconfiguraion
+		# self.helix_usb.start_x1x10_keep_alive_thread(delay=0.0)
+
+	# start 80x10
+	# ToDo falsche Response (falscher Kanal)
+	@packets.on([0x8, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x4, 0x0, "XX", 0x9, 0x2, 0x0, 0x0], length=16)
+	def _on_x1x10_ack_4(self, data):
+		out = OutPacket(data=self.X80X10_OPEN.render(), delay=0.0)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	@packets.on([0xc, 0x0, 0x0, 0x28, 0xed, 0x3, 0x80, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20)
+	def _on_x80x10_open(self, data):
+		out = OutPacket(data=self.X80X10_OPEN_REPLY.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	# ToDo falsche Response (falscher Kanal)
+	@packets.on([0x11, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, 0x2], length=10)
+	def _on_x80x10_x11(self, data):
+		self.received_x11_on_x80 = True
+		out = OutPacket(data=self.X2X10_OPEN.render(), delay=0.0)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+		self.helix_usb.start_x80x10_keep_alive_thread(delay=0.0)
+
+	# ToDo falsche Response (falscher Kanal)
+	@packets.on([0xc, 0x0, 0x0, 0x28, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20)
+	def _on_x2x10_open(self, data):
+		# out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, 0x3, 0x0, 0x8, 0x9, 0x10, 0x0, 0x0])
+		# self.helix_usb.out_packet_to_endpoint_0x1(out)
+		out = OutPacket(data=self.X2X10_OPEN_REPLY.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	# ToDo falsche Response (falscher Kanal)
+	@packets.on([0x11, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x2, 0x0, 0x4, 0x9, 0x2], length=14)
+	def _on_x2x10_x11(self, data):
+		self.received_x11_on_x2 = True
+		self.helix_usb.start_x2x10_keep_alive_thread()
+		# out = OutPacket(data=[0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
+		# self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	# ToDo falsche Response (falscher Kanal)
+	@packets.on([0x8, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x3, 0x0, 0x8, 0x9, 0x2, 0x0, 0x0], length=16)
+	def _on_x2x10_ack_3(self, data):
+		out = OutPacket(data=self.X80X10_REQUEST_0x19.render(), delay=0.140)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	@packets.on([0x54, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0], length=9)
+	def _on_x80x10_0x54(self, data):
+		out = OutPacket(data=self.X80X10_REQUEST_0x1c.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	@packets.on([0x1f, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x4, 0x2e, 0x2, 0x0, 0x0, 0x0, 0x0, 0x6, 0x0, 0xf, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe9, 0x67, 0x0, 0x68, 0x82, 0x76, 0xcd, 0x0, 0x80, 0x77, 0x0, 0xdc], length=9)
+	def _on_x80x10_0x1f(self, data):
+		out = OutPacket(data=self.X80X10_REQUEST_0x19_c0.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
@@ -1,10 +1,17 @@
 from modes.standard import Standard
 from out_packet import OutPacket
+from packet_dispatcher import PacketDispatcher
+from packet_templates import PacketTemplate
 import logging
 log = logging.getLogger(__name__)
 
 
 class ReconfigureX1(Standard):
+	packets = PacketDispatcher()
+
+	X1X10_OPEN = PacketTemplate([0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0])
+	X1X10_OPEN_REPLY = PacketTemplate([0x11, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, 0x1, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0])
+
 	def __init__(self, helix_usb):
 		Standard.__init__(self, helix_usb=helix_usb, name="reconfigure_x1")
 
@@ -13,28 +20,15 @@ class ReconfigureX1(Standard):
 
 		self.helix_usb.x1x10_cnt = 0x2
 
-		data = [0xc, 0x0, 0x0, 0x28, 0x1, 0x10, 0xef, 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21, 0x0, 0x10, 0x0, 0x0]
-		self.helix_usb.endpoint_0x1_out(data)
+		self.helix_usb.endpoint_0x1_out(self.X1X10_OPEN.render())
 
 	def shutdown(self):
 		log.info('Shutting down mode')
 
 	def data_in(self, data):
-
-		if self.helix_usb.my_byte_cmp(left=data, right=[0xc, 0x0, 0x0, 0x28, 0xef, 0x3, 0x1, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20):
-			# out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0])
-			# self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-			# self.helix_usb.start_x2x10_keep_alive_thread(delay=1.0)
-			out = OutPacket(data=[0x11, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, 0x1, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x11, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x2, 0x0, 0x4], length=12):
-			# out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x20, 0x10, 0x0, 0x0])
-			# self.helix_usb.out_packet_to_endpoint_0x1(out)
-			self.helix_usb.start_x1x10_keep_alive_thread(delay=0.0)
-			self.helix_usb.reconfigured_x1 = True
-			self.helix_usb.switch_mode()
+		handler = self.packets.resolve(data)
+		if handler is not None:
+			handler(self, data)
 
 		elif self.helix_usb.check_keep_alive_response(data):
 			return False  # don't print incoming message to console
@@ -43,4 +37,21 @@ class ReconfigureX1(Standard):
 			hex_str = ''.join('0x{:x}, '.format(x) for x in data)
 			log.warning("Unexpected message in connect mode: " + str(hex_str))
 
-		return True  # print incoming message to console
\ No newline at end of file
+		return True  # print incoming message to console
+
+	@packets.on([0xc, 0x0, 0x0, 0x28, 0xef, 0x3, 0x1, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x1, 0x0, 0x2, 0x0, 0x0], length=20)
+	def _on_x1x10_open(self, data):
+		# out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10, 0x9, 0x10, 0x0, 0x0])
+		# self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+		# self.helix_usb.start_x2x10_keep_alive_thread(delay=1.0)
+		out = OutPacket(data=self.X1X10_OPEN_REPLY.render())
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+	@packets.on([0x11, 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, 0x2, 0x0, 0x4], length=12)
+	def _on_x1x10_x11(self, data):
+		# out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x20, 0x10, 0x0, 0x0])
+		# self.helix_usb.out_packet_to_endpoint_0x1(out)
+		self.helix_usb.start_x1x10_keep_alive_thread(delay=0.0)
+		self.helix_usb.reconfigured_x1 = True
+		self.helix_usb.mode_finished(self)
@@ -1,7 +1,8 @@
 from modes.standard import Standard
+from packet_dispatcher import PacketDispatcher
+from packet_templates import PacketTemplate
 import random
 from modules import modules
-from utils.formatter import format_1
 # from utils.simple_filter import slot_extract, fs_info_extract
 import logging
 import threading
@@ -10,23 +11,48 @@ log = logging.getLogger(__name__)
 
 
 class RequestPreset(Standard):
+	packets = PacketDispatcher()
+	CHANNEL = 0x80
+	PRESET_DATA = packets.register(["XX", "XX", 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, "XX", "XX", "XX", 0x0, 0x0], length=16)
+
+	REQUEST_PRESET = PacketTemplate(
+		[0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, 0x0, 0x0, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0x0, 0x64, 0x16, 0x65, 0xc0, 0x0, 0x0, 0x0],
+		fields={'session_no': 12, 'packet_double': (13, 2), 'request_session_id': 28})
+	PRESET_DATA_ACK = PacketTemplate(
+		[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x8, 0x0, 0x0, 0x0, 0x0],
+		fields={'session_no': 12, 'packet_double': (13, 2)})
+
+	# fallback if the announced length is never reached: parse after this much silence
+	PRESET_DATA_TIMEOUT = 0.02
+	# a discarded request waits this long for the first packet of the transfer it has requested
+	DISCARD_TIMEOUT = 0.5
+	PRESET_DATA_TIMEOUT_TASK = 'preset data timeout'
+
 	def __init__(self, helix_usb):
 		Standard.__init__(self, helix_usb=helix_usb, name="request_preset")
-		self.preset_data = []
+		self.preset_data = bytearray()
 		self.hx_preset = None
 		self.data_requests_packages_or_whatever = []
 		self.num_received_1f = 0
 		self.request_preset_session_id = 0xf4
 		self.in_transfer = False
 		self.wait_for_next_packet_timer = None
+		self.transfer_lock = threading.Lock()
+		self.transfer_complete = False
+		self.preset_no = -1
 
 	def start(self):
 		log.info('Starting mode')
-		self.preset_data = []
+		# the preset may be switched while the data is still being received
+		self.preset_no = self.helix_usb.current_preset_no
+		self.discarded = False
+		self.preset_data = bytearray()
 		self.num_received_1f = 0
 		next_packet_double = self.helix_usb.preset_data_packet_double()
 
-		data = [0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, self.helix_usb.maybe_session_no, next_packet_double[0], next_packet_double[1], 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, self.request_preset_session_id, 0x64, 0x16, 0x65, 0xc0, 0x0, 0x0, 0x0]
+		data = self.REQUEST_PRESET.render(
+			session_no=self.helix_usb.maybe_session_no, packet_double=next_packet_double,
+			request_session_id=self.request_preset_session_id)
 		self.helix_usb.endpoint_0x1_out(data, silent=True)
 
 		self.data_requests_packages_or_whatever = range(0x10, 0x1a)
@@ -35,71 +61,64 @@ class RequestPreset(Standard):
 			self.request_preset_session_id -= 0xff
 		self.in_transfer = False
 		self.wait_for_next_packet_timer = None
+		self.transfer_complete = False
 
 	def shutdown(self):
 		log.info('Shutting down mode')
+		self.cancel_preset_data_timeout()
 
-	def preset_info_complete(self):
-
-		slots = self.preset_data.split('8213')
-
-		# find first slot starting with either 06 or 08
-		slot_1_idx = -1
-		for i, slot in enumerate(slots):
-			if slot.startswith('06') or slot.startswith('08'):
-				slot_1_idx = i
-				break
-
-		if slot_1_idx == -1:
-			return False
-
-		if slot_1_idx == 0:
-			return False
-
-		# remove slots we don't understand or we don't need
-		slots = slots[slot_1_idx-1:]
-		slots = slots[0:20]
-		# we must have 20 slots now
-		if len(slots) != 20:
-			return False
-
-		if not slots[0].startswith('00'):
-			False
-		if not slots[9].startswith('01'):
-			False
-		if not slots[10].startswith('02'):
-			False
-		if not slots[19].startswith('03'):
-			False
-
-		assignable_slots = [1, 2, 3, 4, 5, 6, 7, 8, 11, 12, 13, 14, 15, 16, 17, 18]
-		for slot_idx in assignable_slots:
-			if not (slot.startswith('06') or slot.startswith('08')):
+	def discard(self):
+		# the device streams the requested preset anyway: keep acking its packets up to the announced length so
+		# they neither show up in other modes nor in the next preset request, then drop the result
+		with self.transfer_lock:
+			if self.transfer_complete:
 				return False
+			self.discarded = True
+		if len(self.preset_data) == 0:
+			self.arm_preset_data_timeout(self.DISCARD_TIMEOUT)
+		return True
 
-		slot_infos = []
-		for slot_idx in assignable_slots:
-			slot_data = slots[slot_idx]
-			if slot_data == '0814c0':
-				# print(str(slot_idx) + ' is empty')
-				empty_slot_info = EmptySlotInfo()
-				empty_slot_info.slot_no = slot_idx
-				slot_infos.append(empty_slot_info)
-				continue
-			# print(slot_data)
-			slot_info = parse_standard_module_slot(slot_data)
-			if slot_info is None:
-				slot_info = parse_amp_and_cab_slot(slot_data)
-
-			if slot_info is None:
-				slot_info = parse_dual_cab_slot(slot_data)
-				if slot_info is None:
-					print("ERROR: Cannot read slot info: " + str(slot_idx))
-					continue
-
-			slot_info.slot_no = slot_idx
-			slot_infos.append(slot_info)
-		return slot_infos
+	def arm_preset_data_timeout(self, delay=PRESET_DATA_TIMEOUT):
+		# one task on the scheduler thread, every packet moves its deadline - no thread per packet
+		scheduler = self.helix_usb.keep_alive_scheduler
+		if scheduler.is_running():
+			if scheduler.is_scheduled(self.PRESET_DATA_TIMEOUT_TASK):
+				scheduler.touch(self.PRESET_DATA_TIMEOUT_TASK)
+			else:
+				scheduler.schedule(self.PRESET_DATA_TIMEOUT_TASK, self.on_preset_data_timeout,
+								   period=self.PRESET_DATA_TIMEOUT, delay=delay)
+			return
+
+		if self.wait_for_next_packet_timer is not None:
+			self.wait_for_next_packet_timer.cancel()
+		self.wait_for_next_packet_timer = threading.Timer(delay, self.on_preset_data_timeout)
+		self.wait_for_next_packet_timer.start()
+
+	def cancel_preset_data_timeout(self):
+		self.helix_usb.keep_alive_scheduler.cancel(self.PRESET_DATA_TIMEOUT_TASK)
+		if self.wait_for_next_packet_timer is not None:
+			self.wait_for_next_packet_timer.cancel()
+			self.wait_for_next_packet_timer = None
+
+	def on_preset_data_timeout(self):
+		expected_length = HxPreset.expected_length(self.preset_data)
+		if self.discarded:
+			log.info('Discarded preset transfer ended after ' + str(len(self.preset_data)) + ' of ' +
+					 str(expected_length) + ' bytes')
+			self.finish_transfer()
+			return
+		log.warning('Preset data incomplete after timeout: ' + str(len(self.preset_data)) + ' of ' +
+					str(expected_length) + ' bytes')
+		self.finish_transfer()
+
+	def finish_transfer(self):
+		# called from the reader (transfer complete) or the timeout, whichever comes first
+		with self.transfer_lock:
+			if self.transfer_complete:
+				return
+			self.transfer_complete = True
+		self.cancel_preset_data_timeout()
+		self.parse_preset_data()
 
 	def parse_preset_data(self):
 		# log.info("TIMER exec")
@@ -110,48 +129,47 @@ class RequestPreset(Standard):
 		# self.helix_usb.endpoint_0x1_out(data_out, silent=True)
 
 		# log.info("GOT PRESET DATA, length is: " + str(len(self.preset_data)))
-		str_out = ''
-		for b in self.preset_data:
-			str_out += hex(b) + ", "
-		str_out = str_out[:-2]
-		nice_str = format_1(str_out)
-		# print(nice_str)
-
-		self.hx_preset = HxPreset(data_in=nice_str,
-								  preset_no=self.helix_usb.preset_no,
-								  preset_name=self.helix_usb.preset_name)
-		self.hx_preset.to_string()
-
-		# fs_info_list = fs_info_extract(nice_str)
-
-		'''
-		for fs_info in fs_info_list:
-			print(fs_info.to_string())
-		
-		slot_data = slot_extract(nice_str)
-		for slot in slot_data:
-			print(slot.to_string())
-		'''
-		# self.helix_usb.set_slot_info(slot_data)
-		# print(str_out)
-
+		preset_data = bytes(self.preset_data)
+		if self.discarded:
+			# requested for a preset which has been switched away from meanwhile
+			self.helix_usb.mode_finished(self)
+			return True
 
+		if log.isEnabledFor(logging.DEBUG):
+			log.debug('Preset data: ' + preset_data.hex())
 
+		try:
+			hx_preset = HxPreset(data_in=preset_data, preset_no=self.preset_no, preset_name=self.preset_name())
+			hx_preset.to_string()
+		except ValueError as e:
+			log.error('Cannot parse preset data: ' + str(e))
+			hx_preset = None
+		self.hx_preset = hx_preset
 
 		# splitter for the labels: 87 0A 00 0B 84 00 03 05 A9
 		# active snapshot information:
-		if '860600070208' in nice_str and self.helix_usb.current_snapshot != 1:
-			self.helix_usb.set_snapshot(1)
-		elif '860601070208' in nice_str and self.helix_usb.current_snapshot != 2:
-			self.helix_usb.set_snapshot(2)
-		elif '860602070208' in nice_str and self.helix_usb.current_snapshot != 3:
-			self.helix_usb.set_snapshot(3)
+		snapshot = HxPreset.find_snapshot(preset_data)
+		if snapshot != -1 and self.helix_usb.current_snapshot != snapshot:
+			self.helix_usb.set_snapshot(snapshot)
 
+		# done before publishing: a subscriber may switch presets, which resets the flag and requests this mode again
 		self.helix_usb.got_preset = True
-		self.helix_usb.switch_mode()
+		self.helix_usb.mode_finished(self)
+		if hx_preset is not None:
+			self.helix_usb.cache_preset_data(self.preset_no, preset_data)
+			self.helix_usb.set_hx_preset(self.preset_no, hx_preset)
 
 		return True  # print incoming message to console
 
+	def preset_name(self):
+		# the received name only if it belongs to the fetched preset, it may still be the previous one's otherwise
+		helix_usb = self.helix_usb
+		if helix_usb.got_preset_name and helix_usb.current_preset_no == self.preset_no:
+			return helix_usb.preset_name
+		if 0 <= self.preset_no < len(helix_usb.preset_names):
+			return helix_usb.preset_names[self.preset_no]
+		return ''
+
 	def data_in(self, data_in):
 
 		if self.helix_usb.check_keep_alive_response(data_in):
@@ -162,12 +180,7 @@ class RequestPreset(Standard):
 			log.error("Unexpected package while trying to read preset data: " + str(hex_str))
 			return True  # print incoming message to console
 
-		if self.helix_usb.my_byte_cmp(left=data_in, right=["XX", "XX", 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, "XX", "XX", "XX", 0x0, 0x0], length=16):
-			if self.wait_for_next_packet_timer is not None:
-				self.wait_for_next_packet_timer.cancel()
-				# log.info("TIMER cancelled")
-				self.wait_for_next_packet_timer = None
-
+		if self.packets.match(data_in) is self.PRESET_DATA:
 			self.in_transfer = False
 
 			reply_here = True
@@ -175,15 +188,7 @@ class RequestPreset(Standard):
 				reply_here = False
 
 
-			# try calculating the size
-			expected_length = data_in[1] * 255 + data_in[0]
-			# expected_length -= 9
-
-			# log.info("Expected length: " + str(expected_length))
-			# log.info("Real length:     " + str(len(data_in) - 9))
-
-			for b in data_in[16:]:
-				self.preset_data.append(b)
+			self.preset_data.extend(data_in[16:])
 
 			if reply_here is False:
 				# Skipping reply for first data packet
@@ -194,12 +199,15 @@ class RequestPreset(Standard):
 				next_packet_double_no = self.helix_usb.next_preset_data_packet_double()
 			else:
 				next_packet_double_no = self.helix_usb.preset_data_packet_double()
-			data_out = [0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x8, self.helix_usb.maybe_session_no, next_packet_double_no[0], next_packet_double_no[1], 0x0]
+			data_out = self.PRESET_DATA_ACK.render(session_no=self.helix_usb.maybe_session_no, packet_double=next_packet_double_no)
 			self.helix_usb.endpoint_0x1_out(data_out, silent=True)
 
-			self.wait_for_next_packet_timer = threading.Timer(0.02, self.parse_preset_data)
-			self.wait_for_next_packet_timer.start()
-			# log.info("TIMER started")
+			expected_length = HxPreset.expected_length(self.preset_data)
+			if expected_length != -1 and len(self.preset_data) >= expected_length:
+				# last byte arrived, no need to wait for the timeout
+				self.finish_transfer()
+			else:
+				self.arm_preset_data_timeout()
 			return True
 
 		else:
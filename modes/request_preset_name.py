@@ -1,4 +1,6 @@
 from modes.standard import Standard
+from packet_dispatcher import PacketDispatcher
+from packet_templates import PacketTemplate
 import random
 import threading
 import logging
@@ -7,6 +9,16 @@ log = logging.getLogger(__name__)
 
 
 class RequestPresetName(Standard):
+    packets = PacketDispatcher()
+    CHANNEL = 0x80
+    # the name record is recognised by its content starting at data_in[23]
+    PRESET_NAME = packets.register(["XX"] * 23 + [0x0, 0x83, 0x66, 0xcd, "XX", "XX", 0x67, 0x0, 0x68, 0x86, 0x6b, 0xcd, 0x0, 0x0, 0x6c, 0xcd], length=39)
+
+    REQUEST_PRESET_NAME = PacketTemplate(
+        [0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x0, 0x0, 0x0, 0x1, 0x0, 0x6,
+         0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x4, 0x64, 0x17, 0x65, 0xc0, 0x0, 0x0, 0x0],
+        fields={'session_no': 12, 'packet_double': (13, 2)})
+
     def __init__(self, helix_usb):
         Standard.__init__(self, helix_usb=helix_usb, name="request_preset_name")
         self.preset_name_data = []
@@ -16,24 +28,26 @@ class RequestPresetName(Standard):
         log.info('Starting mode')
         self.preset_name_data = []
         preset_data_packet_double = self.helix_usb.preset_data_packet_double()
-        data = [0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, self.helix_usb.maybe_session_no, preset_data_packet_double[0], preset_data_packet_double[1], 0x0, 0x1, 0x0, 0x6,
-                0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x4, 0x64, 0x17, 0x65, 0xc0, 0x0, 0x0, 0x0]
+        data = self.REQUEST_PRESET_NAME.render(session_no=self.helix_usb.maybe_session_no, packet_double=preset_data_packet_double)
         self.helix_usb.endpoint_0x1_out(data, silent=True)
         self.response_watch_dog_timer = threading.Timer(0.5, self.on_name_missing, [])
         self.response_watch_dog_timer.start()
 
     def shutdown(self):
         log.info('Shutting down mode')
+        if self.response_watch_dog_timer is not None:
+            self.response_watch_dog_timer.cancel()
+            self.response_watch_dog_timer = None
 
     def on_name_missing(self):
         log.error('Didn''t receive current preset''s name. Ending mode ' + self.name + ' without success')
-        self.helix_usb.switch_mode()
+        self.helix_usb.mode_finished(self)
 
     def data_in(self, data_in):
         if self.helix_usb.check_keep_alive_response(data_in):
             return False  # don't print incoming message to console
 
-        elif self.helix_usb.my_byte_cmp(left=data_in[23:], right=[0x0, 0x83, 0x66, 0xcd, "XX", "XX", 0x67, 0x0, 0x68, 0x86, 0x6b, 0xcd, 0x0, 0x0, 0x6c, 0xcd], length=16):
+        elif self.packets.match(data_in) is self.PRESET_NAME:
             # self.helix_usb.log_data_in(data_in)
             for b in data_in[16:]:
                 self.preset_name_data.append(b)
@@ -55,7 +69,7 @@ class RequestPresetName(Standard):
                 self.response_watch_dog_timer.cancel()
                 self.response_watch_dog_timer = None
 
-                self.helix_usb.switch_mode()
+                self.helix_usb.mode_finished(self)
 
             return False   # don't print incoming message to console
 
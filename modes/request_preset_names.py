@@ -1,15 +1,31 @@
 from modes.standard import Standard
 from out_packet import OutPacket
+from packet_dispatcher import PacketDispatcher
+from packet_templates import PacketTemplate
 import logging
 import threading
 log = logging.getLogger(__name__)
 
 
 class RequestPresetNames(Standard):
+	packets = PacketDispatcher()
+	CHANNEL = 0x1
+	NAMES_SINGLE_PACKET = packets.register([0x8, 0x1, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0, "XX"], length=17)
+	NAMES_PACKET = packets.register(["XX", 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0], length=16)
+
+	REQUEST_PRESET_NAMES = PacketTemplate([0x1d, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0xc, 0x38, 0x10, 0x0, 0x0, 0x1, 0x0, 0x2,
+		0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xea, 0x64, 0x1, 0x65, 0x82, 0x6b, 0x0, 0x65, 0x2, 0x0,
+		0x0, 0x0])
+
+	NAME_RECORD_MARKER = bytes([0x81, 0xcd, 0x0])
+	NAME_RECORD_LENGTH = 25  # marker(3) + metadata/name fields up to 16-byte name area
+	# printable ascii is kept, everything else shows up as '?'
+	NAME_CHARS = ''.join(chr(b) if 32 <= b <= 126 else '?' for b in range(256))
+
 	def __init__(self, helix_usb):
 		Standard.__init__(self, helix_usb=helix_usb, name="request_preset_names")
 		self.preset_names_data = []
-		self.preset_names_stream = []
+		self.preset_names_stream = bytearray()
 		self.stream_parse_idx = 0
 		self.decoded_preset_names = []
 		self.decoded_preset_names_by_index = {}
@@ -22,16 +38,14 @@ class RequestPresetNames(Standard):
 	def start(self):
 		log.info('Starting mode')
 		self.preset_names_data = []
-		self.preset_names_stream = []
+		self.preset_names_stream = bytearray()
 		self.stream_parse_idx = 0
 		self.decoded_preset_names = []
 		self.decoded_preset_names_by_index = {}
 		self.decoded_preset_names_fallback = []
 		self.transfer_complete = False
 		self._cancel_idle_watchdog()
-		data = [0x1d, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0xc, 0x38, 0x10, 0x0, 0x0, 0x1, 0x0, 0x2,
-				0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xea, 0x64, 0x1, 0x65, 0x82, 0x6b, 0x0, 0x65, 0x2, 0x0,
-				0x0, 0x0]
+		data = self.REQUEST_PRESET_NAMES.render()
 		# data = [0x19, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x1a, 0x10, 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe9, 0x64, 0x0, 0x65, 0xc0, 0x0, 0x0, 0x0]
 		# data = [0x1a, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x4, 0x9, 0x10, 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, 0xa, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, 0xe8, 0x64, 0xcc, 0xfe, 0x65, 0x80, 0x0, 0x0]
 		self.helix_usb.endpoint_0x1_out(data, silent=True)
@@ -66,11 +80,16 @@ class RequestPresetNames(Standard):
 		self.parse_preset_names(finalize=True)
 		self.decoded_preset_names = self._build_aligned_preset_names()
 
+		# names without index in their record are only placed now
+		for idx, name in enumerate(self.decoded_preset_names):
+			if idx not in self.decoded_preset_names_by_index and name != self.preset_name_placeholder:
+				self.helix_usb.set_decoded_preset_name(idx, name)
+
 		self.helix_usb.set_preset_names(self.decoded_preset_names)
 		for idx, name in enumerate(self.decoded_preset_names):
 			log.info('%d: %s', idx, name)
 		log.info('Received preset names: %d', len(self.decoded_preset_names))
-		self.helix_usb.switch_mode()
+		self.helix_usb.mode_finished(self)
 
 	def _extract_record_preset_index(self, record):
 		if len(record) < 9:
@@ -113,56 +132,47 @@ class RequestPresetNames(Standard):
 		return aligned
 
 	def parse_preset_names(self, finalize=False):
-		pattern = [0x81, 0xcd, 0x0]
-		record_len = 25  # marker(3) + metadata/name fields up to 16-byte name area
+		# decodes all records completed by the data received so far, each name is handed out right away
+		stream = self.preset_names_stream
+		marker = self.NAME_RECORD_MARKER
+		record_len = self.NAME_RECORD_LENGTH
 
 		while True:
-			search_limit = len(self.preset_names_stream) - len(pattern) + 1
-			if self.stream_parse_idx >= search_limit:
-				if not finalize:
-					self.stream_parse_idx = max(0, len(self.preset_names_stream) - len(pattern) + 1)
-				break
-
-			marker_idx = -1
-			for i in range(self.stream_parse_idx, search_limit):
-				if self.preset_names_stream[i:i + len(pattern)] == pattern:
-					marker_idx = i
-					break
-
+			marker_idx = stream.find(marker, self.stream_parse_idx)
 			if marker_idx < 0:
 				if not finalize:
-					self.stream_parse_idx = max(0, len(self.preset_names_stream) - len(pattern) + 1)
+					self.stream_parse_idx = max(0, len(stream) - len(marker) + 1)
 				break
 
-			if marker_idx + record_len > len(self.preset_names_stream):
+			if marker_idx + record_len > len(stream):
 				if not finalize:
 					self.stream_parse_idx = marker_idx
 				break
 
-			record = self.preset_names_stream[marker_idx:marker_idx + record_len]
-			name_bytes = record[9:25]
-			name_chars = []
-			for b in name_bytes:
-				if b == 0x0:
-					break
-				if 32 <= b <= 126:
-					name_chars.append(chr(b))
-				else:
-					name_chars.append('?')
-			decoded_name = ''.join(name_chars)
+			record = stream[marker_idx:marker_idx + record_len]
+			decoded_name = self.decode_record_name(record)
 			preset_idx = self._extract_record_preset_index(record)
 			if preset_idx is not None:
 				if preset_idx not in self.decoded_preset_names_by_index:
 					self.decoded_preset_names_by_index[preset_idx] = decoded_name
+					self.helix_usb.set_decoded_preset_name(preset_idx, decoded_name)
 			else:
 				self.decoded_preset_names_fallback.append(decoded_name)
 			self.stream_parse_idx = marker_idx + record_len
 
 		return self._decoded_name_count()
 
+	@staticmethod
+	def decode_record_name(record):
+		name_bytes = record[9:25]
+		end = name_bytes.find(0x0)
+		if end >= 0:
+			name_bytes = name_bytes[:end]
+		return name_bytes.decode('latin-1').translate(RequestPresetNames.NAME_CHARS)
+
 	def _append_name_packet_payload(self, packet):
 		self.preset_names_data.append(packet)
-		self.preset_names_stream.extend(packet[16:])
+		self.preset_names_stream += packet[16:]
 
 	def data_in(self, data_in):
 		if self.transfer_complete:
@@ -171,10 +181,11 @@ class RequestPresetNames(Standard):
 		if self.helix_usb.check_keep_alive_response(data_in):
 			return False  # don't print incoming message to console
 
-		elif self.helix_usb.my_byte_cmp(left=data_in, right=[0x8, 0x1, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0, "XX"], length=17):
+		signature = self.packets.match(data_in)
+		if signature is self.NAMES_SINGLE_PACKET:
 			# one packet
 			self._append_name_packet_payload(data_in)
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x38, data_in[9]+9, 0x0, 0x0])
+			out = OutPacket(data=self.X1X10_PRESET_NAMES_ACK.render(packet_no=data_in[9] + 9))
 			self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
 			self._arm_idle_watchdog()
 			decoded_count = self.parse_preset_names()
@@ -182,9 +193,9 @@ class RequestPresetNames(Standard):
 				log.info('Preset-name request reached expected count (%d), finishing request mode', self.expected_preset_name_count)
 				self._finish_transfer()
 
-		elif self.helix_usb.my_byte_cmp(left=data_in, right=["XX", 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0], length=16):
+		elif signature is self.NAMES_PACKET:
 			# packet with payload shape that may be final or intermediate depending on transfer timing
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x38, data_in[9] + 9, 0x0, 0x0])
+			out = OutPacket(data=self.X1X10_PRESET_NAMES_ACK.render(packet_no=data_in[9] + 9))
 			self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
 
 			self._append_name_packet_payload(data_in)
@@ -1,13 +1,28 @@
 from out_packet import OutPacket
-from utils.ieee754_convert import format_1, ieee754_to_rendered_str
+from packet_dispatcher import PacketDispatcher
+from packet_templates import PacketTemplate
+from utils.preset_parser import SlotInfo
+from utils.msgpack_decoder import MsgPackDecodeError
 import logging
 log = logging.getLogger(__name__)
 
 
 class Standard:
+	# Incoming packets are resolved by a dispatcher table built once at import. Sub-modes define their own
+	# table, the first matching signature (in registration order) wins.
+	packets = PacketDispatcher()
+	# channel of the requests a mode sends, None: the mode needs all channels (connection setup)
+	CHANNEL = None
+
+	X80X10_SESSION_ACK = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x8, 0x0, 0x0, 0x0, 0x0], fields={'session': (12, 4)})
+	X2X10_ACK = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x8, 0x74, 0x77, 0x0, 0x0])
+	X1X10_PRESET_NAMES_ACK = PacketTemplate([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x38, 0x0, 0x0, 0x0], fields={'packet_no': 13})
+
 	def __init__(self, helix_usb, name):
 		self.helix_usb = helix_usb
 		self.name = name
+		# set once the request is no longer needed but its transfer is still drained
+		self.discarded = False
 
 	@staticmethod
 	def _packet_signature(data):
@@ -28,148 +43,170 @@ class Standard:
 	def shutdown(self):
 		log.info('Shutting down mode')
 
-	def data_in(self, data):
+	def discard(self):
+		# the request is no longer needed. Returns True if the mode keeps running until the device has sent what was
+		# requested (it calls mode_finished then and drops the result), False if it can be stopped right away
+		return False
 
-		# LED COLOR CHANGE
-		if self.helix_usb.my_byte_cmp(left=data, right=["XX", 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x4, "XX", "XX", "XX", "XX"], length=16):
-			self.helix_usb.increase_session_quadruple_x11()
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x8, self.helix_usb.session_quadruple[0], self.helix_usb.session_quadruple[1], self.helix_usb.session_quadruple[2], self.helix_usb.session_quadruple[3]],
-					  delay=0.0)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x17, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0], length=16):
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x8, 0x74, 0x77, 0x0, 0x0],
-					  delay=0.01)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-
-		# VIEW CHANGE
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x13, 0x77], length=42):
-			view_id = data[42]
-			try:
-				view_name = self.helix_usb.VIEWS[view_id]
-				log.info("UI changed to: " + view_name)
-			except KeyError:
-				log.info("Error while trying to get view name, id is: " + str(view_id))
-
-		# UI MODE CHANGE
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x15, 0x77], length=42):
-			mode_idx = data[42]
-			if 0 <= mode_idx < 4:
-				mode_name = self.helix_usb.UI_MODES[mode_idx]
-				log.info("UI mode changed to: " + mode_name)
-			else:
-				log.info("Error while trying to get UI mode name, unknown mode_idx: " + str(mode_idx))
-
-		# HIGHLIGHTED SLOT CHANGE (Cursor moved to another position on HX Stomp)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x27, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x3, 0x79, 0x13, 0x6a, 0x82, 0x62], length=38):
-			slot_id = data[38]
-			log.info("Selected slot id changed to: " + str(slot_id))
-
-		# SLOT-MODULE CHANGE (Cursor moved to another position on HX Stomp)
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x1f, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0xf, 0x0, 0x0, 0x0, 0x82, 0x69, 0x31, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x5, 0x79, 0xa, 0x6a, 0x81, 0x62], length=38):
-			changed_slot_idx = data[38]
-			log.info("Requesting preset data due to slot/module update in slot: " + str(changed_slot_idx))
-			self.helix_usb.got_preset_name = False
-			self.helix_usb.got_preset = False
-			self.helix_usb.switch_mode()
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x8, 0x74, 0x77, 0x0, 0x0],
-							delay=0.01)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-		# IEEE VALUE CHANGE0x2b, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x4d, 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1b, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, 0x4, 0x1d, 0xc3, 0x1a, 0x0, 0x1c
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x2b, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1b, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, "XX", 0x1d, 0xc3, 0x1a, 0x0, 0x1c], length=44):
-			parameter_idx = data[44]
-			value = data[47:51]
-			value_as_hex_str = ''.join('0x{:x}, '.format(x) for x in value)
-			if value_as_hex_str.endswith(', '):
-				value_as_hex_str = value_as_hex_str[:-2]
-			rendered_val = format_1(value_as_hex_str)
-			converted_value = ieee754_to_rendered_str(rendered_val)
-			log.info("Float value change for knob " + str(parameter_idx) + ": " + str(converted_value))
-
-		# INT VALUE CHANGE
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x17, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, "XX", 0x1d, 0xc3, 0x1a, 0x0, 0x1c], length=44):
-			parameter_idx = data[44]
-			value = data[46]
-			log.info("Int value change for knob " + str(parameter_idx) + ": " + str(value))
-
-		# TRAILS ON/OFF
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x17, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, "XX", 0x1d, 0xc2, 0x1a, 0x0, 0x1c, 0x0, 0x77], length=46):
-			trails_on_off = data[46]
-			if trails_on_off == 0xc2:
-				log.info("Trails have been switched off")
-			elif trails_on_off == 0xc3:
-				log.info("Trails have been switched on")
-			else:
-				log.warning("Unknown value for switching trails on/off: " + str(trails_on_off))
-
-		# PRESET SWITCH
-		# if self.helix_usb.my_byte_cmp(left=data, right=[0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x1c, 0x77, "XX", 0x42], length=44):
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x4, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x1, 0x79, "XX", 0x6a, 0x82, 0x6b, 0x0, 0x6c], length=30):
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x8, 0x74, 0x77, 0x0, 0x0],
-							delay=0.00)
-			self.helix_usb.out_packet_to_endpoint_0x1(out)
-
-			self.helix_usb.set_preset(data[40])
-			self.helix_usb.got_preset_name = False
-			self.helix_usb.got_preset = False
-			self.helix_usb.switch_mode()
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x27, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x3, 0x79, 0x13, 0x6a, 0x82, 0x62], length=38):
-			# self.helix_usb.set_preset(data[40])
-			# log.info("******************** PRESET: " + str(self.helix_usb.preset_no))
-			self.helix_usb.got_preset_name = False
-			self.helix_usb.got_preset = False
-			self.helix_usb.switch_mode()
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x8, 0x74, 0x77, 0x0, 0x0],
-							delay=0.01)
-			self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x8, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x1, 0x79, 0x5, 0x6a, 0x82, 0x6b, 0x0, 0x6c, "XX"]):
-			# Occurs while every preset switch initiated at the stomp. data[40] seems to carry the preset number
-			pass
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x17, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x10, 0x77, 0xca, "XX"]):
-			# Occurs twice while every preset switch initiated at the stomp. Usage unknown
-			# Maybe it is related to splits and merges in the sound pipeline?
-			pass
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x1c, 0x77, "XX"]):
-			# Occurs once while every preset switch initiated at the stomp. data[42] seems to carry the preset number
-			pass
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0], length=16):
-			# Preset-step and related UI traffic can emit additional 0x27 status frames
-			# that are expected but currently not decoded here. Avoid warning flood.
-			return False
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x8, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x8, "XX", "XX", 0x0, 0x0]):
-			# This message signals that a preset transfer has ended in data[11] == 0x08.
-			# Indeed, it should usually be received and properly processed by request_preset mode!
-			# At this time it was not possible to implement a stable way working with this message because it is not
-			# sent reliably. Thus, request_preset mode works with timer instead of waiting for this message.
-			# But if we receive it here, we can ignore it.
-			pass
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=[0x8, 0x1, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0, "XX"], length=17):
-			# Late packet from preset-names transfer stream can arrive after mode switched back to standard.
-			# Acknowledge and swallow to avoid warning flood.
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x38, data[9] + 9, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
-			return False
-
-		elif self.helix_usb.my_byte_cmp(left=data, right=["XX", 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0], length=16):
-			# Same transfer family as above with variable packet size; treat as expected late preset-name stream traffic.
-			out = OutPacket(data=[0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x38, data[9] + 9, 0x0, 0x0])
-			self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
-			return False
-
-		else:
-			if self.helix_usb.check_keep_alive_response(data):
-				return False  # don't print incoming message to console
+	def data_in(self, data):
+		handler = self.packets.resolve(data)
+		if handler is not None:
+			return handler(self, data)
 
-			hex_str = ''.join('0x{:x}, '.format(x) for x in data)
-			log.warning("Unexpected message in mode %s: %s | %s", self.name, self._packet_signature(data), str(hex_str))
+		if self.helix_usb.check_keep_alive_response(data):
+			return False  # don't print incoming message to console
 
+		hex_str = ''.join('0x{:x}, '.format(x) for x in data)
+		log.warning("Unexpected message in mode %s: %s | %s", self.name, self._packet_signature(data), str(hex_str))
 		return True  # print incoming message to console
+
+	# LED COLOR CHANGE
+	@packets.on(["XX", 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x4, "XX", "XX", "XX", "XX"], length=16)
+	def _on_led_color_change(self, data):
+		self.helix_usb.increase_session_quadruple_x11()
+		out = OutPacket(data=self.X80X10_SESSION_ACK.render(session=self.helix_usb.session_quadruple), delay=0.0)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+		return True
+
+	@packets.on([0x17, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0], length=16)
+	def _on_x2_status_0x17(self, data):
+		out = OutPacket(data=self.X2X10_ACK.render(), delay=0.01)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+		return True
+
+	# VIEW CHANGE
+	@packets.on([0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x13, 0x77], length=42)
+	def _on_view_change(self, data):
+		view_id = data[42]
+		try:
+			view_name = self.helix_usb.VIEWS[view_id]
+			log.info("UI changed to: " + view_name)
+		except KeyError:
+			log.info("Error while trying to get view name, id is: " + str(view_id))
+		return True
+
+	# UI MODE CHANGE
+	@packets.on([0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x15, 0x77], length=42)
+	def _on_ui_mode_change(self, data):
+		mode_idx = data[42]
+		if 0 <= mode_idx < 4:
+			mode_name = self.helix_usb.UI_MODES[mode_idx]
+			log.info("UI mode changed to: " + mode_name)
+		else:
+			log.info("Error while trying to get UI mode name, unknown mode_idx: " + str(mode_idx))
+		return True
+
+	# HIGHLIGHTED SLOT CHANGE (Cursor moved to another position on HX Stomp)
+	@packets.on([0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x27, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x3, 0x79, 0x13, 0x6a, 0x82, 0x62], length=38)
+	def _on_highlighted_slot_change(self, data):
+		slot_id = data[38]
+		log.info("Selected slot id changed to: " + str(slot_id))
+		return True
+
+	# SLOT-MODULE CHANGE (Cursor moved to another position on HX Stomp)
+	@packets.on([0x1f, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0xf, 0x0, 0x0, 0x0, 0x82, 0x69, 0x31, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x5, 0x79, 0xa, 0x6a, 0x81, 0x62], length=38)
+	def _on_slot_module_change(self, data):
+		changed_slot_idx = data[38]
+		log.info("Requesting preset data due to slot/module update in slot: " + str(changed_slot_idx))
+		self.helix_usb.invalidate_cached_preset()
+		self.helix_usb.got_preset_name = False
+		self.helix_usb.got_preset = False
+		self.helix_usb.switch_mode()
+		out = OutPacket(data=self.X2X10_ACK.render(), delay=0.01)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+		return True
+
+	# IEEE VALUE CHANGE0x2b, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, 0x4d, 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1b, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, 0x4, 0x1d, 0xc3, 0x1a, 0x0, 0x1c
+	@packets.on([0x2b, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1b, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, "XX", 0x1d, 0xc3, 0x1a, 0x0, 0x1c], length=44)
+	def _on_ieee_value_change(self, data):
+		self._on_value_change(data, "Float")
+		return True
+
+	# INT VALUE CHANGE
+	@packets.on([0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x17, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, "XX", 0x1d, 0xc3, 0x1a, 0x0, 0x1c], length=44)
+	def _on_int_value_change(self, data):
+		self._on_value_change(data, "Int")
+		return True
+
+	def _on_value_change(self, data, kind):
+		# the value is MessagePack encoded from data[46] on (0xca + float32 or a fixint), decoded like the preset data
+		# so the live values compare to the parsed ones
+		parameter_idx = data[44]
+		try:
+			value = SlotInfo.decode_param(data, 46)
+		except MsgPackDecodeError as e:
+			log.warning(kind + " value change for knob " + str(parameter_idx) + " cannot be decoded: " + str(e))
+			return
+		log.info(kind + " value change for knob " + str(parameter_idx) + ": " + str(value))
+		self.helix_usb.set_parameter_value(data[38], parameter_idx, value)
+
+	# TRAILS ON/OFF
+	@packets.on([0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x17, 0x0, 0x0, 0x0, 0x82, 0x69, 0x1e, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x6, 0x79, 0x14, 0x6a, 0x85, 0x62, "XX", 0x1d, 0xc2, 0x1a, 0x0, 0x1c, 0x0, 0x77], length=46)
+	def _on_trails_on_off(self, data):
+		trails_on_off = data[46]
+		if trails_on_off == 0xc2:
+			log.info("Trails have been switched off")
+			self.helix_usb.set_trails(data[38], False)
+		elif trails_on_off == 0xc3:
+			log.info("Trails have been switched on")
+			self.helix_usb.set_trails(data[38], True)
+		else:
+			log.warning("Unknown value for switching trails on/off: " + str(trails_on_off))
+		return True
+
+	# PRESET SWITCH
+	# [0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x1c, 0x77, "XX", 0x42], length=44
+	@packets.on([0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x4, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x1, 0x79, "XX", 0x6a, 0x82, 0x6b, 0x0, 0x6c], length=30)
+	def _on_preset_switch(self, data):
+		out = OutPacket(data=self.X2X10_ACK.render(), delay=0.00)
+		self.helix_usb.out_packet_to_endpoint_0x1(out)
+
+		self.helix_usb.set_preset(data[40])
+		self.helix_usb.preset_switched()
+		return True
+
+	@packets.on([0x21, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x8, 0x6a, 0x84, 0x52, 0x1, 0x44, 0x1, 0x79, 0x5, 0x6a, 0x82, 0x6b, 0x0, 0x6c, "XX"])
+	def _on_preset_switch_info_0x21(self, data):
+		# Occurs while every preset switch initiated at the stomp. data[40] seems to carry the preset number
+		return True
+
+	@packets.on([0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x17, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x10, 0x77, 0xca, "XX"])
+	def _on_preset_switch_info_0x27(self, data):
+		# Occurs twice while every preset switch initiated at the stomp. Usage unknown
+		# Maybe it is related to splits and merges in the sound pipeline?
+		return True
+
+	@packets.on([0x23, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x13, 0x0, 0x0, 0x0, 0x82, 0x69, 0x16, 0x6a, 0x84, 0x52, 0x0, 0x44, 0x9, 0x79, 0x19, 0x6a, 0x82, 0x76, 0xcd, 0x0, 0x1c, 0x77, "XX"])
+	def _on_preset_switch_info_0x23(self, data):
+		# Occurs once while every preset switch initiated at the stomp. data[42] seems to carry the preset number
+		return True
+
+	@packets.on([0x27, 0x0, 0x0, 0x18, 0xf0, 0x3, 0x2, 0x10, 0x0, "XX", 0x0, 0x4, 0x9, 0x2, 0x0, 0x0], length=16)
+	def _on_x2_status_0x27(self, data):
+		# Preset-step and related UI traffic can emit additional 0x27 status frames
+		# that are expected but currently not decoded here. Avoid warning flood.
+		return False
+
+	@packets.on([0x8, 0x0, 0x0, 0x18, 0xed, 0x3, 0x80, 0x10, 0x0, "XX", 0x0, 0x8, "XX", "XX", 0x0, 0x0])
+	def _on_preset_transfer_end(self, data):
+		# This message signals that a preset transfer has ended in data[11] == 0x08.
+		# Indeed, it should usually be received and properly processed by request_preset mode!
+		# At this time it was not possible to implement a stable way working with this message because it is not
+		# sent reliably. Thus, request_preset mode works with timer instead of waiting for this message.
+		# But if we receive it here, we can ignore it.
+		return True
+
+	@packets.on([0x8, 0x1, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0, "XX"], length=17)
+	def _on_late_preset_names_packet(self, data):
+		# Late packet from preset-names transfer stream can arrive after mode switched back to standard.
+		# Acknowledge and swallow to avoid warning flood.
+		out = OutPacket(data=self.X1X10_PRESET_NAMES_ACK.render(packet_no=data[9] + 9))
+		self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
+		return False
+
+	@packets.on(["XX", 0x0, 0x0, 0x18, 0xef, 0x3, 0x1, 0x10, 0x0, "XX", 0x0, 0x4, "XX", 0x2, 0x0, 0x0], length=16)
+	def _on_late_preset_names_stream(self, data):
+		# Same transfer family as above with variable packet size; treat as expected late preset-name stream traffic.
+		out = OutPacket(data=self.X1X10_PRESET_NAMES_ACK.render(packet_no=data[9] + 9))
+		self.helix_usb.out_packet_to_endpoint_0x1(out, silent=True)
+		return False
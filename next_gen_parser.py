@@ -239,41 +239,46 @@ def extract_footswitch_sections(data):
     return footswitch_sections_data
 
 
-file_path = "./ideas/20260226_all_data.txt"
+def main():
+    file_path = "./ideas/20260226_all_data.txt"
 
-preset_data_list = []
+    preset_data_list = []
 
-try:
-    with open(file_path, "r", encoding="utf-8") as file:
-        for line in file:
-            preset_data_list.append(line.rstrip("\n"))
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            for line in file:
+                preset_data_list.append(line.rstrip("\n"))
 
-    print("Datei erfolgreich eingelesen.")
-    print(f"Anzahl Zeilen: {len(preset_data_list)}")
+        print("Datei erfolgreich eingelesen.")
+        print(f"Anzahl Zeilen: {len(preset_data_list)}")
 
-except FileNotFoundError:
-    print(f"Datei nicht gefunden: {file_path}")
-except Exception as e:
-    print(f"Fehler beim Einlesen der Datei: {e}")
+    except FileNotFoundError:
+        print(f"Datei nicht gefunden: {file_path}")
+    except Exception as e:
+        print(f"Fehler beim Einlesen der Datei: {e}")
 
 
-preset_data = preset_data_list[86]
-print(preset_data)
-fs_info_data = extract_footswitch_sections(preset_data)
+    preset_data = preset_data_list[86]
+    print(preset_data)
+    fs_info_data = extract_footswitch_sections(preset_data)
 
-for data in fs_info_data:
-    print(data)
-    fsi = FootSwitchInfo(data, debug=True)
-    print(fsi)
+    for data in fs_info_data:
+        print(data)
+        fsi = FootSwitchInfo(data, debug=True)
+        print(fsi)
 
 
-for i, preset_data in enumerate(preset_data_list):
-    bank = int(i / 3) + 1
-    num = i % 3 + 1
-    letter = chr(64 + num)
-    print('Preset {}{} ({}): '.format(bank, letter, i))
-    fs_info_data = extract_footswitch_sections(preset_data)
-    for j, data in enumerate(fs_info_data):
-        fsi = FootSwitchInfo(data, debug=False)
-        for child in fsi.children:
-            print("S{}: {}, {}, {}".format(j+1, child.label[:-1], child.custom_label[:-1], child.led_color))
+    for i, preset_data in enumerate(preset_data_list):
+        bank = int(i / 3) + 1
+        num = i % 3 + 1
+        letter = chr(64 + num)
+        print('Preset {}{} ({}): '.format(bank, letter, i))
+        fs_info_data = extract_footswitch_sections(preset_data)
+        for j, data in enumerate(fs_info_data):
+            fsi = FootSwitchInfo(data, debug=False)
+            for child in fsi.children:
+                print("S{}: {}, {}, {}".format(j+1, child.label[:-1], child.custom_label[:-1], child.led_color))
+
+
+if __name__ == '__main__':
+    main()
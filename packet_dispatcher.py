@@ -0,0 +1,139 @@
+import logging
+log = logging.getLogger(__name__)
+
+
+class PacketSignature:
+	# Compiled form of a pattern as used by HelixUsb.my_byte_cmp ("XX" entries are wildcards). The pattern is
+	# turned into a (mask, value) integer pair once, so matching a packet is a single and/compare.
+	def __init__(self, pattern, length=-1, handler=None, order=0):
+		if length != -1:
+			if len(pattern) < length:
+				raise ValueError('Pattern shorter than given compare length: ' + str(len(pattern)) + ' < ' + str(length))
+			pattern = pattern[:length]
+
+		self.pattern = list(pattern)
+		self.length = len(self.pattern)
+		# my_byte_cmp with length=-1 compares min(len(left), len(right)), so short packets may match a prefix
+		self.strict = length != -1
+		self.handler = handler
+		self.order = order
+
+		mask = bytearray()
+		value = bytearray()
+		for b in self.pattern:
+			if b == "XX":
+				mask.append(0x0)
+				value.append(0x0)
+			else:
+				mask.append(0xff)
+				value.append(b)
+		self.mask = int.from_bytes(mask, 'big')
+		self.value = int.from_bytes(value, 'big')
+		self.key = PacketDispatcher.signature_key(self.pattern)
+
+	def matches(self, data):
+		data_len = len(data)
+		if data_len >= self.length:
+			return int.from_bytes(data[:self.length], 'big') & self.mask == self.value
+		if self.strict or data_len == 0:
+			return False
+		shift = 8 * (self.length - data_len)
+		return int.from_bytes(data, 'big') & (self.mask >> shift) == self.value >> shift
+
+
+class PacketDispatcher:
+	# Resolves an incoming packet to its handler. Signatures are indexed by the fixed header bytes: packet length
+	# (byte 0), channel (byte 6), payload type (byte 11) and the opcode following 0x82 0x69 (bytes 24..26).
+	# Registration order is kept, so the first registered signature wins - just like the former elif chains.
+	LENGTH_POS = 0
+	CHANNEL_POS = 6
+	PAYLOAD_TYPE_POS = 11
+	OPCODE_PREFIX = (0x82, 0x69)
+	OPCODE_POS = 26
+	MAX_CACHED_KEYS = 1024
+	# opcode key of packets too short to carry one
+	SHORT_PACKET = -1
+
+	def __init__(self):
+		self.signatures = []
+		self.candidates_by_key = {}
+
+	@staticmethod
+	def signature_key(pattern):
+		key = []
+		for pos in [PacketDispatcher.LENGTH_POS, PacketDispatcher.CHANNEL_POS, PacketDispatcher.PAYLOAD_TYPE_POS]:
+			if pos < len(pattern) and pattern[pos] != "XX":
+				key.append(pattern[pos])
+			else:
+				key.append(None)
+
+		opcode = None
+		if len(pattern) > PacketDispatcher.OPCODE_POS and \
+				tuple(pattern[PacketDispatcher.OPCODE_POS - 2:PacketDispatcher.OPCODE_POS]) == PacketDispatcher.OPCODE_PREFIX and \
+				pattern[PacketDispatcher.OPCODE_POS] != "XX":
+			opcode = pattern[PacketDispatcher.OPCODE_POS]
+		key.append(opcode)
+		return tuple(key)
+
+	@staticmethod
+	def packet_key(data):
+		data_len = len(data)
+		if data_len <= PacketDispatcher.PAYLOAD_TYPE_POS:
+			return None
+		opcode = None
+		if data_len <= PacketDispatcher.OPCODE_POS:
+			opcode = PacketDispatcher.SHORT_PACKET
+		elif data[PacketDispatcher.OPCODE_POS - 2] == PacketDispatcher.OPCODE_PREFIX[0] and \
+				data[PacketDispatcher.OPCODE_POS - 1] == PacketDispatcher.OPCODE_PREFIX[1]:
+			opcode = data[PacketDispatcher.OPCODE_POS]
+		return (data[PacketDispatcher.LENGTH_POS], data[PacketDispatcher.CHANNEL_POS],
+				data[PacketDispatcher.PAYLOAD_TYPE_POS], opcode)
+
+	def register(self, pattern, length=-1, handler=None):
+		signature = PacketSignature(pattern, length=length, handler=handler, order=len(self.signatures))
+		self.signatures.append(signature)
+		self.candidates_by_key = {}
+		return signature
+
+	def on(self, pattern, length=-1):
+		# decorator used in class bodies, e.g. @packets.on([0x8, 0x0, ...], length=16)
+		def decorator(fct):
+			self.register(pattern, length=length, handler=fct)
+			return fct
+		return decorator
+
+	def _candidates(self, key):
+		candidates = self.candidates_by_key.get(key)
+		if candidates is None:
+			candidates = []
+			for signature in self.signatures:
+				for expected, actual in zip(signature.key, key):
+					if expected is not None and expected != actual:
+						# a short packet may still match the prefix of a non-strict signature
+						if actual != PacketDispatcher.SHORT_PACKET or signature.strict:
+							break
+				else:
+					candidates.append(signature)
+			if len(self.candidates_by_key) >= PacketDispatcher.MAX_CACHED_KEYS:
+				self.candidates_by_key = {}
+			self.candidates_by_key[key] = candidates
+		return candidates
+
+	def match(self, data):
+		key = self.packet_key(data)
+		if key is None:
+			# packet too short to be indexed - fall back to checking every signature in order
+			candidates = self.signatures
+		else:
+			candidates = self._candidates(key)
+
+		for signature in candidates:
+			if signature.matches(data):
+				return signature
+		return None
+
+	def resolve(self, data):
+		signature = self.match(data)
+		if signature is None:
+			return None
+		return signature.handler
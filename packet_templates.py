@@ -0,0 +1,57 @@
+import logging
+log = logging.getLogger(__name__)
+
+
+class Packet(bytearray):
+	# An outgoing packet. Sequenced packets get the channel's next packet number written to SEQUENCE_POS when sent.
+	__slots__ = ('sequenced',)
+
+	def __init__(self, data=b'', sequenced=False):
+		bytearray.__init__(self, data)
+		self.sequenced = sequenced
+
+	@staticmethod
+	def from_list(data):
+		# legacy packet lists with an "XX" placeholder for the packet number
+		sequenced = len(data) > PacketTemplate.SEQUENCE_POS and data[PacketTemplate.SEQUENCE_POS] == "XX"
+		return Packet([0x0 if b == "XX" else b for b in data], sequenced=sequenced)
+
+
+class PacketTemplate:
+	# Preallocated packet with named fields. Fields are given as offset (single byte) or (offset, size) and
+	# are filled while rendering, e.g.:
+	#   SET_COLOR = PacketTemplate([0x1d, 0x0, ..., "XX", ...], fields={'session': (12, 4), 'color_id': 36})
+	#   packet = SET_COLOR.render(session=..., color_id=3)
+	# Rendering copies the preallocated buffer once, packets waiting in the writer queue never share memory.
+	SEQUENCE_POS = 9
+	CHANNEL_POS = 4
+
+	def __init__(self, data, fields=None):
+		template = Packet.from_list(data)
+		self.buffer = bytes(template)
+		self.sequenced = template.sequenced
+		self.channel = template[PacketTemplate.CHANNEL_POS]
+		self.fields = {}
+		for name, field in (fields or {}).items():
+			if isinstance(field, tuple):
+				offset, size = field
+			else:
+				offset, size = field, 1
+			if offset + size > len(self.buffer):
+				raise ValueError('Field ' + name + ' exceeds template length of ' + str(len(self.buffer)))
+			self.fields[name] = (offset, size)
+
+	def __len__(self):
+		return len(self.buffer)
+
+	def render(self, payload=None, **values):
+		packet = Packet(self.buffer, self.sequenced)
+		for name, value in values.items():
+			offset, size = self.fields[name]
+			if size == 1:
+				packet[offset] = value
+			else:
+				packet[offset:offset + size] = value
+		if payload is not None:
+			packet += payload
+		return packet
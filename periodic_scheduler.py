@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import threading
+import time
+import logging
+log = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+	def __init__(self, name, fct, period, deadline):
+		self.name = name
+		self.fct = fct
+		self.period = period
+		self.deadline = deadline
+		self.run_cnt = 0
+
+
+class PeriodicScheduler:
+	# One thread running all periodic traffic (keep-alives, polls). Each task has a deadline; the thread sleeps on a
+	# condition until the earliest one is due. Moving a deadline (touch) only updates the task - the heap entry
+	# is checked against the task when it comes up and pushed again if the deadline has been moved meanwhile.
+	def __init__(self, name='periodic scheduler'):
+		self.name = name
+		self.tasks = {}
+		self.queue = []
+		self.entry_cnt = itertools.count()
+		self.condition = threading.Condition()
+		self.thread = None
+		self.do_run = False
+
+	def start(self):
+		with self.condition:
+			if self.is_running():
+				return
+			self.do_run = True
+			self.thread = threading.Thread(target=self.scheduler_thread_fct, name=self.name, daemon=True)
+			self.thread.start()
+
+	def stop(self, timeout=1.0):
+		with self.condition:
+			self.do_run = False
+			self.tasks = {}
+			self.queue = []
+			self.condition.notify()
+
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout=timeout)
+		self.thread = None
+
+	def is_running(self):
+		return self.do_run and self.thread is not None and self.thread.is_alive()
+
+	def schedule(self, name, fct, period, delay=0.0):
+		# adds a task or replaces the one with the same name
+		with self.condition:
+			task = PeriodicTask(name, fct, period, time.monotonic() + delay)
+			self.tasks[name] = task
+			self._push(task)
+
+	def cancel(self, name):
+		with self.condition:
+			self.tasks.pop(name, None)
+
+	def is_scheduled(self, name):
+		return name in self.tasks
+
+	def touch(self, name):
+		# other traffic on this channel happened - the next run is due one period from now
+		task = self.tasks.get(name)
+		if task is not None:
+			task.deadline = time.monotonic() + task.period
+
+	def _push(self, task):
+		entry = (task.deadline, next(self.entry_cnt), task)
+		heapq.heappush(self.queue, entry)
+		if self.queue[0] is entry:
+			self.condition.notify()
+
+	def _next_due_task(self):
+		# called with condition held, returns None once stopped
+		while self.do_run:
+			if len(self.queue) == 0:
+				self.condition.wait()
+				continue
+
+			deadline, _, task = self.queue[0]
+			if self.tasks.get(task.name) is not task:
+				# cancelled or replaced
+				heapq.heappop(self.queue)
+				continue
+			if task.deadline > deadline:
+				# deadline moved by touch()
+				heapq.heapreplace(self.queue, (task.deadline, next(self.entry_cnt), task))
+				continue
+
+			wait_time = deadline - time.monotonic()
+			if wait_time <= 0:
+				heapq.heappop(self.queue)
+				return task
+			self.condition.wait(wait_time)
+		return None
+
+	def scheduler_thread_fct(self):
+		log.info('Started ' + self.name + ' thread')
+		while True:
+			with self.condition:
+				task = self._next_due_task()
+				if task is None:
+					break
+
+			try:
+				task.fct()
+			except Exception as e:
+				log.error(self.name + ': task ' + task.name + ' failed: ' + str(e))
+			task.run_cnt += 1
+
+			with self.condition:
+				if self.tasks.get(task.name) is task:
+					task.deadline = max(task.deadline, time.monotonic() + task.period)
+					self._push(task)
+		log.info('Stopped ' + self.name + ' thread')
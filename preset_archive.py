@@ -0,0 +1,51 @@
+import json
+import time
+import zipfile
+import logging
+log = logging.getLogger(__name__)
+
+
+class PresetArchive:
+	# Zip archive of raw preset data as received from the device: one entry per preset (presets/<no>.bin) written
+	# as soon as it arrives, index.json with the names and lengths is added on close.
+	INDEX = 'index.json'
+	FORMAT_VERSION = 1
+
+	def __init__(self, path):
+		self.path = path
+		self.zip_file = None
+		self.presets = []
+		self.info = {}
+
+	@staticmethod
+	def entry_name(preset_no):
+		return 'presets/{:03d}.bin'.format(preset_no)
+
+	def open(self, device_serial=None):
+		self.zip_file = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+		self.presets = []
+		self.info = {'format': PresetArchive.FORMAT_VERSION, 'device_serial': device_serial, 'created': time.time()}
+
+	def add(self, preset_no, name, data):
+		entry_name = PresetArchive.entry_name(preset_no)
+		self.zip_file.writestr(entry_name, bytes(data))
+		self.presets.append({'preset_no': preset_no, 'name': name, 'length': len(data), 'entry': entry_name})
+
+	@staticmethod
+	def read(path):
+		# [(preset_no, name, data)] in archive order
+		presets = []
+		with zipfile.ZipFile(path, 'r') as zip_file:
+			index = json.loads(zip_file.read(PresetArchive.INDEX))
+			for preset in index.get('presets', []):
+				presets.append((preset['preset_no'], preset['name'], zip_file.read(preset['entry'])))
+		return presets
+
+	def close(self):
+		if self.zip_file is None:
+			return
+		index = dict(self.info, presets=self.presets)
+		self.zip_file.writestr(PresetArchive.INDEX, json.dumps(index, indent=1))
+		self.zip_file.close()
+		self.zip_file = None
+		log.info('Wrote ' + str(len(self.presets)) + ' presets to ' + str(self.path))
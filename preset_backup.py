@@ -0,0 +1,120 @@
+import threading
+import time
+from event_bus import PresetReceived
+from preset_archive import PresetArchive
+import logging
+log = logging.getLogger(__name__)
+
+
+class PresetBackup:
+	# Downloads presets first..last into a PresetArchive. Each preset is selected by a MIDI program change and
+	# fetched by the usual name/data requests, the next program change goes out as soon as the preset data is
+	# complete (RequestPreset ends on the length announced by the data, not on a timer). Only a lost transfer
+	# waits for the timeout, the preset is requested again then.
+	PRESET_TIMEOUT = 3.0
+	MAX_RETRIES = 2
+	# the device reports the switch itself, which must not restart a fetch which is already running
+	SETTLE_TIME = 0.03
+
+	def __init__(self, helix_usb, path, first=None, last=None, progress_fct=None):
+		self.helix_usb = helix_usb
+		self.path = path
+		self.first = helix_usb.MIDI_PROGRAM_MIN if first is None else first
+		self.last = helix_usb.MIDI_PROGRAM_MAX if last is None else last
+		# called with (done_cnt, total_cnt, preset_no, name, presets_per_second)
+		self.progress_fct = progress_fct
+		self.condition = threading.Condition()
+		self.received = {}
+		self.stopped = False
+		self.failed = []
+
+	def stop(self):
+		with self.condition:
+			self.stopped = True
+			self.condition.notify_all()
+
+	def on_preset_received(self, preset_no, hx_preset):
+		with self.condition:
+			self.received[preset_no] = hx_preset
+			self.condition.notify_all()
+
+	def wait_for_preset(self, preset_no, timeout):
+		deadline = time.monotonic() + timeout
+		with self.condition:
+			while preset_no not in self.received and not self.stopped:
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					return None
+				self.condition.wait(remaining)
+			return self.received.pop(preset_no, None)
+
+	def fetch(self, preset_no):
+		helix_usb = self.helix_usb
+		for attempt in range(PresetBackup.MAX_RETRIES + 1):
+			if attempt == 0:
+				if not helix_usb.send_midi_program_change(preset_no):
+					return None
+			else:
+				log.warning('No data for preset ' + str(preset_no) + ', requesting it again')
+			helix_usb.preset_switched()
+			hx_preset = self.wait_for_preset(preset_no, PresetBackup.PRESET_TIMEOUT)
+			if hx_preset is not None or self.stopped:
+				return hx_preset
+		return None
+
+	def preset_name(self, preset_no, hx_preset):
+		preset_names = self.helix_usb.preset_names
+		if preset_no < len(preset_names) and preset_names[preset_no]:
+			return preset_names[preset_no]
+		return hx_preset.preset_name
+
+	def run(self):
+		# returns the number of presets written to the archive
+		helix_usb = self.helix_usb
+		if not (helix_usb.connected and helix_usb.reconfigured_x1):
+			log.error('Cannot backup presets: device not connected')
+			return 0
+
+		subscriber = helix_usb.event_bus.subscribe(PresetReceived, self.on_preset_received)
+		preset_settle_time = helix_usb.preset_settle_time
+		helix_usb.preset_settle_time = PresetBackup.SETTLE_TIME
+		# the archive gets the data from the device, not the cached copy
+		serve_cached_presets = helix_usb.serve_cached_presets
+		helix_usb.serve_cached_presets = False
+		archive = PresetArchive(self.path)
+		archive.open(helix_usb.device_serial)
+
+		total_cnt = self.last - self.first + 1
+		done_cnt = 0
+		byte_cnt = 0
+		start_time = time.monotonic()
+		try:
+			for preset_no in range(self.first, self.last + 1):
+				hx_preset = self.fetch(preset_no)
+				if self.stopped:
+					log.info('Backup stopped')
+					break
+				if hx_preset is None:
+					log.error('Backup: preset ' + str(preset_no) + ' failed')
+					self.failed.append(preset_no)
+					continue
+
+				name = self.preset_name(preset_no, hx_preset)
+				archive.add(preset_no, name, hx_preset.data_in)
+				done_cnt += 1
+				byte_cnt += len(hx_preset.data_in)
+				rate = done_cnt / max(time.monotonic() - start_time, 1e-6)
+				log.info('Backup {}/{}: preset {} "{}" ({:.2f} presets/s)'.format(
+					done_cnt, total_cnt, preset_no, name, rate))
+				if self.progress_fct is not None:
+					self.progress_fct(done_cnt, total_cnt, preset_no, name, rate)
+		finally:
+			helix_usb.event_bus.unsubscribe(subscriber)
+			helix_usb.preset_settle_time = preset_settle_time
+			helix_usb.serve_cached_presets = serve_cached_presets
+			archive.close()
+
+		elapsed = time.monotonic() - start_time
+		log.info('Backup of {} presets ({} bytes) took {:.2f}s, {:.2f} presets/s, failed: {}'.format(
+			done_cnt, byte_cnt, elapsed, done_cnt / max(elapsed, 1e-6), self.failed))
+		return done_cnt
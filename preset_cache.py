@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import logging
+log = logging.getLogger(__name__)
+
+
+class PresetCache:
+	# On-disk cache of the preset names and preset data of each device, keyed by the device's serial number. A known
+	# device's preset list is available right after connecting, the names transfer only revalidates it. Any error
+	# disables the cache for the session - it is never more than a shortcut.
+	DEFAULT_PATH = os.path.join(
+		os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'helix_usb', 'preset_cache.sqlite')
+
+	SCHEMA = [
+		'CREATE TABLE IF NOT EXISTS preset_names (serial TEXT, preset_no INTEGER, name TEXT, PRIMARY KEY (serial, preset_no))',
+		'CREATE TABLE IF NOT EXISTS preset_data (serial TEXT, preset_no INTEGER, data BLOB, PRIMARY KEY (serial, preset_no))'
+	]
+
+	def __init__(self, path=None):
+		self.path = path or PresetCache.DEFAULT_PATH
+		self.serial = None
+		self.connection = None
+		self.lock = threading.Lock()
+
+	def is_open(self):
+		return self.connection is not None
+
+	def open(self, serial):
+		self.close()
+		try:
+			if self.path != ':memory:':
+				os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+			# used from the reader thread and the ui thread, access is serialized by the lock
+			connection = sqlite3.connect(self.path, check_same_thread=False)
+			for statement in PresetCache.SCHEMA:
+				connection.execute(statement)
+			connection.commit()
+		except (OSError, sqlite3.Error) as e:
+			log.warning('Preset cache unavailable (' + str(self.path) + '): ' + str(e))
+			return False
+		self.connection = connection
+		self.serial = str(serial)
+		log.info('Opened preset cache for device ' + self.serial + ' at ' + str(self.path))
+		return True
+
+	def close(self):
+		with self.lock:
+			if self.connection is not None:
+				self.connection.close()
+			self.connection = None
+			self.serial = None
+
+	def _execute(self, statement, params=(), fetch=False):
+		with self.lock:
+			if self.connection is None:
+				return None
+			try:
+				cursor = self.connection.execute(statement, params)
+				if fetch:
+					return cursor.fetchall()
+				self.connection.commit()
+				return None
+			except sqlite3.Error as e:
+				log.warning('Preset cache disabled after error: ' + str(e))
+				self.connection.close()
+				self.connection = None
+				return None
+
+	def _executemany(self, statements):
+		# list of (statement, params) in one transaction
+		with self.lock:
+			if self.connection is None:
+				return
+			try:
+				with self.connection:
+					for statement, params in statements:
+						self.connection.execute(statement, params)
+			except sqlite3.Error as e:
+				log.warning('Preset cache disabled after error: ' + str(e))
+				self.connection.close()
+				self.connection = None
+
+	def get_preset_names(self, count):
+		# None unless all count names are known
+		rows = self._execute('SELECT preset_no, name FROM preset_names WHERE serial = ? AND preset_no < ? ORDER BY preset_no',
+							 (self.serial, count), fetch=True)
+		if not rows or len(rows) != count:
+			return None
+		return [name for _, name in rows]
+
+	def set_preset_names(self, preset_names):
+		statements = [('DELETE FROM preset_names WHERE serial = ?', (self.serial,))]
+		for preset_no, name in enumerate(preset_names):
+			statements.append(('INSERT INTO preset_names VALUES (?, ?, ?)', (self.serial, preset_no, name)))
+		self._executemany(statements)
+
+	def set_preset_name(self, preset_no, name):
+		self._execute('INSERT OR REPLACE INTO preset_names VALUES (?, ?, ?)', (self.serial, preset_no, name))
+
+	def get_preset_data(self, preset_no):
+		rows = self._execute('SELECT data FROM preset_data WHERE serial = ? AND preset_no = ?',
+							 (self.serial, preset_no), fetch=True)
+		if not rows:
+			return None
+		return bytes(rows[0][0])
+
+	def set_preset_data(self, preset_no, data):
+		self._execute('INSERT OR REPLACE INTO preset_data VALUES (?, ?, ?)', (self.serial, preset_no, bytes(data)))
+
+	def invalidate_preset_data(self, preset_no):
+		self._execute('DELETE FROM preset_data WHERE serial = ? AND preset_no = ?', (self.serial, preset_no))
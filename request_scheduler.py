@@ -0,0 +1,106 @@
+import threading
+import logging
+log = logging.getLogger(__name__)
+
+
+class RequestScheduler:
+	# Runs the request modes. Each mode names the channel it talks on (CHANNEL, None for the connection modes which
+	# need all of them). Requests on different channels run side by side - preset names travel on x1 while preset
+	# name and preset data travel on x80 - requests on the same channel run one after another in request order.
+	# A request equal to one waiting or running is dropped. Exclusive requests stop everything else. A cancelled
+	# request whose transfer is under way keeps its channel until the transfer is drained.
+	def __init__(self, idle_fct=None):
+		# idle_fct is called once nothing is running or waiting any more
+		self.idle_fct = idle_fct
+		self.lock = threading.RLock()
+		self.running = {}
+		self.pending = []
+
+	@staticmethod
+	def is_exclusive(mode):
+		return mode.CHANNEL is None
+
+	def request(self, mode):
+		with self.lock:
+			if self.is_exclusive(mode):
+				self._stop_all()
+				self.running[None] = mode
+				mode.start()
+				return
+
+			running_mode = self.running.get(mode.CHANNEL)
+			if running_mode is not None and type(running_mode) is type(mode) and not running_mode.discarded:
+				log.info('Request ' + mode.name + ' already running')
+				return
+			for pending_mode in self.pending:
+				if type(pending_mode) is type(mode):
+					log.info('Request ' + mode.name + ' already queued')
+					return
+			self.pending.append(mode)
+			self._start_pending()
+
+	def finished(self, mode):
+		# called by a mode once it is done, calls for modes which have been stopped already are ignored
+		with self.lock:
+			if self.running.get(mode.CHANNEL) is not mode:
+				return
+			del self.running[mode.CHANNEL]
+			mode.shutdown()
+			self._start_pending()
+			idle = len(self.running) == 0 and len(self.pending) == 0
+
+		if idle and self.idle_fct is not None:
+			self.idle_fct()
+
+	def cancel(self, mode_types):
+		# drops waiting requests of the given mode classes and stops running ones, without calling idle_fct. Running
+		# modes which still have to drain their transfer discard their result and finish on their own.
+		with self.lock:
+			self.pending = [mode for mode in self.pending if type(mode) not in mode_types]
+			for channel, mode in list(self.running.items()):
+				if type(mode) in mode_types and not mode.discarded:
+					if mode.discard():
+						log.info('Discarding request ' + mode.name + ', draining its transfer')
+						continue
+					log.info('Cancelling request ' + mode.name)
+					del self.running[channel]
+					mode.shutdown()
+			self._start_pending()
+
+	def mode_for_channel(self, channel):
+		# mode which gets the incoming packets of channel, None if no request is using it
+		running = self.running
+		mode = running.get(None)
+		if mode is None:
+			mode = running.get(channel)
+		return mode
+
+	def is_busy(self):
+		with self.lock:
+			return len(self.running) != 0 or len(self.pending) != 0
+
+	def stop(self):
+		with self.lock:
+			self._stop_all()
+
+	def _stop_all(self):
+		for mode in list(self.running.values()):
+			try:
+				mode.shutdown()
+			except Exception as e:
+				log.warning('Failed to shutdown mode ' + mode.name + ': ' + str(e))
+		self.running = {}
+		self.pending = []
+
+	def _start_pending(self):
+		if None in self.running:
+			return
+		blocked = set()
+		for mode in list(self.pending):
+			if mode.CHANNEL in self.running or mode.CHANNEL in blocked:
+				# keeps the order per channel
+				blocked.add(mode.CHANNEL)
+				continue
+			self.pending.remove(mode)
+			self.running[mode.CHANNEL] = mode
+			mode.start()
@@ -0,0 +1,209 @@
+import struct
+import threading
+import time
+import logging
+log = logging.getLogger(__name__)
+
+
+class SessionCapture:
+	# Append-only binary recording of the USB traffic, cheap enough to stay on during gigs. The file starts with a
+	# header followed by records:
+	#   header: magic, version, header size, wall clock time of the start in ns
+	#   record: data length, timestamp in ns since the start (monotonic), kind, endpoint, reserved, data
+	# Every INDEX_INTERVAL packet records an index record follows, its data holds the number, timestamp and file
+	# offset of the first record of the block it closes. close() appends all of them once more as an index table
+	# record and ends the file with a footer pointing to it, so a reader finds the blocks without walking the file
+	# and can seek by time. Captures which haven't been closed lack the table, their index records are still found
+	# by walking the record headers. record() only packs the record header and appends both parts to a buffered file.
+	MAGIC = b'HXCAP\r\n\x1a'
+	VERSION = 2
+	HEADER = struct.Struct('<8sHHIq')
+	RECORD = struct.Struct('<IqBBH')
+	INDEX = struct.Struct('<QqQ')
+	# footer: magic, offset of the index table record
+	FOOTER_MAGIC = b'HXCAPIDX'
+	FOOTER = struct.Struct('<8sQ')
+
+	OUT = 0
+	IN = 1
+	INDEX_RECORD = 2
+	INDEX_TABLE = 3
+
+	INDEX_INTERVAL = 1024
+	BUFFER_SIZE = 1024 * 1024
+
+	def __init__(self, path):
+		self.path = path
+		self.file = None
+		self.lock = threading.Lock()
+		self.start_ns = 0
+		self.offset = 0
+		self.record_cnt = 0
+		self.byte_cnt = 0
+		self.last_timestamp = 0
+		# first record of the current index block: (record no, timestamp, offset)
+		self.block_start = None
+		self.blocks = []
+
+	def open(self):
+		self.file = open(self.path, 'wb', buffering=SessionCapture.BUFFER_SIZE)
+		self.start_ns = time.monotonic_ns()
+		header = SessionCapture.HEADER.pack(
+			SessionCapture.MAGIC, SessionCapture.VERSION, SessionCapture.HEADER.size, 0, time.time_ns())
+		self.file.write(header)
+		self.offset = len(header)
+		self.record_cnt = 0
+		self.byte_cnt = 0
+		self.block_start = None
+		self.blocks = []
+		log.info('Capturing USB traffic to ' + str(self.path))
+		return self
+
+	def record(self, kind, endpoint, data, timestamp_ns=None):
+		# timestamp_ns: time since the start of the capture, given when converting recorded traffic
+		with self.lock:
+			if self.file is None:
+				return
+			# taken with the lock held, so the records of the reader and writer threads are in timestamp order
+			timestamp = time.monotonic_ns() - self.start_ns if timestamp_ns is None else timestamp_ns
+			if self.block_start is None:
+				self.block_start = (self.record_cnt, timestamp, self.offset)
+			self.file.write(SessionCapture.RECORD.pack(len(data), timestamp, kind, endpoint, 0))
+			self.file.write(data)
+			self.offset += SessionCapture.RECORD.size + len(data)
+			self.record_cnt += 1
+			self.byte_cnt += len(data)
+			self.last_timestamp = timestamp
+			if self.record_cnt % SessionCapture.INDEX_INTERVAL == 0:
+				self.write_index(timestamp)
+
+	def write_index(self, timestamp):
+		# called with the lock held, the index block also flushes the buffered packets
+		self.blocks.append(self.block_start)
+		index = SessionCapture.INDEX.pack(*self.block_start)
+		self.file.write(SessionCapture.RECORD.pack(len(index), timestamp, SessionCapture.INDEX_RECORD, 0, 0))
+		self.file.write(index)
+		self.offset += SessionCapture.RECORD.size + len(index)
+		self.block_start = None
+		self.file.flush()
+
+	def write_index_table(self):
+		table = b''.join(SessionCapture.INDEX.pack(*block) for block in self.blocks)
+		self.file.write(SessionCapture.RECORD.pack(len(table), self.last_timestamp, SessionCapture.INDEX_TABLE, 0, 0))
+		self.file.write(table)
+		self.file.write(SessionCapture.FOOTER.pack(SessionCapture.FOOTER_MAGIC, self.offset))
+		self.offset += SessionCapture.RECORD.size + len(table) + SessionCapture.FOOTER.size
+
+	def close(self):
+		with self.lock:
+			if self.file is None:
+				return
+			if self.block_start is not None:
+				self.write_index(self.last_timestamp)
+			self.write_index_table()
+			self.file.close()
+			self.file = None
+		log.info('Captured {} packet(s), {} bytes to {}'.format(self.record_cnt, self.byte_cnt, self.path))
+
+
+class SessionCaptureReader:
+	# Reads a SessionCapture file: for kind, endpoint, timestamp_ns, data in SessionCaptureReader(path): ...
+	# A record cut off at the end (capture not closed) ends the iteration.
+	def __init__(self, path):
+		self.path = path
+		self.version = 0
+		self.start_time_ns = 0
+
+	def read_header(self, file):
+		header = file.read(SessionCapture.HEADER.size)
+		if len(header) < SessionCapture.HEADER.size:
+			raise ValueError('Not a session capture: ' + str(self.path))
+		magic, self.version, header_size, _, self.start_time_ns = SessionCapture.HEADER.unpack(header)
+		if magic != SessionCapture.MAGIC:
+			raise ValueError('Not a session capture: ' + str(self.path))
+		if self.version > SessionCapture.VERSION:
+			raise ValueError('Unsupported session capture version ' + str(self.version))
+		file.seek(header_size)
+
+	def records(self, include_index=False, offset=None):
+		# offset: file offset of a record to start at (see index()), default is the first record
+		with open(self.path, 'rb', buffering=SessionCapture.BUFFER_SIZE) as file:
+			self.read_header(file)
+			if offset is not None:
+				file.seek(offset)
+			record_size = SessionCapture.RECORD.size
+			while True:
+				record = file.read(record_size)
+				if len(record) < record_size:
+					break
+				length, timestamp, kind, endpoint, _ = SessionCapture.RECORD.unpack(record)
+				if kind == SessionCapture.INDEX_TABLE:
+					# last record, the footer follows
+					break
+				data = file.read(length)
+				if len(data) < length:
+					log.warning('Session capture ends within a record: ' + str(self.path))
+					break
+				if kind == SessionCapture.INDEX_RECORD and not include_index:
+					continue
+				yield kind, endpoint, timestamp, data
+
+	def __iter__(self):
+		return self.records()
+
+	def records_from(self, timestamp_ns):
+		# the records from timestamp_ns on, only the index block holding it is read from its start
+		offset = None
+		for _, block_timestamp, block_offset in self.index():
+			if block_timestamp > timestamp_ns:
+				break
+			offset = block_offset
+		for kind, endpoint, timestamp, data in self.records(offset=offset):
+			if timestamp >= timestamp_ns:
+				yield kind, endpoint, timestamp, data
+
+	def index(self):
+		# [(record no, timestamp_ns, offset)] of every index block. Read from the index table of a closed capture,
+		# otherwise the record headers are walked.
+		with open(self.path, 'rb') as file:
+			self.read_header(file)
+			header_end = file.tell()
+			blocks = self.read_index_table(file)
+			if blocks is not None:
+				return blocks
+
+			blocks = []
+			file.seek(header_end)
+			record_size = SessionCapture.RECORD.size
+			while True:
+				record = file.read(record_size)
+				if len(record) < record_size:
+					break
+				length, _, kind, _, _ = SessionCapture.RECORD.unpack(record)
+				if kind == SessionCapture.INDEX_RECORD and length == SessionCapture.INDEX.size:
+					index = file.read(length)
+					if len(index) < length:
+						break
+					blocks.append(SessionCapture.INDEX.unpack(index))
+				else:
+					file.seek(length, 1)
+			return blocks
+
+	def read_index_table(self, file):
+		# None if the capture has no footer (older version or not closed)
+		header_end = file.tell()
+		size = file.seek(0, 2)
+		if size < header_end + SessionCapture.RECORD.size + SessionCapture.FOOTER.size:
+			return None
+		file.seek(size - SessionCapture.FOOTER.size)
+		magic, offset = SessionCapture.FOOTER.unpack(file.read(SessionCapture.FOOTER.size))
+		if magic != SessionCapture.FOOTER_MAGIC or not header_end <= offset <= size - SessionCapture.FOOTER.size:
+			return None
+		file.seek(offset)
+		length, _, kind, _, _ = SessionCapture.RECORD.unpack(file.read(SessionCapture.RECORD.size))
+		if kind != SessionCapture.INDEX_TABLE or length % SessionCapture.INDEX.size:
+			return None
+		table = file.read(length)
+		if len(table) < length:
+			return None
+		return list(SessionCapture.INDEX.iter_unpack(table))
@@ -0,0 +1,172 @@
+import getopt
+import json
+import os
+import struct
+import sys
+import logging
+
+from excel_logger import ExcelLogger
+from session_capture import SessionCapture, SessionCaptureReader
+
+log = logging.getLogger(__name__)
+
+
+class CaptureConverter:
+    # Offline conversion of a SessionCapture (-c option of helix_usb.py) to
+    #   xlsx:   the ExcelLogger sheets (all, x1x10, x2x10, x80x10) with the same colours
+    #   pcapng: Linux usbmon bulk transfers (LINKTYPE_USB_LINUX_MMAPPED), readable by Wireshark
+    #   replay: request/answer exchanges as JSON for VirtualHelix.replay() (virtual_device.py -r)
+    LINKTYPE_USB_LINUX_MMAPPED = 220
+    USBMON_HEADER = struct.Struct('<QBBBBHbbqiiII8siiII')
+    USB_TRANSFER_BULK = 3
+    USB_DEVICE_NO = 1
+    USB_BUS_NO = 1
+    # acks and keep-alives
+    SHORT_PACKET_LENGTH = 16
+
+    def __init__(self, capture_path):
+        self.capture_path = capture_path
+        self.reader = SessionCaptureReader(capture_path)
+
+    @staticmethod
+    def channel(kind, data):
+        # x1, x2 or x80 channel of a packet on endpoint 0x1/0x81, None for too short packets
+        pos = 4 if kind == SessionCapture.OUT else 6
+        if len(data) <= pos:
+            return None
+        return data[pos]
+
+    def to_xlsx(self, xlsx_path):
+        excel_logger = ExcelLogger(xlsx_path)
+        # capture timestamps count from the start of the capture
+        excel_logger.session_start_time = 0.0
+        count = 0
+        for kind, endpoint, timestamp, data in self.reader:
+            if endpoint == 0x2:
+                # MIDI endpoint, no sheet for it
+                continue
+            excel_logger.log(data, timestamp=timestamp / 1e9, wait=True)
+            count += 1
+        excel_logger.save()
+        log.info('Wrote ' + str(count) + ' packets to ' + xlsx_path)
+        return count
+
+    @staticmethod
+    def pcapng_block(block_type, body):
+        padding = bytes(-len(body) % 4)
+        length = 12 + len(body) + len(padding)
+        return struct.pack('<II', block_type, length) + body + padding + struct.pack('<I', length)
+
+    @staticmethod
+    def pcapng_option(code, value):
+        return struct.pack('<HH', code, len(value)) + value + bytes(-len(value) % 4)
+
+    def to_pcapng(self, pcapng_path):
+        count = 0
+        with open(pcapng_path, 'wb') as file:
+            # section header block, byte order magic, version 1.0, unknown section length
+            file.write(self.pcapng_block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1)))
+            # interface description block with ns timestamps (if_tsresol = 9)
+            options = self.pcapng_option(9, bytes([9])) + self.pcapng_option(0, b'')
+            file.write(self.pcapng_block(0x1, struct.pack('<HHI', self.LINKTYPE_USB_LINUX_MMAPPED, 0, 0) + options))
+
+            for kind, endpoint, timestamp, data in self.reader:
+                # the header is read by now
+                time_ns = self.reader.start_time_ns + timestamp
+                # OUT transfers are captured on submit, IN transfers on completion (that's where they carry data)
+                event = b'S' if kind == SessionCapture.OUT else b'C'
+                header = self.USBMON_HEADER.pack(
+                    count, event[0], self.USB_TRANSFER_BULK, endpoint, self.USB_DEVICE_NO, self.USB_BUS_NO,
+                    ord('-'), 0, time_ns // 1000000000, (time_ns % 1000000000) // 1000, 0, len(data), len(data),
+                    bytes(8), 0, 0, 0, 0)
+                packet = header + data
+                body = struct.pack('<IIIII', 0, time_ns >> 32, time_ns & 0xffffffff, len(packet), len(packet))
+                file.write(self.pcapng_block(0x6, body + packet))
+                count += 1
+        log.info('Wrote ' + str(count) + ' packets to ' + pcapng_path)
+        return count
+
+    def to_replay(self, replay_path):
+        # every host packet opens an exchange, the device packets on its channel up to the next host packet on
+        # that channel are its answers (with their delay). Data packets following an ack or keep-alive still belong
+        # to the last request carrying a payload, the device streams them regardless of the acks.
+        exchanges = []
+        open_exchanges = {}
+        open_requests = {}
+        for kind, endpoint, timestamp, data in self.reader:
+            if endpoint == 0x2:
+                continue
+            channel = self.channel(kind, data)
+            if channel is None:
+                continue
+            if kind == SessionCapture.OUT:
+                exchange = {'request': data.hex(), 'responses': [], 'time': timestamp}
+                exchanges.append(exchange)
+                open_exchanges[channel] = exchange
+                if len(data) > self.SHORT_PACKET_LENGTH:
+                    open_requests[channel] = exchange
+            else:
+                exchange = open_exchanges.get(channel)
+                if len(data) > self.SHORT_PACKET_LENGTH and exchange is not None and \
+                        len(exchange['request']) <= 2 * self.SHORT_PACKET_LENGTH:
+                    exchange = open_requests.get(channel, exchange)
+                if exchange is None:
+                    # device packet before any host packet on the channel
+                    continue
+                delay_ms = round((timestamp - exchange['time']) / 1e6, 3)
+                exchange['responses'].append([delay_ms, data.hex()])
+
+        for exchange in exchanges:
+            del exchange['time']
+        with open(replay_path, 'w', encoding='utf-8') as file:
+            json.dump({'format': 1, 'source': os.path.basename(self.capture_path), 'exchanges': exchanges}, file,
+                      indent=1)
+        log.info('Wrote ' + str(len(exchanges)) + ' exchanges to ' + replay_path)
+        return len(exchanges)
+
+
+def print_usage(args):
+    print(args[0] + ' -i <capture> [-x <out.xlsx>] [-p <out.pcapng>] [-r <replay.json>]')
+    sys.exit(2)
+
+
+def main(args):
+    logging.basicConfig(
+        level='INFO',
+        format="%(asctime)s - %(levelname)s - %(message)s (%(name)s)",
+        datefmt="%Y-%m-%d %H:%M:%S")
+
+    capture_path = None
+    xlsx_path = pcapng_path = replay_path = None
+    try:
+        opts, _ = getopt.getopt(args[1:], "hi:x:p:r:")
+    except getopt.GetoptError:
+        print_usage(args)
+    for opt, arg in opts:
+        if opt == '-i':
+            capture_path = arg
+        elif opt == '-x':
+            xlsx_path = arg
+        elif opt == '-p':
+            pcapng_path = arg
+        elif opt == '-r':
+            replay_path = arg
+        else:
+            print_usage(args)
+
+    if capture_path is None:
+        print_usage(args)
+    if xlsx_path is None and pcapng_path is None and replay_path is None:
+        xlsx_path = capture_path + '.xlsx'
+
+    converter = CaptureConverter(capture_path)
+    if xlsx_path is not None:
+        converter.to_xlsx(xlsx_path)
+    if pcapng_path is not None:
+        converter.to_pcapng(pcapng_path)
+    if replay_path is not None:
+        converter.to_replay(replay_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
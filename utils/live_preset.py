@@ -0,0 +1,83 @@
+import threading
+import logging
+from utils.preset_parser import SlotInfo
+log = logging.getLogger(__name__)
+
+
+class LiveSlot:
+    def __init__(self, slot_no, slot_info=None):
+        self.slot_no = slot_no
+        self.slot_type = -1
+        self.module_id = b'\xff'
+        self.enabled = None
+        self.trails = None
+        self.parameters = []
+        if slot_info is not None:
+            self.slot_type = slot_info.slot_type
+            self.module_id = slot_info.amp_effect_slot_a
+            self.enabled = slot_info.enabled
+            self.parameters = self.read_parameters(slot_info)
+
+    @staticmethod
+    def read_parameters(slot_info):
+        # the parameters a knob on the device changes: module A of a standard slot, the block itself otherwise
+        # (SlotInfo.parameter_a would add the IR data)
+        if slot_info.slot_type == SlotInfo.STANDARD_SLOT:
+            return SlotInfo.read_params(slot_info.content.get(SlotInfo.INFO_SLOT_A))
+        return slot_info.parameter_b
+
+
+class LivePreset:
+    # Parameters of the current preset, seeded from the last parsed HxPreset and kept up to date with the value
+    # changes the device reports while knobs are turned, so these need no refetch of the preset data.
+    def __init__(self):
+        self.preset_no = -1
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def seed(self, preset_no, hx_preset):
+        slots = {}
+        for slot_no, slot_info in enumerate(hx_preset.slot_info):
+            slots[slot_no] = LiveSlot(slot_no, slot_info)
+        with self.lock:
+            self.preset_no = preset_no
+            self.slots = slots
+
+    def clear(self):
+        with self.lock:
+            self.preset_no = -1
+            self.slots = {}
+
+    def slot(self, slot_no):
+        # called with the lock held, slots unknown so far are added empty
+        slot = self.slots.get(slot_no)
+        if slot is None:
+            slot = LiveSlot(slot_no)
+            self.slots[slot_no] = slot
+        return slot
+
+    def set_parameter(self, slot_no, parameter_idx, value):
+        # returns the previous value, None if it wasn't known
+        with self.lock:
+            parameters = self.slot(slot_no).parameters
+            if parameter_idx >= len(parameters):
+                parameters.extend([None] * (parameter_idx + 1 - len(parameters)))
+            old_value = parameters[parameter_idx]
+            parameters[parameter_idx] = value
+        return old_value
+
+    def set_trails(self, slot_no, trails):
+        with self.lock:
+            self.slot(slot_no).trails = trails
+
+    def parameter(self, slot_no, parameter_idx):
+        with self.lock:
+            slot = self.slots.get(slot_no)
+            if slot is None or parameter_idx >= len(slot.parameters):
+                return None
+            return slot.parameters[parameter_idx]
+
+    def parameters(self, slot_no):
+        with self.lock:
+            slot = self.slots.get(slot_no)
+            return list(slot.parameters) if slot is not None else []
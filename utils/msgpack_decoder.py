@@ -0,0 +1,334 @@
+import struct
+
+_FLOAT32 = struct.Struct('>f').unpack_from
+_FLOAT64 = struct.Struct('>d').unpack_from
+_UINT16 = struct.Struct('>H').unpack_from
+_UINT32 = struct.Struct('>I').unpack_from
+_UINT64 = struct.Struct('>Q').unpack_from
+_INT8 = struct.Struct('>b').unpack_from
+_INT16 = struct.Struct('>h').unpack_from
+_INT32 = struct.Struct('>i').unpack_from
+_INT64 = struct.Struct('>q').unpack_from
+
+# fixed payload size of the scalar types
+_SCALAR_SIZE = {
+    0xc0: 0, 0xc2: 0, 0xc3: 0,
+    0xca: 4, 0xcb: 8,
+    0xcc: 1, 0xcd: 2, 0xce: 4, 0xcf: 8,
+    0xd0: 1, 0xd1: 2, 0xd2: 4, 0xd3: 8
+}
+
+
+def _build_skip_table():
+    # per type byte: size of the whole object for scalars and fixstr, -(n + 1) for fixmap/fixarray with n child
+    # objects, 0 for the types with a length field
+    table = [0] * 256
+    for t in range(256):
+        if t < 0x80 or t >= 0xe0:
+            table[t] = 1
+        elif t < 0x90:
+            table[t] = -((t & 0x0f) << 1) - 1
+        elif t < 0xa0:
+            table[t] = -(t & 0x0f) - 1
+        elif t < 0xc0:
+            table[t] = 1 + (t & 0x1f)
+        elif t in _SCALAR_SIZE:
+            table[t] = 1 + _SCALAR_SIZE[t]
+    return tuple(table)
+
+
+_SKIP_TABLE = _build_skip_table()
+
+
+class MsgPackDecodeError(ValueError):
+    def __init__(self, msg, pos):
+        ValueError.__init__(self, msg + ' at offset ' + str(pos))
+        self.pos = pos
+
+
+class MsgPackDecoder:
+    # Cursor based decoder for the MessagePack encoding used by the preset data. All methods take the offset of an
+    # encoded object and return offsets, so a caller can jump straight to the part it needs (skip() walks over
+    # objects without creating them) or decode a subtree into plain python objects:
+    #   maps -> dict, arrays -> list, str -> bytes, bin -> memoryview, nil -> None, bool, int and float
+    def __init__(self, data):
+        # bytes indexing is a lot faster than memoryview indexing, other buffers are copied once
+        self.buf = data if isinstance(data, bytes) else bytes(data)
+        self.view = memoryview(self.buf)
+
+    def __len__(self):
+        return len(self.buf)
+
+    def decode(self, pos=0):
+        # returns (object, offset behind the object)
+        out = []
+        end = self._decode_checked(pos, 1, out)
+        return out[0], end
+
+    def decode_all(self, pos=0, end=None):
+        # decodes all objects between pos and end in one pass
+        if end is None:
+            end = len(self.buf)
+        out = []
+        while pos < end:
+            pos = self._decode_checked(pos, 1, out)
+        if pos != end:
+            raise MsgPackDecodeError('Object exceeds given end ' + str(end), pos)
+        return out
+
+    def skip(self, pos, count=1):
+        # returns the offset behind the next count objects
+        buf = self.buf
+        start = pos
+        try:
+            while count:
+                size = _SKIP_TABLE[buf[pos]]
+                count -= 1
+                if size > 0:
+                    pos += size
+                elif size < 0:
+                    count -= size + 1
+                    pos += 1
+                else:
+                    t = buf[pos]
+                    pos += 1
+                    if t == 0xda or t == 0xc5:
+                        pos += 2 + _UINT16(buf, pos)[0]
+                    elif t == 0xdc:
+                        count += _UINT16(buf, pos)[0]
+                        pos += 2
+                    elif t == 0xc4 or t == 0xd9:
+                        pos += 1 + buf[pos]
+                    elif t == 0xc6 or t == 0xdb:
+                        pos += 4 + _UINT32(buf, pos)[0]
+                    elif t == 0xdd:
+                        count += _UINT32(buf, pos)[0]
+                        pos += 4
+                    elif t == 0xde:
+                        count += _UINT16(buf, pos)[0] << 1
+                        pos += 2
+                    elif t == 0xdf:
+                        count += _UINT32(buf, pos)[0] << 1
+                        pos += 4
+                    else:
+                        raise MsgPackDecodeError('Unsupported type 0x{:02x}'.format(t), pos - 1)
+        except (IndexError, struct.error):
+            raise MsgPackDecodeError('Truncated data', start)
+        if pos > len(buf):
+            raise MsgPackDecodeError('Truncated data', start)
+        return pos
+
+    def raw(self, pos):
+        # encoded bytes of the object at pos
+        size = _SKIP_TABLE[self.buf[pos]]
+        if size > 0 and pos + size <= len(self.buf):
+            return self.buf[pos:pos + size]
+        return self.buf[pos:self.skip(pos)]
+
+    def container(self, pos):
+        # returns (is_map, number of entries, offset of the first entry) of the map or array at pos
+        buf = self.buf
+        if pos >= len(buf):
+            raise MsgPackDecodeError('Truncated data', pos)
+        t = buf[pos]
+        if 0x80 <= t < 0x90:
+            return True, t & 0x0f, pos + 1
+        if 0x90 <= t < 0xa0:
+            return False, t & 0x0f, pos + 1
+        if t == 0xde or t == 0xdc:
+            return t == 0xde, _UINT16(buf, pos + 1)[0], pos + 3
+        if t == 0xdf or t == 0xdd:
+            return t == 0xdf, _UINT32(buf, pos + 1)[0], pos + 5
+        raise MsgPackDecodeError('Expected map or array, got type 0x{:02x}'.format(t), pos)
+
+    def map_positions(self, pos):
+        # decoded keys -> offsets of their (not decoded) values
+        is_map, count, pos = self.container(pos)
+        if not is_map:
+            raise MsgPackDecodeError('Expected map', pos)
+        buf = self.buf
+        positions = {}
+        for _ in range(count):
+            key = buf[pos]
+            if key < 0x80:
+                pos += 1
+            else:
+                key, pos = self.decode(pos)
+            try:
+                positions[key] = pos
+            except TypeError:
+                raise MsgPackDecodeError('Unhashable map key', pos)
+            pos = self.skip(pos)
+        return positions
+
+    def find_key(self, pos, key):
+        # offset of the value of key in the map at pos, only the entries in front of it are skipped
+        buf = self.buf
+        t = buf[pos]
+        if 0x80 <= t < 0x90:
+            count = t & 0x0f
+            pos += 1
+        else:
+            is_map, count, pos = self.container(pos)
+            if not is_map:
+                raise MsgPackDecodeError('Expected map', pos)
+        for _ in range(count):
+            if buf[pos] == key:
+                return pos + 1
+            # fast path for the usual fixint key with a scalar value
+            size = _SKIP_TABLE[buf[pos + 1]] if buf[pos] < 0x80 else 0
+            if size > 0:
+                pos += 1 + size
+            else:
+                pos = self.skip(pos, 2)
+        raise KeyError(key)
+
+    def array_positions(self, pos):
+        # offsets of the array elements
+        is_map, count, pos = self.container(pos)
+        if is_map:
+            raise MsgPackDecodeError('Expected array', pos)
+        positions = []
+        for _ in range(count):
+            positions.append(pos)
+            pos = self.skip(pos)
+        return positions
+
+    def str_span(self, pos):
+        # (start, end) of the payload of the str or bin object at pos
+        buf = self.buf
+        t = buf[pos]
+        if 0xa0 <= t < 0xc0:
+            size, start = t & 0x1f, pos + 1
+        elif t == 0xd9 or t == 0xc4:
+            size, start = buf[pos + 1], pos + 2
+        elif t == 0xda or t == 0xc5:
+            size, start = _UINT16(buf, pos + 1)[0], pos + 3
+        elif t == 0xdb or t == 0xc6:
+            size, start = _UINT32(buf, pos + 1)[0], pos + 5
+        else:
+            raise MsgPackDecodeError('Expected str or bin, got type 0x{:02x}'.format(t), pos)
+        if start + size > len(buf):
+            raise MsgPackDecodeError('Truncated data', pos)
+        return start, start + size
+
+    def _decode_checked(self, pos, count, out):
+        try:
+            end = self._decode_items(pos, count, out)
+        except (IndexError, struct.error):
+            raise MsgPackDecodeError('Truncated data', pos)
+        if end > len(self.buf):
+            raise MsgPackDecodeError('Truncated data', pos)
+        return end
+
+    def _decode_items(self, pos, count, out):
+        # appends count decoded objects to out and returns the offset behind them. Scalars are decoded inline,
+        # only maps and arrays recurse. The most frequent types in preset data are checked first.
+        buf = self.buf
+        append = out.append
+        for _ in range(count):
+            t = buf[pos]
+            pos += 1
+            if t < 0x80:
+                append(t)
+            elif t < 0x90:
+                items = []
+                pos = self._decode_items(pos, (t & 0x0f) << 1, items)
+                append(self._to_dict(items, pos))
+            elif t < 0xa0:
+                items = []
+                pos = self._decode_items(pos, t & 0x0f, items)
+                append(items)
+            elif t < 0xc0:
+                size = t & 0x1f
+                append(buf[pos:pos + size])
+                pos += size
+            elif t == 0xca:
+                append(_FLOAT32(buf, pos)[0])
+                pos += 4
+            elif t == 0xc2:
+                append(False)
+            elif t == 0xc3:
+                append(True)
+            elif t >= 0xe0:
+                append(t - 0x100)
+            elif t == 0xcd:
+                append(_UINT16(buf, pos)[0])
+                pos += 2
+            elif t == 0xcc:
+                append(buf[pos])
+                pos += 1
+            elif t == 0xc0:
+                append(None)
+            elif t == 0xda:
+                size = _UINT16(buf, pos)[0]
+                pos += 2
+                append(buf[pos:pos + size])
+                pos += size
+            elif t == 0xdc:
+                items = []
+                pos = self._decode_items(pos + 2, _UINT16(buf, pos)[0], items)
+                append(items)
+            else:
+                pos = self._decode_rare(t, pos, append)
+        return pos
+
+    def _decode_rare(self, t, pos, append):
+        buf = self.buf
+        if t == 0xce:
+            append(_UINT32(buf, pos)[0])
+            return pos + 4
+        if t == 0xcf:
+            append(_UINT64(buf, pos)[0])
+            return pos + 8
+        if t == 0xd0:
+            append(_INT8(buf, pos)[0])
+            return pos + 1
+        if t == 0xd1:
+            append(_INT16(buf, pos)[0])
+            return pos + 2
+        if t == 0xd2:
+            append(_INT32(buf, pos)[0])
+            return pos + 4
+        if t == 0xd3:
+            append(_INT64(buf, pos)[0])
+            return pos + 8
+        if t == 0xcb:
+            append(_FLOAT64(buf, pos)[0])
+            return pos + 8
+        if t == 0xd9:
+            start, end = pos + 1, pos + 1 + buf[pos]
+            append(buf[start:end])
+            return end
+        if t == 0xdb:
+            start = pos + 4
+            end = start + _UINT32(buf, pos)[0]
+            append(buf[start:end])
+            return end
+        if t in (0xc4, 0xc5, 0xc6):
+            start = pos + (1, 2, 4)[t - 0xc4]
+            end = start + int.from_bytes(buf[pos:start], 'big')
+            if end > len(buf):
+                raise IndexError()
+            append(self.view[start:end])
+            return end
+        if t == 0xdd:
+            items = []
+            pos = self._decode_items(pos + 4, _UINT32(buf, pos)[0], items)
+            append(items)
+            return pos
+        if t == 0xde or t == 0xdf:
+            size = 2 if t == 0xde else 4
+            items = []
+            pos = self._decode_items(pos + size, int.from_bytes(buf[pos:pos + size], 'big') << 1, items)
+            append(self._to_dict(items, pos))
+            return pos
+        raise MsgPackDecodeError('Unsupported type 0x{:02x}'.format(t), pos - 1)
+
+    @staticmethod
+    def _to_dict(items, pos):
+        it = iter(items)
+        try:
+            return dict(zip(it, it))
+        except TypeError:
+            raise MsgPackDecodeError('Unhashable map key', pos)
@@ -1,10 +1,16 @@
+import collections
 import csv
+import getopt
+import multiprocessing
 import re
 import sys
-import xlsxwriter
 import logging
 import os
 
+from session_capture import SessionCapture
+from utils.pcapng_reader import UsbUrb
+from utils.pcapng_to_xlsx import PcapngToXlsx
+
 log = logging.getLogger(__name__)
 
 
@@ -26,189 +32,145 @@ def extract_data(data_lines):
 	return local_data
 
 
-def export_all_endpoints(path_wireshark_dump, path_out_xlsx):
-	with open(path_wireshark_dump) as csv_file:
-		wireshark_dump_csv_reader = csv.reader(csv_file, delimiter=',')
-		workbook = xlsxwriter.Workbook(path_out_xlsx)
-		format_x1_x10 = workbook.add_format()
-		format_x2_x10 = workbook.add_format()
-		format_x80_x10 = workbook.add_format()
-
-		format_x1_x10.set_pattern(1)
-		format_x2_x10.set_pattern(1)
-		format_x80_x10.set_pattern(1)
-		format_x1_x10.set_bg_color('edf0e0')
-		format_x2_x10.set_bg_color('f5c9ce')
-		format_x80_x10.set_bg_color('fbeaa5')
-
-		worksheet_all_ports = workbook.add_worksheet("all")
-		worksheet_x1x10 = workbook.add_worksheet("x1x10")
-		worksheet_x2x10 = workbook.add_worksheet("x2x10")
-		worksheet_x80x10 = workbook.add_worksheet("x80x10")
-
-		data_from_kpa = []
-		current_frame_no = 0
-		current_endpoint_address = 0
-		current_time = 0
-		capture_data_line_detected = False
-		packet_data_recorder = []
-
-		endpoint_x1_times = [0, 0, 0]
-		endpoint_x81_times = [0, 0, 0]
-
-		xlsx_row_num = 0
-		x1_x10_row_num = 0
-		x2_x10_row_num = 0
-		x80_x10_row_num = 0
-		for row in wireshark_dump_csv_reader:
-
-			if len(row) == 0:
-				continue
-			str_row = row[0]
-
-			x = re.search("([0-9]+)\s([0-9]+.[0-9]+).+host.+USB", str_row)
+# Wireshark text export ("Export Packet Dissections" as plain text): every packet starts with the summary header
+# line, the captured data follows 'Leftover Capture Data: ' as hex dump. The first 27 bytes of the dump are the
+# USBPcap header.
+FRAME_HEADER = 'No.     Time'
+CAPTURE_DATA = 'Leftover Capture Data: '
+ENDPOINT_FIELD = '    Endpoint: '
+USBPCAP_HEADER_LENGTH = 27
+ENDPOINTS = {'0x01': 0x01, '0x81': 0x81}
+TIME_LINE = re.compile("([0-9]+)\\s([0-9]+.[0-9]+).+host.+USB")
+HEX_LINE = re.compile("([0-9a-fA-F]{4})  ([0-9a-f ]+)   (.+)")
+
+# bytes of the dump per chunk, chunks in flight per worker process
+CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKS_PER_WORKER = 2
+
+
+def chunk_ranges(path_wireshark_dump, chunk_size=CHUNK_SIZE):
+	# (start, end) byte ranges covering the dump, a chunk holds the frames whose header line starts in its range
+	size = os.path.getsize(path_wireshark_dump)
+	return [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def read_range(path_wireshark_dump, start, end):
+	# lines of the frames whose header line begins within start..end
+	frame_header = FRAME_HEADER.encode()
+	lines = []
+	with open(path_wireshark_dump, 'rb') as dump_file:
+		dump_file.seek(start)
+		pos = start
+		in_range = start == 0
+		for line in dump_file:
+			if line.startswith(frame_header):
+				if pos >= end:
+					break
+				in_range = True
+			if in_range:
+				lines.append(line.decode('latin-1'))
+			pos += len(line)
+	return lines
+
+
+def parse_chunk(lines):
+	# [(frame no, time, endpoint, data)] of the packets with capture data on endpoint 0x01/0x81
+	frames = []
+	frame_no = 0
+	frame_time = 0.0
+	endpoint = None
+	hex_parts = None
+	unknown_endpoints = set()
+
+	def finish_frame():
+		if hex_parts and endpoint is not None:
+			frames.append((frame_no, frame_time, endpoint, bytes.fromhex(''.join(hex_parts))[USBPCAP_HEADER_LENGTH:]))
+
+	for line in lines:
+		row = line.rstrip('\r\n')
+		if row.startswith(FRAME_HEADER):
+			finish_frame()
+			hex_parts = None
+			continue
+		if hex_parts is not None:
+			x = HEX_LINE.search(row)
 			if x is not None:
-				current_time = x.group(2)
-			if str_row.startswith('Frame '):
-				idx_dp = str_row.index(':')
-				current_frame_no = str_row[6:idx_dp]
-
-			parts = str_row.split('    Endpoint: ')
-			if len(parts) > 1:
-				current_endpoint_address = parts[1]
-
-			if capture_data_line_detected is True:
-				packet_data_recorder.append(str_row)
-			if str_row.startswith('Leftover Capture Data: '):
-				capture_data_line_detected = True
-			if str_row.startswith('No.     Time'):
-				capture_data_line_detected = False
-
-				if len(packet_data_recorder) > 0:
-
-					# need 272 bytes
-					full_data = extract_data(packet_data_recorder)
-					full_data_int = []
-					full_data_str = ''
-					for d in full_data:
-						full_data_int.append(int(d, 16))
-
-					for i, d in enumerate(full_data_int):
-						e = hex(d)
-						if i == 9:
-							full_data_str += (e + ', ')
-						else:
-							full_data_str += (e + ', ')
-
-					if full_data_str.endswith(', '):
-						full_data_str = full_data_str[:-2]
-
-					data_row = [''] * 14
-
-					if current_endpoint_address == '0x01':
-						if full_data_int[4] == 0x1 and full_data_int[5] == 0x10:
-
-							worksheet_all_ports.write('A' + str(xlsx_row_num), current_frame_no)
-							worksheet_all_ports.write('B' + str(xlsx_row_num), current_time)
-							worksheet_all_ports.write('E' + str(xlsx_row_num), full_data_str, format_x1_x10)
-							worksheet_all_ports.write('C' + str(xlsx_row_num), str(float(current_time) - endpoint_x1_times[0]))
-							worksheet_all_ports.write('D' + str(xlsx_row_num), str(float(current_time) - endpoint_x81_times[0]))
-
-							worksheet_x1x10.write('A' + str(x1_x10_row_num), current_frame_no)
-							worksheet_x1x10.write('B' + str(x1_x10_row_num), current_time)
-							worksheet_x1x10.write('E' + str(x1_x10_row_num), full_data_str, format_x1_x10)
-							worksheet_x1x10.write('C' + str(x1_x10_row_num), str(float(current_time) - endpoint_x1_times[0]))
-							worksheet_x1x10.write('D' + str(x1_x10_row_num), str(float(current_time) - endpoint_x81_times[0]))
-							x1_x10_row_num += 1
-
-							endpoint_x1_times[0] = float(current_time)
-
-						elif full_data_int[4] == 0x2 and full_data_int[5] == 0x10:
-
-							worksheet_all_ports.write('A' + str(xlsx_row_num), current_frame_no)
-							worksheet_all_ports.write('B' + str(xlsx_row_num), current_time)
-							worksheet_all_ports.write('E' + str(xlsx_row_num), full_data_str, format_x2_x10)
-							worksheet_all_ports.write('C' + str(xlsx_row_num), str(float(current_time) - endpoint_x1_times[1]))
-							worksheet_all_ports.write('D' + str(xlsx_row_num), str(float(current_time) - endpoint_x81_times[1]))
-
-							worksheet_x2x10.write('A' + str(x2_x10_row_num), current_frame_no)
-							worksheet_x2x10.write('B' + str(x2_x10_row_num), current_time)
-							worksheet_x2x10.write('E' + str(x2_x10_row_num), full_data_str, format_x2_x10)
-							worksheet_x2x10.write('C' + str(x2_x10_row_num), str(float(current_time) - endpoint_x1_times[1]))
-							worksheet_x2x10.write('D' + str(x2_x10_row_num), str(float(current_time) - endpoint_x81_times[1]))
-							x2_x10_row_num += 1
-
-							endpoint_x1_times[1] = float(current_time)
-
-						elif full_data_int[4] == 0x80 and full_data_int[5] == 0x10:
-
-							worksheet_all_ports.write('A' + str(xlsx_row_num), current_frame_no)
-							worksheet_all_ports.write('B' + str(xlsx_row_num), current_time)
-							worksheet_all_ports.write('E' + str(xlsx_row_num), full_data_str, format_x80_x10)
-							worksheet_all_ports.write('C' + str(xlsx_row_num), str(float(current_time) - endpoint_x1_times[2]))
-							worksheet_all_ports.write('D' + str(xlsx_row_num), str(float(current_time) - endpoint_x81_times[2]))
-
-							worksheet_x80x10.write('A' + str(x80_x10_row_num), current_frame_no)
-							worksheet_x80x10.write('B' + str(x80_x10_row_num), current_time)
-							worksheet_x80x10.write('E' + str(x80_x10_row_num), full_data_str, format_x80_x10)
-							worksheet_x80x10.write('C' + str(x80_x10_row_num), str(float(current_time) - endpoint_x1_times[2]))
-							worksheet_x80x10.write('D' + str(x80_x10_row_num), str(float(current_time) - endpoint_x81_times[2]))
-							x80_x10_row_num += 1
-
-							endpoint_x1_times[2] = float(current_time)
-
-						else:
-							print("WARNING: Unknown communication path in endpoint 0x1")
-
-						data_from_kpa.append(data_row)
-						xlsx_row_num += 1
-					elif current_endpoint_address == '0x81':
-						if full_data_int[6] == 0x1 and full_data_int[7] == 0x10:
-
-							worksheet_all_ports.write('A' + str(xlsx_row_num), current_frame_no)
-							worksheet_all_ports.write('B' + str(xlsx_row_num), current_time)
-							worksheet_all_ports.write('F' + str(xlsx_row_num), full_data_str, format_x1_x10)
-
-							worksheet_x1x10.write('A' + str(x1_x10_row_num), current_frame_no)
-							worksheet_x1x10.write('B' + str(x1_x10_row_num), current_time)
-							worksheet_x1x10.write('F' + str(x1_x10_row_num), full_data_str, format_x1_x10)
-							x1_x10_row_num += 1
-							endpoint_x81_times[0] = float(current_time)
-
-						elif full_data_int[6] == 0x2 and full_data_int[7] == 0x10:
-
-							worksheet_all_ports.write('A' + str(xlsx_row_num), current_frame_no)
-							worksheet_all_ports.write('B' + str(xlsx_row_num), current_time)
-							worksheet_all_ports.write('F' + str(xlsx_row_num), full_data_str, format_x2_x10)
-
-							worksheet_x2x10.write('A' + str(x2_x10_row_num), current_frame_no)
-							worksheet_x2x10.write('B' + str(x2_x10_row_num), current_time)
-							worksheet_x2x10.write('F' + str(x2_x10_row_num), full_data_str, format_x2_x10)
-							x2_x10_row_num += 1
-							endpoint_x81_times[1] = float(current_time)
-
-						elif full_data_int[6] == 0x80 and full_data_int[7] == 0x10:
-
-							worksheet_all_ports.write('A' + str(xlsx_row_num), current_frame_no)
-							worksheet_all_ports.write('B' + str(xlsx_row_num), current_time)
-							worksheet_all_ports.write('F' + str(xlsx_row_num), full_data_str, format_x80_x10)
+				hex_parts.append(x.group(2).replace(' ', ''))
+			continue
 
-							worksheet_x80x10.write('A' + str(x80_x10_row_num), current_frame_no)
-							worksheet_x80x10.write('B' + str(x80_x10_row_num), current_time)
-							worksheet_x80x10.write('F' + str(x80_x10_row_num), full_data_str, format_x80_x10)
-							x80_x10_row_num += 1
-
-							endpoint_x81_times[2] = float(current_time)
-						else:
-							print("WARNING: Unknown communication path in endpoint 0x81")
-						data_from_kpa.append(data_row)
-						xlsx_row_num += 1
-					else:
-						print("WARNING: Unknown endpoint: " + str(current_endpoint_address))
-				packet_data_recorder = []
-
-		workbook.close()
-		return
+		if 'host' in row:
+			x = TIME_LINE.search(row)
+			if x is not None:
+				frame_time = float(x.group(2))
+		if row.startswith('Frame '):
+			frame_no = int(row[6:row.index(':')])
+		elif ENDPOINT_FIELD in row:
+			# '    Endpoint: 0x81, Direction: IN'
+			address = row.split(ENDPOINT_FIELD)[1].split(',', 1)[0]
+			endpoint = ENDPOINTS.get(address)
+			if endpoint is None:
+				unknown_endpoints.add(address)
+		elif row.startswith(CAPTURE_DATA):
+			hex_parts = []
+	finish_frame()
+	return frames, unknown_endpoints
+
+
+def parse_range(path_wireshark_dump, start, end):
+	# runs in a worker process, only the range is passed in and only the packet data is passed back
+	return parse_chunk(read_range(path_wireshark_dump, start, end))
+
+
+def parse_dump(path_wireshark_dump, processes=None):
+	# UsbUrb of every packet in file order. The chunks are parsed by a pool of processes (processes=1: in this
+	# process), every worker reads its chunk itself. Only CHUNKS_PER_WORKER chunks per process are parsed ahead,
+	# so memory use does not depend on the dump size.
+	if processes is None:
+		processes = os.cpu_count() or 1
+	ranges = chunk_ranges(path_wireshark_dump)
+	unknown_endpoints = set()
+	if processes <= 1 or len(ranges) <= 1:
+		results = (parse_range(path_wireshark_dump, start, end) for start, end in ranges)
+		pool = None
+	else:
+		pool = multiprocessing.Pool(processes)
+		results = ordered_results(pool, path_wireshark_dump, ranges, processes * CHUNKS_PER_WORKER)
+	try:
+		for frames, unknown in results:
+			unknown_endpoints |= unknown
+			for frame_no, frame_time, endpoint, data in frames:
+				yield UsbUrb(frame_no, frame_time, endpoint, data)
+	finally:
+		if pool is not None:
+			pool.terminate()
+	for address in sorted(unknown_endpoints):
+		print("WARNING: Unknown endpoint: " + str(address))
+
+
+def ordered_results(pool, path_wireshark_dump, ranges, max_pending):
+	pending = collections.deque()
+	for start, end in ranges:
+		pending.append(pool.apply_async(parse_range, (path_wireshark_dump, start, end)))
+		if len(pending) >= max_pending:
+			yield pending.popleft().get()
+	while len(pending):
+		yield pending.popleft().get()
+
+
+def export_all_endpoints(path_wireshark_dump, path_out_xlsx, processes=None):
+	PcapngToXlsx().urbs_to_xlsx(parse_dump(path_wireshark_dump, processes), path_out_xlsx)
+
+
+def export_to_capture(path_wireshark_dump, path_out_capture, processes=None):
+	# binary session capture (see session_capture.py), times relative to the first packet
+	session_capture = SessionCapture(path_out_capture).open()
+	start_time = None
+	for urb in parse_dump(path_wireshark_dump, processes):
+		if start_time is None:
+			start_time = urb.time
+		kind = SessionCapture.IN if urb.endpoint & 0x80 else SessionCapture.OUT
+		session_capture.record(kind, urb.endpoint, urb.data, timestamp_ns=round((urb.time - start_time) * 1e9))
+	session_capture.close()
 
 
 def export_all_endpoints_legacy(path_wireshark_dump, path_out_csv):
@@ -383,13 +345,28 @@ file_list = [
 
 
 def main(args):
-
-	if len(args) > 1:
-		input_path = args[1]
-		if os.path.exists(input_path) is False:
-			log.error("Given path for input does not exist: " + input_path )
-		else:
-			export_all_endpoints(input_path, input_path + '.xlsx')
+	# packetdump_parser.py [-j <processes>] [-c] <dump.txt>...: writes <dump.txt>.xlsx (-c: <dump.txt>.hxcap)
+	try:
+		opts, paths = getopt.getopt(args[1:], 'j:c')
+	except getopt.GetoptError as e:
+		log.error(str(e))
+		return
+	processes = None
+	to_capture = False
+	for opt, arg in opts:
+		if opt == '-j':
+			processes = int(arg)
+		elif opt == '-c':
+			to_capture = True
+
+	if len(paths) > 0:
+		for input_path in paths:
+			if os.path.exists(input_path) is False:
+				log.error("Given path for input does not exist: " + input_path)
+			elif to_capture:
+				export_to_capture(input_path, input_path + '.hxcap', processes)
+			else:
+				export_all_endpoints(input_path, input_path + '.xlsx', processes)
 		return
 
 	for file_path in file_list:
@@ -0,0 +1,300 @@
+import contextlib
+import cProfile
+import getopt
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+
+import next_gen_parser
+import next_gen_slot_parser
+from utils import simple_filter
+from utils.preset_parser import HxPreset
+
+# Times and memory-profiles the preset decoders on a corpus of presets (one preset as hex per line):
+#   python -m utils.parser_benchmark [-i corpus] [-r repeat] [-o results.json] [-c baseline.json] [-t percent]
+# Results are written as JSON, with -c they are compared to an earlier run and slowdowns beyond -t percent
+# let the script exit with 1.
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'ideas', '20260226_all_data.txt')
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 10.0
+TOP_FUNCTIONS = 8
+
+# hotspot sections: functions (file name, function name) whose cumulative time is reported per section
+SECTIONS = {
+    'slot extraction': [
+        ('preset_parser.py', '_read_slot_info'),
+        ('next_gen_slot_parser.py', 'extract_slot_sections'),
+        ('next_gen_slot_parser.py', '_parse'),
+        ('simple_filter.py', 'slot_reader'),
+    ],
+    'footswitch extraction': [
+        ('preset_parser.py', '_read_switch_info'),
+        ('next_gen_parser.py', 'extract_footswitch_sections'),
+        ('next_gen_parser.py', '_parse'),
+        ('simple_filter.py', 'fs_info_extract'),
+    ],
+    'read_params': [
+        ('preset_parser.py', 'read_params'),
+        ('next_gen_slot_parser.py', 'read_params'),
+        ('simple_filter.py', 'read_params'),
+    ],
+}
+
+
+def decode_hx_preset_index(data):
+    # only the lazy constructor: the section index, no slots or switches
+    return HxPreset(data)
+
+
+def decode_hx_preset(data):
+    # full decode: every slot with its parameters and every footswitch
+    hx_preset = HxPreset(data)
+    slots = [(slot.parameter_a, slot.parameter_b) for slot in hx_preset.slot_info]
+    switches = [switch.children for switch in hx_preset.switch_info]
+    return hx_preset, slots, switches
+
+
+def decode_hx_preset_slots(data):
+    hx_preset = HxPreset(data)
+    return [(slot.parameter_a, slot.parameter_b) for slot in hx_preset.slot_info]
+
+
+def decode_hx_preset_switches(data):
+    hx_preset = HxPreset(data)
+    return [switch.children for switch in hx_preset.switch_info]
+
+
+def decode_next_gen_slots(data):
+    return [next_gen_slot_parser.SlotInfo(section) for section in next_gen_slot_parser.extract_slot_sections(data)]
+
+
+def decode_next_gen_switches(data):
+    return [next_gen_parser.FootSwitchInfo(section) for section in next_gen_parser.extract_footswitch_sections(data)]
+
+
+def decode_simple_filter_slots(data):
+    return simple_filter.slot_extract(data)
+
+
+def decode_simple_filter_switches(data):
+    return simple_filter.fs_info_extract(data)
+
+
+# name -> (decode function, input format)
+CASES = {
+    'HxPreset': (decode_hx_preset, 'bytes'),
+    'HxPreset.index': (decode_hx_preset_index, 'bytes'),
+    'HxPreset.slot_info': (decode_hx_preset_slots, 'bytes'),
+    'HxPreset.switch_info': (decode_hx_preset_switches, 'bytes'),
+    'next_gen_slot_parser': (decode_next_gen_slots, 'hex'),
+    'next_gen_parser': (decode_next_gen_switches, 'hex'),
+    'simple_filter.slot_reader': (decode_simple_filter_slots, 'hex'),
+    'simple_filter.fs_info_extract': (decode_simple_filter_switches, 'hex'),
+}
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def decode_all(fct, inputs):
+    # returns the number of presets which could not be decoded, the older parsers print their errors
+    failed_cnt = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for data in inputs:
+            try:
+                if fct(data) is None:
+                    failed_cnt += 1
+            except Exception:
+                failed_cnt += 1
+    return failed_cnt
+
+
+def measure_time(fct, inputs, repeat):
+    timings = []
+    failed_cnt = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        failed_cnt = decode_all(fct, inputs)
+        timings.append(time.perf_counter() - start)
+    return timings, failed_cnt
+
+
+def measure_memory(fct, inputs):
+    # allocations while decoding one preset (peak) and held by its result (retained), averaged over the corpus
+    peak_bytes = 0
+    retained_bytes = 0
+    block_cnt = 0
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for data in inputs:
+                before = tracemalloc.take_snapshot()
+                base, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                try:
+                    result = fct(data)
+                except Exception:
+                    result = None
+                current, peak = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                peak_bytes += peak - base
+                retained_bytes += current - base
+                block_cnt += sum(max(stat.count_diff, 0) for stat in after.compare_to(before, 'lineno'))
+                del result
+    finally:
+        tracemalloc.stop()
+    count = max(len(inputs), 1)
+    return {
+        'peak_bytes_per_preset': peak_bytes // count,
+        'retained_bytes_per_preset': retained_bytes // count,
+        'allocations_per_preset': block_cnt // count,
+    }
+
+
+def measure_hotspots(fct, inputs):
+    profile = cProfile.Profile()
+    profile.enable()
+    decode_all(fct, inputs)
+    profile.disable()
+    stats = pstats.Stats(profile)
+    total_time = max(stats.total_tt, 1e-9)
+
+    sections = {}
+    functions = []
+    for (file_name, _, function_name), (_, call_cnt, own_time, cumulative_time, _) in stats.stats.items():
+        key = (os.path.basename(file_name), function_name)
+        for section, members in SECTIONS.items():
+            if key in members:
+                entry = sections.setdefault(section, {'calls': 0, 'time_s': 0.0})
+                entry['calls'] += call_cnt
+                entry['time_s'] += cumulative_time
+        functions.append((own_time, call_cnt, '{}:{}'.format(*key)))
+
+    for entry in sections.values():
+        entry['share'] = round(min(entry['time_s'] / total_time, 1.0), 3)
+        entry['time_s'] = round(entry['time_s'], 6)
+    functions.sort(reverse=True)
+    hotspots = [{'function': name, 'calls': call_cnt, 'own_time_s': round(own_time, 6),
+                 'share': round(own_time / total_time, 3)} for own_time, call_cnt, name in functions[:TOP_FUNCTIONS]]
+    return sections, hotspots
+
+
+def run_case(name, presets, repeat):
+    fct, input_format = CASES[name]
+    inputs = [bytes.fromhex(preset) for preset in presets] if input_format == 'bytes' else presets
+
+    # warm up (module lookups, caches) before timing
+    decode_all(fct, inputs[:3])
+    timings, failed_cnt = measure_time(fct, inputs, repeat)
+    best = min(timings)
+    result = {
+        'presets': len(inputs),
+        'failed': failed_cnt,
+        'best_s': round(best, 6),
+        'mean_s': round(sum(timings) / len(timings), 6),
+        'presets_per_s': round(len(inputs) / max(best, 1e-9), 1),
+    }
+    result.update(measure_memory(fct, inputs))
+    result['sections'], result['hotspots'] = measure_hotspots(fct, inputs)
+    return result
+
+
+def compare(results, baseline, threshold):
+    # returns the names of the cases which got slower than threshold percent
+    regressions = []
+    for name, result in results['cases'].items():
+        old = baseline.get('cases', {}).get(name)
+        if old is None or old['presets_per_s'] <= 0:
+            continue
+        change = (result['presets_per_s'] / old['presets_per_s'] - 1.0) * 100.0
+        memory_change = result['peak_bytes_per_preset'] - old['peak_bytes_per_preset']
+        flag = ''
+        if change < -threshold:
+            flag = '  <-- REGRESSION'
+            regressions.append(name)
+        print('{:32s} {:10.1f} -> {:10.1f} presets/s ({:+.1f}%), peak {:+d} bytes/preset{}'.format(
+            name, old['presets_per_s'], result['presets_per_s'], change, memory_change, flag))
+    return regressions
+
+
+def print_result(name, result):
+    print('{:32s} {:10.1f} presets/s  {:8d} allocs/preset  {:9d} peak bytes/preset  failed: {}'.format(
+        name, result['presets_per_s'], result['allocations_per_preset'], result['peak_bytes_per_preset'],
+        result['failed']))
+    for section, entry in result['sections'].items():
+        print('    {:28s} {:5.1f}%  ({} calls)'.format(section, entry['share'] * 100.0, entry['calls']))
+    for hotspot in result['hotspots'][:3]:
+        print('    {:28s} {:5.1f}%  ({} calls)'.format(hotspot['function'], hotspot['share'] * 100.0, hotspot['calls']))
+
+
+def main(args):
+    corpus_path = DEFAULT_CORPUS
+    repeat = DEFAULT_REPEAT
+    out_path = None
+    baseline_path = None
+    threshold = DEFAULT_THRESHOLD
+    cases = list(CASES.keys())
+    try:
+        opts, _ = getopt.getopt(args[1:], "hi:r:o:c:t:s:")
+    except getopt.GetoptError:
+        print(args[0] + ' -i <corpus> -r <repeat> -o <results.json> -c <baseline.json> -t <percent> -s <case,...>')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(args[0] + ' -i <corpus> -r <repeat> -o <results.json> -c <baseline.json> -t <percent> -s <case,...>')
+            print('cases: ' + ', '.join(CASES.keys()))
+            sys.exit()
+        elif opt == '-i':
+            corpus_path = arg
+        elif opt == '-r':
+            repeat = max(1, int(arg))
+        elif opt == '-o':
+            out_path = arg
+        elif opt == '-c':
+            baseline_path = arg
+        elif opt == '-t':
+            threshold = float(arg)
+        elif opt == '-s':
+            cases = [case for case in arg.split(',') if case in CASES]
+
+    presets = load_corpus(corpus_path)
+    print('Corpus: {} presets, {} bytes ({})'.format(len(presets), sum(len(p) // 2 for p in presets), corpus_path))
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': os.path.basename(corpus_path),
+        'presets': len(presets),
+        'repeat': repeat,
+        'cases': {},
+    }
+    for name in cases:
+        result = run_case(name, presets, repeat)
+        results['cases'][name] = result
+        print_result(name, result)
+
+    if out_path is not None:
+        with open(out_path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=1)
+        print('Results written to ' + out_path)
+
+    if baseline_path is not None:
+        with open(baseline_path, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        print('Compared to ' + baseline_path + ' (' + str(baseline.get('created')) + '):')
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,215 @@
+import mmap
+import struct
+import sys
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+class UsbUrb:
+    # one USB transfer with data: frame number (1-based, as shown by Wireshark), time in s, endpoint address
+    # (0x80 set for IN) and the transferred bytes
+    __slots__ = ('frame_no', 'time', 'endpoint', 'data')
+
+    def __init__(self, frame_no, time, endpoint, data):
+        self.frame_no = frame_no
+        self.time = time
+        self.endpoint = endpoint
+        self.data = data
+
+    def __repr__(self):
+        return 'UsbUrb({}, {:.6f}, 0x{:x}, {})'.format(self.frame_no, self.time, self.endpoint, self.data.hex())
+
+
+class PcapngReader:
+    # Streams the USB transfers of a pcapng or pcap capture without tshark. The file is mmap'd and read block by
+    # block, only the transfers on the selected endpoints are copied out, so memory use does not depend on the size
+    # of the capture. Supported link types:
+    #   189 Linux usbmon (48 byte header), 220 Linux usbmon mmapped (64 byte header),
+    #   249 USBPcap (Windows), 266 macOS USB (Wireshark on macOS)
+    # Only transfers carrying data are returned: OUT on submission, IN on completion.
+    ENDPOINTS = (0x01, 0x81)
+    MIDI_ENDPOINTS = (0x02, 0x82)
+
+    LINKTYPE_USB_LINUX = 189
+    LINKTYPE_USB_LINUX_MMAPPED = 220
+    LINKTYPE_USBPCAP = 249
+    LINKTYPE_USB_DARWIN = 266
+
+    BLOCK_SECTION_HEADER = 0x0a0d0d0a
+    BLOCK_INTERFACE = 0x1
+    BLOCK_PACKET = 0x2
+    BLOCK_SIMPLE_PACKET = 0x3
+    BLOCK_ENHANCED_PACKET = 0x6
+    BYTE_ORDER_MAGIC = 0x1a2b3c4d
+    OPTION_TSRESOL = 9
+
+    PCAP_MAGIC = {
+        b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+        b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9)
+    }
+
+    # usbmon: event type at 8, endpoint at 10, captured data length at 36
+    USBMON_EVENT_POS = 8
+    USBMON_ENDPOINT_POS = 10
+    USBMON_LEN_CAP_POS = 36
+    USBMON_HEADER_SIZE = {LINKTYPE_USB_LINUX: 48, LINKTYPE_USB_LINUX_MMAPPED: 64}
+    # USBPcap: header length, info (bit 0: completion), endpoint
+    USBPCAP_INFO_POS = 16
+    USBPCAP_ENDPOINT_POS = 21
+    # macOS: header length, request type (0 submit, 1 complete), endpoint
+    DARWIN_HEADER_LENGTH_POS = 2
+    DARWIN_REQUEST_TYPE_POS = 3
+    DARWIN_ENDPOINT_POS = 30
+
+    def __init__(self, path, endpoints=ENDPOINTS):
+        self.path = path
+        self.endpoints = frozenset(endpoints)
+        self.frame_cnt = 0
+        self.urb_cnt = 0
+        self.unsupported_link_types = set()
+
+    def __iter__(self):
+        return self.urbs()
+
+    def urbs(self):
+        with open(self.path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if buf[:4] in PcapngReader.PCAP_MAGIC:
+                    packets = self.pcap_packets(buf)
+                else:
+                    packets = self.pcapng_packets(buf)
+                start_time = None
+                for link_type, timestamp, pos, length in packets:
+                    self.frame_cnt += 1
+                    urb = self.usb_urb(buf, link_type, pos, length)
+                    if urb is None:
+                        continue
+                    endpoint, data_pos, data_length = urb
+                    if endpoint not in self.endpoints or data_length <= 0:
+                        continue
+                    if start_time is None:
+                        start_time = timestamp
+                    self.urb_cnt += 1
+                    yield UsbUrb(self.frame_cnt, timestamp - start_time, endpoint, buf[data_pos:data_pos + data_length])
+        if self.unsupported_link_types:
+            log.warning('Skipped packets of unsupported link type(s): ' + str(sorted(self.unsupported_link_types)))
+
+    def pcapng_packets(self, buf):
+        # (link type, time in s, data position, data length) of every packet block
+        pos = 0
+        end = len(buf)
+        byte_order = '<'
+        interfaces = []
+        while pos + 12 <= end:
+            block_type = struct.unpack_from(byte_order + 'I', buf, pos)[0]
+            if block_type == PcapngReader.BLOCK_SECTION_HEADER:
+                magic = buf[pos + 8:pos + 12]
+                byte_order = '<' if struct.unpack('<I', magic)[0] == PcapngReader.BYTE_ORDER_MAGIC else '>'
+                interfaces = []
+            block_length = struct.unpack_from(byte_order + 'I', buf, pos + 4)[0]
+            if block_length < 12 or pos + block_length > end:
+                log.warning('Capture ends within a block at offset ' + str(pos))
+                return
+            body = pos + 8
+
+            if block_type == PcapngReader.BLOCK_INTERFACE:
+                link_type = struct.unpack_from(byte_order + 'H', buf, body)[0]
+                interfaces.append((link_type, self.ts_resolution(buf, byte_order, body + 8, pos + block_length - 4)))
+            elif block_type == PcapngReader.BLOCK_ENHANCED_PACKET:
+                interface_id, ts_high, ts_low, cap_length = struct.unpack_from(byte_order + 'IIII', buf, body)
+                link_type, resolution = interfaces[interface_id]
+                yield link_type, ((ts_high << 32) | ts_low) * resolution, body + 20, cap_length
+            elif block_type == PcapngReader.BLOCK_SIMPLE_PACKET:
+                link_type, _ = interfaces[0]
+                orig_length = struct.unpack_from(byte_order + 'I', buf, body)[0]
+                yield link_type, 0.0, body + 4, min(orig_length, block_length - 16)
+            elif block_type == PcapngReader.BLOCK_PACKET:
+                interface_id, _, ts_high, ts_low, cap_length = struct.unpack_from(byte_order + 'HHIII', buf, body)
+                link_type, resolution = interfaces[interface_id]
+                yield link_type, ((ts_high << 32) | ts_low) * resolution, body + 20, cap_length
+            pos += block_length
+
+    @staticmethod
+    def ts_resolution(buf, byte_order, pos, end):
+        # if_tsresol option of an interface description block, default is microseconds
+        while pos + 4 <= end:
+            code, length = struct.unpack_from(byte_order + 'HH', buf, pos)
+            if code == 0:
+                break
+            if code == PcapngReader.OPTION_TSRESOL and length >= 1:
+                value = buf[pos + 4]
+                if value & 0x80:
+                    return 2.0 ** -(value & 0x7f)
+                return 10.0 ** -value
+            pos += 4 + length + (-length % 4)
+        return 1e-6
+
+    @staticmethod
+    def pcap_packets(buf):
+        byte_order, resolution = PcapngReader.PCAP_MAGIC[buf[:4]]
+        link_type = struct.unpack_from(byte_order + 'I', buf, 20)[0] & 0x0fffffff
+        pos = 24
+        end = len(buf)
+        while pos + 16 <= end:
+            ts_sec, ts_frac, cap_length, _ = struct.unpack_from(byte_order + 'IIII', buf, pos)
+            if pos + 16 + cap_length > end:
+                log.warning('Capture ends within a packet at offset ' + str(pos))
+                return
+            yield link_type, ts_sec + ts_frac * resolution, pos + 16, cap_length
+            pos += 16 + cap_length
+
+    def usb_urb(self, buf, link_type, pos, length):
+        # (endpoint, data position, data length) of a transfer, None for other link types
+        if link_type in PcapngReader.USBMON_HEADER_SIZE:
+            header_size = PcapngReader.USBMON_HEADER_SIZE[link_type]
+            if length < header_size:
+                return None
+            endpoint = buf[pos + PcapngReader.USBMON_ENDPOINT_POS]
+            event = buf[pos + PcapngReader.USBMON_EVENT_POS]
+            if event != (ord('C') if endpoint & 0x80 else ord('S')):
+                return None
+            len_cap = struct.unpack_from('<I', buf, pos + PcapngReader.USBMON_LEN_CAP_POS)[0]
+            return endpoint, pos + header_size, min(len_cap, length - header_size)
+
+        if link_type == PcapngReader.LINKTYPE_USBPCAP:
+            if length < 27:
+                return None
+            header_size = struct.unpack_from('<H', buf, pos)[0]
+            endpoint = buf[pos + PcapngReader.USBPCAP_ENDPOINT_POS]
+            completion = buf[pos + PcapngReader.USBPCAP_INFO_POS] & 0x1
+            if completion != (1 if endpoint & 0x80 else 0):
+                return None
+            return endpoint, pos + header_size, length - header_size
+
+        if link_type == PcapngReader.LINKTYPE_USB_DARWIN:
+            if length < PcapngReader.DARWIN_ENDPOINT_POS + 2:
+                return None
+            header_size = buf[pos + PcapngReader.DARWIN_HEADER_LENGTH_POS]
+            endpoint = buf[pos + PcapngReader.DARWIN_ENDPOINT_POS]
+            completion = buf[pos + PcapngReader.DARWIN_REQUEST_TYPE_POS]
+            if completion != (1 if endpoint & 0x80 else 0):
+                return None
+            return endpoint, pos + header_size, length - header_size
+
+        self.unsupported_link_types.add(link_type)
+        return None
+
+
+def main(args):
+    # prints the transfers on endpoints 0x01/0x81 (add -m for 0x02/0x82) of the given captures
+    endpoints = PcapngReader.ENDPOINTS
+    paths = args[1:]
+    if '-m' in paths:
+        paths.remove('-m')
+        endpoints = PcapngReader.ENDPOINTS + PcapngReader.MIDI_ENDPOINTS
+    for path in paths:
+        reader = PcapngReader(path, endpoints)
+        for urb in reader:
+            print('{:6d} {:12.6f} 0x{:02x} {}'.format(urb.frame_no, urb.time, urb.endpoint, urb.data.hex()))
+        print('{}: {} frames, {} transfers'.format(path, reader.frame_cnt, reader.urb_cnt))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,233 +1,97 @@
-import json
 import os
+import struct
 import sys
-import subprocess
-import uuid
 import xlsxwriter
 import logging
 
+from utils.pcapng_reader import PcapngReader
+
 
 log = logging.getLogger(__name__)
 
 
 class PcapngToXlsx:
-    PATH_TSHARK_ABS = "/Applications/Wireshark.app/Contents/MacOS/tshark"
-
-    def __init__(self):
-        self.path_json_dump_file = None
-
-    @staticmethod
-    def check_os_supported():
-        if os.name != 'posix':
-            log.error("Operating system not supported yet.")
-            return False
-        if os.path.exists(PcapngToXlsx.PATH_TSHARK_ABS) is False:
-            log.error("Cannot find tshark here: " + PcapngToXlsx.PATH_TSHARK_ABS)
-            return False
-        return True
-
-    @staticmethod
-    def pcapng_to_json(path_pcapng_input_abs, path_json_dump_file):
-        command = \
-            PcapngToXlsx.PATH_TSHARK_ABS + ' -V -T json -x -r "' + path_pcapng_input_abs + '" > "' + \
-            path_json_dump_file + '"'
-
-        result = subprocess.run(command, stdout=subprocess.PIPE, shell=True)
-
-        if result.returncode != 0:
-            log.error("Return value of tshark command not 0")
-            return False
-
-        return True
-
-    @staticmethod
-    def json_to_xlsx(path_json_dump_file, path_xlsx_out):
-
-        workbook = xlsxwriter.Workbook(path_xlsx_out)
-        format_x1_x10 = workbook.add_format()
-        format_x2_x10 = workbook.add_format()
-        format_x80_x10 = workbook.add_format()
-
-        format_x1_x10.set_pattern(1)
-        format_x2_x10.set_pattern(1)
-        format_x80_x10.set_pattern(1)
-        format_x1_x10.set_bg_color('edf0e0')
-        format_x2_x10.set_bg_color('f5c9ce')
-        format_x80_x10.set_bg_color('fbeaa5')
+    # Converts USB captures (pcapng or pcap, see PcapngReader for the link types) to the xlsx layout of the HX Stomp
+    # traffic: sheets all, x1x10, x2x10, x80x10 with frame number, time, time since the last x1 (C) and x81 (D)
+    # packet of the channel, OUT data (E) and IN data (F). The capture is streamed and the workbook is written in
+    # constant_memory mode, so large captures don't need to fit into memory. With include_midi the MIDI endpoints
+    # 0x02/0x82 go to an additional sheet.
+    COLORS = {0x1: 'edf0e0', 0x2: 'f5c9ce', 0x80: 'fbeaa5'}
+    SHEETS = {0x1: 'x1x10', 0x2: 'x2x10', 0x80: 'x80x10'}
+    COLUMN_OUT = 4
+    COLUMN_IN = 5
+    HEX_STRINGS = [hex(i) for i in range(256)]
+
+    def __init__(self, include_midi=False):
+        self.include_midi = include_midi
+
+    def urbs_to_xlsx(self, urbs, path_xlsx_out):
+        workbook = xlsxwriter.Workbook(path_xlsx_out, {'constant_memory': True})
+        formats = {}
+        for channel, color in PcapngToXlsx.COLORS.items():
+            formats[channel] = workbook.add_format()
+            formats[channel].set_pattern(1)
+            formats[channel].set_bg_color(color)
 
         worksheet_all_ports = workbook.add_worksheet("all")
-        worksheet_x1x10 = workbook.add_worksheet("x1x10")
-        worksheet_x2x10 = workbook.add_worksheet("x2x10")
-        worksheet_x80x10 = workbook.add_worksheet("x80x10")
+        worksheets = {channel: workbook.add_worksheet(name) for channel, name in PcapngToXlsx.SHEETS.items()}
+        worksheet_midi = workbook.add_worksheet("midi") if self.include_midi else None
 
-        endpoint_x1_times = [0, 0, 0]
-        endpoint_x81_times = [0, 0, 0]
+        endpoint_x1_times = {channel: 0.0 for channel in worksheets}
+        endpoint_x81_times = {channel: 0.0 for channel in worksheets}
 
         xlsx_row_num = 0
-        x1_x10_row_num = 0
-        x2_x10_row_num = 0
-        x80_x10_row_num = 0
-
-        reported_unexpected_endpoints = list()
-        endpoints_to_report = ["0x00000001", "0x00000081"]
-
-        # open json and print
-        with open(path_json_dump_file, "r") as read_file:
-            data = json.load(read_file)
-            for data_packet_no, packet in enumerate(data):
-                if data_packet_no % 1000 == 0:
-                    print('.', end='')
-                source = packet["_source"]
-                layers = source["layers"]
-                usb = layers["usb"]
-
-                usb_endpoint = usb["usb.endpoint_address"]
-                if usb_endpoint in endpoints_to_report:
-                    try:
-                        # data (if any)
-                        usb_capdata_raw = layers["usb.capdata_raw"]
-                        usb_capdata_raw = usb_capdata_raw[0]
-
-                        full_data_int = []
-                        full_data_str = ''
-                        for i in range(0, len(usb_capdata_raw), 2):
-                            current_str = usb_capdata_raw[i:i+2]
-                            full_data_int.append(int(current_str, 16))
-
-                        for i, d in enumerate(full_data_int):
-                            e = hex(d)
-                            full_data_str += (e + ', ')
-
-                        if full_data_str.endswith(', '):
-                            full_data_str = full_data_str[:-2]
-
-                        # packet no and time since session start
-                        frame = layers["frame"]
-                        frame_time_delta = frame["frame.time_delta"]
-                        frame_time_relative = frame["frame.time_relative"]
-                        frame_number = frame["frame.number"]
-                        if usb_endpoint == "0x00000001":
-                            if full_data_int[4] == 0x1 and full_data_int[5] == 0x10:
-
-                                worksheet_all_ports.write('A' + str(xlsx_row_num), frame_number)
-                                worksheet_all_ports.write('B' + str(xlsx_row_num), frame_time_relative)
-                                worksheet_all_ports.write('E' + str(xlsx_row_num), full_data_str, format_x1_x10)
-                                worksheet_all_ports.write('C' + str(xlsx_row_num),
-                                                          str(float(frame_time_relative) - endpoint_x1_times[0]))
-                                worksheet_all_ports.write('D' + str(xlsx_row_num),
-                                                          str(float(frame_time_relative) - endpoint_x81_times[0]))
-
-                                worksheet_x1x10.write('A' + str(x1_x10_row_num), frame_number)
-                                worksheet_x1x10.write('B' + str(x1_x10_row_num), frame_time_relative)
-                                worksheet_x1x10.write('E' + str(x1_x10_row_num), full_data_str, format_x1_x10)
-                                worksheet_x1x10.write('C' + str(x1_x10_row_num),
-                                                      str(float(frame_time_relative) - endpoint_x1_times[0]))
-                                worksheet_x1x10.write('D' + str(x1_x10_row_num),
-                                                      str(float(frame_time_relative) - endpoint_x81_times[0]))
-                                x1_x10_row_num += 1
-
-                                endpoint_x1_times[0] = float(frame_time_relative)
-
-                            elif full_data_int[4] == 0x2 and full_data_int[5] == 0x10:
+        row_nums = {channel: 0 for channel in worksheets}
+        midi_row_num = 0
+        unknown_paths = set()
+
+        for urb_no, urb in enumerate(urbs):
+            if urb_no % 1000 == 0:
+                print('.', end='')
+            data = urb.data
+            full_data_str = ', '.join(map(PcapngToXlsx.HEX_STRINGS.__getitem__, data))
+
+            if urb.endpoint & 0x7f == 0x2:
+                worksheet_midi.write_number(midi_row_num, 0, urb.frame_no)
+                worksheet_midi.write_string(midi_row_num, 1, '{:.9f}'.format(urb.time))
+                worksheet_midi.write_string(midi_row_num, PcapngToXlsx.COLUMN_IN if urb.endpoint & 0x80 else
+                                            PcapngToXlsx.COLUMN_OUT, full_data_str)
+                midi_row_num += 1
+                continue
+
+            if urb.endpoint == 0x1:
+                # OUT (host to device): channel in byte 4, followed by 0x10
+                channel = data[4] if len(data) > 5 and data[5] == 0x10 else None
+                column = PcapngToXlsx.COLUMN_OUT
+            else:
+                # IN (device to host): channel in byte 6, followed by 0x10
+                channel = data[6] if len(data) > 7 and data[7] == 0x10 else None
+                column = PcapngToXlsx.COLUMN_IN
+            if channel not in worksheets:
+                path = (urb.endpoint, bytes(data[4:8]).hex())
+                if path not in unknown_paths:
+                    unknown_paths.add(path)
+                    print("WARNING: Unknown communication path in endpoint 0x{:x}: {}".format(*path))
+                continue
+
+            frame_time = '{:.9f}'.format(urb.time)
+            cell_format = formats[channel]
+            for worksheet, row_num in [(worksheet_all_ports, xlsx_row_num), (worksheets[channel], row_nums[channel])]:
+                worksheet.write_number(row_num, 0, urb.frame_no)
+                worksheet.write_string(row_num, 1, frame_time)
+                if urb.endpoint == 0x1:
+                    worksheet.write_string(row_num, 2, str(urb.time - endpoint_x1_times[channel]))
+                    worksheet.write_string(row_num, 3, str(urb.time - endpoint_x81_times[channel]))
+                worksheet.write_string(row_num, column, full_data_str, cell_format)
+            if urb.endpoint == 0x1:
+                endpoint_x1_times[channel] = urb.time
+            else:
+                endpoint_x81_times[channel] = urb.time
+
+            xlsx_row_num += 1
+            row_nums[channel] += 1
 
-                                worksheet_all_ports.write('A' + str(xlsx_row_num), frame_number)
-                                worksheet_all_ports.write('B' + str(xlsx_row_num), frame_time_relative)
-                                worksheet_all_ports.write('E' + str(xlsx_row_num), full_data_str, format_x2_x10)
-                                worksheet_all_ports.write('C' + str(xlsx_row_num),
-                                                          str(float(frame_time_relative) - endpoint_x1_times[1]))
-                                worksheet_all_ports.write('D' + str(xlsx_row_num),
-                                                          str(float(frame_time_relative) - endpoint_x81_times[1]))
-
-                                worksheet_x2x10.write('A' + str(x2_x10_row_num), frame_number)
-                                worksheet_x2x10.write('B' + str(x2_x10_row_num), frame_time_relative)
-                                worksheet_x2x10.write('E' + str(x2_x10_row_num), full_data_str, format_x2_x10)
-                                worksheet_x2x10.write('C' + str(x2_x10_row_num),
-                                                      str(float(frame_time_relative) - endpoint_x1_times[1]))
-                                worksheet_x2x10.write('D' + str(x2_x10_row_num),
-                                                      str(float(frame_time_relative) - endpoint_x81_times[1]))
-                                x2_x10_row_num += 1
-
-                                endpoint_x1_times[1] = float(frame_time_relative)
-
-                            elif full_data_int[4] == 0x80 and full_data_int[5] == 0x10:
-
-                                worksheet_all_ports.write('A' + str(xlsx_row_num), frame_number)
-                                worksheet_all_ports.write('B' + str(xlsx_row_num), frame_time_relative)
-                                worksheet_all_ports.write('E' + str(xlsx_row_num), full_data_str, format_x80_x10)
-                                worksheet_all_ports.write('C' + str(xlsx_row_num),
-                                                          str(float(frame_time_relative) - endpoint_x1_times[2]))
-                                worksheet_all_ports.write('D' + str(xlsx_row_num),
-                                                          str(float(frame_time_relative) - endpoint_x81_times[2]))
-
-                                worksheet_x80x10.write('A' + str(x80_x10_row_num), frame_number)
-                                worksheet_x80x10.write('B' + str(x80_x10_row_num), frame_time_relative)
-                                worksheet_x80x10.write('E' + str(x80_x10_row_num), full_data_str, format_x80_x10)
-                                worksheet_x80x10.write('C' + str(x80_x10_row_num),
-                                                       str(float(frame_time_relative) - endpoint_x1_times[2]))
-                                worksheet_x80x10.write('D' + str(x80_x10_row_num),
-                                                       str(float(frame_time_relative) - endpoint_x81_times[2]))
-                                x80_x10_row_num += 1
-
-                                endpoint_x1_times[2] = float(frame_time_relative)
-
-                            else:
-                                print("WARNING: Unknown communication path in endpoint 0x1: " + str(full_data_int[4]) + ':' + str(full_data_int[5]))
-
-                            xlsx_row_num += 1
-                        else:  # endpoint 0x81
-                            if full_data_int[6] == 0x1 and full_data_int[7] == 0x10:
-
-                                worksheet_all_ports.write('A' + str(xlsx_row_num), frame_number)
-                                worksheet_all_ports.write('B' + str(xlsx_row_num), frame_time_relative)
-                                worksheet_all_ports.write('F' + str(xlsx_row_num), full_data_str, format_x1_x10)
-
-                                worksheet_x1x10.write('A' + str(x1_x10_row_num), frame_number)
-                                worksheet_x1x10.write('B' + str(x1_x10_row_num), frame_time_relative)
-                                worksheet_x1x10.write('F' + str(x1_x10_row_num), full_data_str, format_x1_x10)
-                                x1_x10_row_num += 1
-                                endpoint_x81_times[0] = float(frame_time_relative)
-
-                            elif full_data_int[6] == 0x2 and full_data_int[7] == 0x10:
-
-                                worksheet_all_ports.write('A' + str(xlsx_row_num), frame_number)
-                                worksheet_all_ports.write('B' + str(xlsx_row_num), frame_time_relative)
-                                worksheet_all_ports.write('F' + str(xlsx_row_num), full_data_str, format_x2_x10)
-
-                                worksheet_x2x10.write('A' + str(x2_x10_row_num), frame_number)
-                                worksheet_x2x10.write('B' + str(x2_x10_row_num), frame_time_relative)
-                                worksheet_x2x10.write('F' + str(x2_x10_row_num), full_data_str, format_x2_x10)
-                                x2_x10_row_num += 1
-                                endpoint_x81_times[1] = float(frame_time_relative)
-
-                            elif full_data_int[6] == 0x80 and full_data_int[7] == 0x10:
-
-                                worksheet_all_ports.write('A' + str(xlsx_row_num), frame_number)
-                                worksheet_all_ports.write('B' + str(xlsx_row_num), frame_time_relative)
-                                worksheet_all_ports.write('F' + str(xlsx_row_num), full_data_str, format_x80_x10)
-
-                                worksheet_x80x10.write('A' + str(x80_x10_row_num), frame_number)
-                                worksheet_x80x10.write('B' + str(x80_x10_row_num), frame_time_relative)
-                                worksheet_x80x10.write('F' + str(x80_x10_row_num), full_data_str, format_x80_x10)
-                                x80_x10_row_num += 1
-
-                                endpoint_x81_times[2] = float(frame_time_relative)
-                            else:
-                                print("WARNING: Unknown communication path in endpoint 0x81: " + str(full_data_int[4]) + ':' + str(full_data_int[5]))
-
-                            xlsx_row_num += 1
-                    except KeyError:
-                        # packet has no data we are interested in
-                        pass
-                else:
-                    if usb_endpoint not in reported_unexpected_endpoints:
-                        reported_unexpected_endpoints.append(usb_endpoint)
-
-            if len(reported_unexpected_endpoints) > 0:
-                print()
-                print("pcapng input file contains endpoint(s) currently not monitored: ", end="")
-                for usb_endpoint in reported_unexpected_endpoints:
-                     print(usb_endpoint, end=" ")
-                print()
+        print()
         workbook.close()
         return True
 
@@ -235,27 +99,20 @@ class PcapngToXlsx:
         if path_xlsx_out is None:
             path_xlsx_out = path_pcapng_input_abs + '.xlsx'
 
-        path_json_dump_file = './tmp_dump_' + str(uuid.uuid4()) + '.json'
-        try:
-            if self.check_os_supported() is False:
-                return False
-            if os.path.exists(path_pcapng_input_abs) is False:
-                log.error("Given input file does not exist: " + path_pcapng_input_abs)
-                return False
-
-            # call tshark to convert pcapng file to json
-            # log.info('Converting pcapng file to json - this may take a while!')
-            if self.pcapng_to_json(path_pcapng_input_abs, path_json_dump_file) is False:
-                return False
+        if os.path.exists(path_pcapng_input_abs) is False:
+            log.error("Given input file does not exist: " + path_pcapng_input_abs)
+            return False
 
-            # log.info('Converting json file to xlsx sheet.')
-            if self.json_to_xlsx(path_json_dump_file, path_xlsx_out) is False:
-                return False
-        except:
-            pass
-        finally:
-            if os.path.exists(path_json_dump_file):
-                os.remove(path_json_dump_file)
+        endpoints = PcapngReader.ENDPOINTS
+        if self.include_midi:
+            endpoints += PcapngReader.MIDI_ENDPOINTS
+        reader = PcapngReader(path_pcapng_input_abs, endpoints)
+        try:
+            self.urbs_to_xlsx(reader, path_xlsx_out)
+        except (ValueError, IndexError, struct.error) as e:
+            log.error("Cannot read " + path_pcapng_input_abs + ": " + str(e))
+            return False
+        log.info("Read {} frames, {} transfers".format(reader.frame_cnt, reader.urb_cnt))
         log.info("Successfully stored xlsx file: " + path_xlsx_out)
         return True
 
@@ -266,13 +123,17 @@ def main(args):
         format="%(asctime)s - %(levelname)s - %(message)s (%(name)s)",
         datefmt="%Y-%m-%d %H:%M:%S")
 
-    if len(args) < 2:
-        log.error('Please provide at least one source file!')
+    paths = args[1:]
+    include_midi = '-m' in paths
+    if include_midi:
+        paths.remove('-m')
+    if len(paths) < 1:
+        log.error('Please provide at least one source file! (-m adds the MIDI endpoints 0x02/0x82)')
         return
 
-    pcapng_conv = PcapngToXlsx()
-    for i in range(1, len(args)):
-        pcapng_conv.convert(args[i])
+    pcapng_conv = PcapngToXlsx(include_midi=include_midi)
+    for path in paths:
+        pcapng_conv.convert(path)
         print()
         print()
         print()
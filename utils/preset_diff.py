@@ -0,0 +1,135 @@
+import logging
+from utils.preset_parser import SlotInfo, FootSwitchChild
+log = logging.getLogger(__name__)
+
+
+class PresetChange:
+    # slot_no is the slot (or footswitch) the change belongs to, index the parameter (or footswitch child),
+    # module 0 for module A / the block itself and 1 for module B of a dual slot
+    PRESET_NAME = 'preset name'
+    SNAPSHOT = 'snapshot'
+    SLOT_MODULE = 'slot module'
+    SLOT_ENABLED = 'slot enabled'
+    PARAMETER = 'parameter'
+    SWITCH_LABEL = 'switch label'
+    SWITCH_CUSTOM_LABEL = 'switch custom label'
+    SWITCH_COLOR = 'switch color'
+
+    __slots__ = ('kind', 'slot_no', 'index', 'module', 'old', 'new')
+
+    def __init__(self, kind, old, new, slot_no=-1, index=-1, module=0):
+        self.kind = kind
+        self.slot_no = slot_no
+        self.index = index
+        self.module = module
+        self.old = old
+        self.new = new
+
+    def __eq__(self, other):
+        return isinstance(other, PresetChange) and \
+            (self.kind, self.slot_no, self.index, self.module, self.old, self.new) == \
+            (other.kind, other.slot_no, other.index, other.module, other.old, other.new)
+
+    def __repr__(self):
+        where = ''
+        if self.slot_no != -1:
+            where += ' [' + str(self.slot_no) + ']'
+        if self.index != -1:
+            where += ' ' + 'AB'[self.module] + str(self.index) if self.kind == PresetChange.PARAMETER \
+                else ' ' + str(self.index)
+        return self.kind + where + ': ' + repr(self.old) + ' -> ' + repr(self.new)
+
+
+class PresetDiff:
+    # Minimal changes between two parsed presets. Slots and footswitches are compared on their raw data first, only
+    # the ones which differ are decoded, so diffing two loads of the same preset costs little more than a compare
+    # of the buffers.
+
+    @staticmethod
+    def diff(old_preset, new_preset):
+        # old_preset may be None (nothing known yet), every slot and footswitch of new_preset is reported then
+        changes = []
+        old_name = old_preset.preset_name if old_preset is not None else ''
+        if old_name != new_preset.preset_name:
+            changes.append(PresetChange(PresetChange.PRESET_NAME, old_name, new_preset.preset_name))
+
+        old_snapshot = old_preset.snapshot if old_preset is not None else -1
+        if old_snapshot != new_preset.snapshot:
+            changes.append(PresetChange(PresetChange.SNAPSHOT, old_snapshot, new_preset.snapshot))
+
+        old_slots = old_preset.slot_info if old_preset is not None else []
+        new_slots = new_preset.slot_info
+        for slot_no in range(max(len(old_slots), len(new_slots))):
+            old_slot = old_slots[slot_no] if slot_no < len(old_slots) else None
+            new_slot = new_slots[slot_no] if slot_no < len(new_slots) else None
+            if old_slot is not None and new_slot is not None and old_slot.raw == new_slot.raw:
+                continue
+            PresetDiff.diff_slot(slot_no, old_slot, new_slot, changes)
+
+        old_switches = old_preset.switch_info if old_preset is not None else []
+        new_switches = new_preset.switch_info
+        for switch_no in range(max(len(old_switches), len(new_switches))):
+            old_switch = old_switches[switch_no] if switch_no < len(old_switches) else None
+            new_switch = new_switches[switch_no] if switch_no < len(new_switches) else None
+            if old_switch is not None and new_switch is not None and old_switch.raw == new_switch.raw:
+                continue
+            PresetDiff.diff_switch(switch_no, old_switch, new_switch, changes)
+        return changes
+
+    @staticmethod
+    def module(slot_info):
+        # what is placed in a slot: (slot type, module A, module B), a missing slot counts as an empty one
+        if slot_info is None:
+            return None, b'\xff', b'\xff'
+        return slot_info.slot_type, slot_info.amp_effect_slot_a, slot_info.amp_effect_slot_b
+
+    @staticmethod
+    def diff_slot(slot_no, old_slot, new_slot, changes):
+        old_module = PresetDiff.module(old_slot)
+        new_module = PresetDiff.module(new_slot)
+        if old_module != new_module:
+            # parameters of different modules don't compare, the whole slot is new
+            changes.append(PresetChange(PresetChange.SLOT_MODULE, old_module, new_module, slot_no=slot_no))
+            return
+
+        old_enabled = old_slot.enabled if old_slot is not None else None
+        new_enabled = new_slot.enabled if new_slot is not None else None
+        if old_enabled != new_enabled:
+            changes.append(PresetChange(PresetChange.SLOT_ENABLED, old_enabled, new_enabled, slot_no=slot_no))
+
+        for module in range(2):
+            old_params = PresetDiff.parameters(old_slot, module)
+            new_params = PresetDiff.parameters(new_slot, module)
+            for idx in range(max(len(old_params), len(new_params))):
+                old_value = old_params[idx] if idx < len(old_params) else None
+                new_value = new_params[idx] if idx < len(new_params) else None
+                if old_value != new_value:
+                    changes.append(PresetChange(PresetChange.PARAMETER, old_value, new_value, slot_no=slot_no,
+                                                index=idx, module=module))
+
+    @staticmethod
+    def parameters(slot_info, module):
+        # module 0: module A of a standard slot (with its IR data) or the parameters of the other slot types
+        if slot_info is None:
+            return []
+        if slot_info.slot_type != SlotInfo.STANDARD_SLOT:
+            return slot_info.parameter_b if module == 0 else []
+        return slot_info.parameter_a if module == 0 else slot_info.parameter_b
+
+    @staticmethod
+    def diff_switch(switch_no, old_switch, new_switch, changes):
+        old_children = old_switch.children if old_switch is not None else []
+        new_children = new_switch.children if new_switch is not None else []
+        empty = FootSwitchChild()
+        for idx in range(max(len(old_children), len(new_children))):
+            old_child = old_children[idx] if idx < len(old_children) else empty
+            new_child = new_children[idx] if idx < len(new_children) else empty
+            if old_child.label != new_child.label:
+                changes.append(PresetChange(PresetChange.SWITCH_LABEL, old_child.label, new_child.label,
+                                            slot_no=switch_no, index=idx))
+            if old_child.custom_label != new_child.custom_label:
+                changes.append(PresetChange(PresetChange.SWITCH_CUSTOM_LABEL, old_child.custom_label,
+                                            new_child.custom_label, slot_no=switch_no, index=idx))
+            if old_child.led_color != new_child.led_color:
+                changes.append(PresetChange(PresetChange.SWITCH_COLOR, old_child.led_color, new_child.led_color,
+                                            slot_no=switch_no, index=idx))
@@ -1,313 +1,163 @@
-from utils.formatter import ieee754_to_rendered_str
+import logging
+import re
+import struct
 import sys
 from modules import modules
+from utils.msgpack_decoder import MsgPackDecoder, MsgPackDecodeError
+log = logging.getLogger(__name__)
 
 
 class SlotInfo:
-    FIELD_MAP_00 = {
-        0x13: ("slot_type", "byte"),
-        0x14: ("unknown_1_x82", "byte"),
-        0x05: ("unknown_2_x01", "byte"),
-        0x07: ("parameter", "until_end")
+    # View on one slot of the preset data: {0x13: slot type, 0x14: slot content}
+    # (00 - Input Upper chain, 01 Output upper chain, 02 Input Lower chain, 03 Output lower chain, 08 No Slot, 06 standard slot, 07 Looper )
+    SLOT_TYPE = 0x13
+    CONTENT = 0x14
+
+    # standard slot content
+    MODULES = 0x18
+    DUAL_SLOT = 0x17
+    AMP_EFFECT_SLOT_A = 0x19
+    AMP_EFFECT_SLOT_B = 0x1a
+    ENABLED = 0x0a
+    INFO_SLOT_A = 0x0b
+    INFO_SLOT_B = 0x0c
+    BINARY_DATA = 0x1b
+
+    # parameter block of a module: {0x02: num params, 0x03: .., 0x04: [params]}
+    NUM_PARAMS = 0x02
+    PARAMS = 0x04
+    # the other slot types keep their parameters at 0x07 - split (02) and merge (03) slots in a sub-block
+    INFO = 0x07
+    INFO_BLOCK = {
+        0x02: 0x0f,
+        0x03: 0x10
     }
 
-    FIELD_MAP_01 = {
-        0x13: ("slot_type", "byte"),
-        0x14: ("unknown_1_x82", "byte"),
-        0x06: ("unknown_2_x01", "byte"),
-        0x07: ("parameter", "until_end")
-    }
-
-    FIELD_MAP_02 = {
-        0x13: ("slot_type", "byte"),
-        0x14: ("unknown_1_x83", "byte"),
-        0x0e: ("unknown_2_x02", "byte"),
-        0x05: ("unknown_3", "raw3"),
-        0x02: ("unknown_4_x00", "byte"),
-        0x03: ("unknown_5_x00", "byte"),
-        0x04: ("unknown_6_x90", "byte"),
-        0x0f: ("unknown_7_x84", "byte"),
-        0x08: ("unknown_8", "raw3"),
-        0x0d: ("unknown_9_x08", "byte"),
-        0x0a: ("unknown_10_xc3", "byte"),
-        0x07: ("parameter", "until_end")
-    }
-
-    FIELD_MAP_03 = {
-        0x13: ("slot_type", "byte"),
-        0x14: ("unknown_1_x83", "byte"),
-        0x10: ("unknown_2_x02", "byte"),
-        0x06: ("unknown_3", "byte"),
-        0x07: ("parameter", "until_end")
-    }
-
-    FIELD_MAP = {
-        0x13: ("slot_type", "byte"),
-        # (00 - Input Upper chain, 01 Output upper chain, 02 Input Lower chain, 03 Output lower chain, 08 No Slot, 06 standard slot, 07 Looper )
-        0x1c: ("unknown_1_x02", ("until_marker", [0x18])),
-        # 0x14: ("unknown_1_x85", ("until_marker", [0x1c])),
-        0x14: ("unknown_1_x85", "byte"),
-        0x18: ("unknown_2_x83", "byte"),
-        0x17: ("dual_slot", "bool"),
-        0x19: ("amp_effect_slot_a", ("until_marker", [0x1a])),
-        0x1a: ("amp_effect_slot_b", ("until_marker", [0x09])),
-        0x09: ("unknown_3_xc3", "byte"),
-        0x0a: ("enabled", "bool"),
-        0x0b: ("info_slot_a", ("until_marker", [0x0c, 0x83])),
-        0x0c: ("info_slot_b", "until_end")
-    }
-
-    FIELD_MAP_LOOPER = {
-        0x13: ("slot_type", "byte"),
-        # (00 - Input Upper chain, 01 Output upper chain, 02 Input Lower chain, 03 Output lower chain, 08 No Slot, 06 standard slot, 07 Looper )
-        # 0x1c: ("unknown_1_x02", ("until_marker", [0x18])),
-        0x14: ("unknown_1_x84", "byte"),
-
-        0x08: ("unknown_2_x83", ("until_marker", [0x0a])),
-        0x01: ("dual_slot", "bool"),
-        0x09: ("amp_effect_slot_a", "byte"),
-        0x0a: ("enabled", "bool"),
-        0x07: ("info_slot", "until_end")
-    }
-
-    def __init__(self, hex_string: str, debug=False):
-        self.raw = hex_string
-        self.debug = debug
-        self.parameter_a = []
-        self.parameter_b = []
-        self.amp_effect_slot_a = b'\xff'
-        self.amp_effect_slot_b = b'\xff'
-        self._parse()
-
-    # --------------------------------------------------
-    # DEBUG HELPERS
-    # --------------------------------------------------
-
-    def _dbg(self, cursor, msg):
-        if not self.debug:
-            return
-
-        context = 30
-        start = max(0, cursor - context)
-        end = min(len(self.raw), cursor + context)
-
-        snippet = self.raw[start:end].hex(" ")
-        pointer = "   " * (cursor - start) + "^^"
+    STANDARD_SLOT = 0x06
+    LOOPER_SLOT = 0x07
+    LOOPER_DUAL_SLOT = 0x01
+    # float parameters are float32, rounded to hide the float32 noise
+    PARAM_DIGITS = 2
+
+    def __init__(self, decoder: MsgPackDecoder, pos: int, end: int):
+        self.decoder = decoder
+        self.pos = pos
+        self.end = end
+        self._tree = None
+        self._module_ids = None
+
+    @property
+    def raw(self):
+        return self.decoder.buf[self.pos:self.end]
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            try:
+                self._tree, _ = self.decoder.decode(self.pos)
+            except MsgPackDecodeError as e:
+                log.warning('Cannot read slot data: ' + str(e))
+                self._tree = {}
+        return self._tree
+
+    @property
+    def content(self):
+        content = self.tree.get(SlotInfo.CONTENT)
+        return content if isinstance(content, dict) else {}
+
+    @property
+    def slot_type(self):
+        return self.tree.get(SlotInfo.SLOT_TYPE)
+
+    @property
+    def dual_slot(self):
+        if self.slot_type == SlotInfo.LOOPER_SLOT:
+            return self.content.get(SlotInfo.LOOPER_DUAL_SLOT)
+        return self.content.get(SlotInfo.MODULES, {}).get(SlotInfo.DUAL_SLOT)
+
+    @property
+    def enabled(self):
+        return self.content.get(SlotInfo.ENABLED)
+
+    @property
+    def amp_effect_slot_a(self):
+        return self._get_module_ids()[0]
+
+    @property
+    def amp_effect_slot_b(self):
+        return self._get_module_ids()[1]
+
+    @property
+    def parameter_a(self):
+        if self.slot_type != SlotInfo.STANDARD_SLOT:
+            return []
+        content = self.content
+        params = self.read_params(content.get(SlotInfo.INFO_SLOT_A))
+        if SlotInfo.BINARY_DATA in content:
+            # binary data - used in IRs
+            params.append(bytes(content[SlotInfo.BINARY_DATA]).hex())
+        return params
+
+    @property
+    def parameter_b(self):
+        content = self.content
+        if self.slot_type == SlotInfo.STANDARD_SLOT:
+            return self.read_params(content.get(SlotInfo.INFO_SLOT_B))
+        if self.slot_type in SlotInfo.INFO_BLOCK:
+            content = content.get(SlotInfo.INFO_BLOCK[self.slot_type], {})
+        return self.read_params(content.get(SlotInfo.INFO))
+
+    def _get_module_ids(self):
+        # module ids are kept encoded (e.g. b'\xcd\x01\x0a'), that's how they are listed in modules.py
+        if self._module_ids is None:
+            module_ids = [b'\xff', b'\xff']
+            decoder = self.decoder
+            try:
+                if decoder.buf[decoder.find_key(self.pos, SlotInfo.SLOT_TYPE)] == SlotInfo.STANDARD_SLOT:
+                    content = decoder.find_key(self.pos, SlotInfo.CONTENT)
+                    modules_pos = decoder.find_key(content, SlotInfo.MODULES)
+                    for i, key in enumerate([SlotInfo.AMP_EFFECT_SLOT_A, SlotInfo.AMP_EFFECT_SLOT_B]):
+                        module_ids[i] = decoder.raw(decoder.find_key(modules_pos, key))
+            except (KeyError, MsgPackDecodeError) as e:
+                log.warning('Cannot read module ids: ' + str(e))
+            self._module_ids = module_ids
+        return self._module_ids
 
-        print(f"\n[pos={cursor:03}] {msg}")
-        print(snippet)
-        print(pointer)
+    @staticmethod
+    def read_params(info):
+        if not isinstance(info, dict):
+            return []
+        return [SlotInfo.param_value(param) for param in info.get(SlotInfo.PARAMS, [])[:info.get(SlotInfo.NUM_PARAMS, 0)]]
 
-    def _log_field(self, marker, name, value):
-        if not self.debug:
-            return
-        print(f"    Parsed {hex(marker)} → {name} = {value}")
+    @staticmethod
+    def param_value(param):
+        if isinstance(param, float):
+            return round(param, SlotInfo.PARAM_DIGITS)
+        return param
 
     @staticmethod
-    def read_params(num_params, byte_data):
-
-        data = ''.join('{:02x}'.format(x) for x in byte_data)
-        bytes_read = 0
-        params = list()
-        # print(data)
-
-        while len(params) < num_params:
-            if data.startswith('c2'):
-                # boolean false
-                params.append(False)
-                data = data[2:]
-                bytes_read += 2
-            elif data.startswith('c3'):
-                # boolean true
-                bytes_read += 2
-                data = data[2:]
-                params.append(True)
-            elif data.startswith('ca'):
-                # float value
-                value = data[2:10]
-                ieee_val = ieee754_to_rendered_str(value)
-                data = data[10:]
-                bytes_read += 10
-                params.append(ieee_val)
-
-            else:
-                # should be a simple integer/index
-                param = int(data[0], 16) * 16 + int(data[1], 16)
-                data = data[2:]
-                bytes_read += 2
-                params.append(param)
-                '''
-                simple_int_value = data_stream[0:2]
-                params.append(simple_int_value)
-                data_stream = data_stream[2:]
-                '''
-        if data.startswith('1bda'):
-            # binary data - used in IRs. I spent some time understanding the code so I implemented it here
-            val1 = data[4:6]
-            val2 = data[6:8]
-            size_of_data = int(data[4:6], 16) * 16 + int(data[6:8], 16)
-            data = data[8:]
-            bytes_read += 8
-            # assert (len(data) > size_of_data * 2)
-            param = data[:size_of_data * 2]
-            params.append(param)
-            bytes_read += size_of_data * 2
-
-        return params, bytes_read
+    def decode_param(data, pos):
+        # a parameter value as the device reports it on a knob change (MessagePack, like in the preset data), in the
+        # form read_params returns it
+        value, _ = MsgPackDecoder(bytes(data[pos:])).decode()
+        return SlotInfo.param_value(value)
 
     def id_to_names(self):
         readable_name_a = readable_name_b = ''
         if self.amp_effect_slot_a != b'\xff':
-            beauty_str = ''.join('{:02x}'.format(x) for x in self.amp_effect_slot_a)
+            beauty_str = self.amp_effect_slot_a.hex()
             try:
                 readable_name_a = modules[beauty_str]
             except KeyError as _:
                 readable_name_a = ["NOT FOUND IN MODULES {}".format(beauty_str), '']
         if self.amp_effect_slot_b != b'\xff':
-            beauty_str = ''.join('{:02x}'.format(x) for x in self.amp_effect_slot_b)
+            beauty_str = self.amp_effect_slot_b.hex()
             try:
                 readable_name_b = modules[beauty_str]
             except KeyError as _:
                 readable_name_b = ["NOT FOUND IN MODULES {}".format(beauty_str), '']
         return [readable_name_a, readable_name_b]
 
-    # --------------------------------------------------
-    # PARSER
-    # --------------------------------------------------
-
-    def _parse(self):
-        data = self.raw
-        cursor = 0
-
-        active_field_map = self.FIELD_MAP
-        # ---- HEADER ----
-        header = data[cursor]
-        self._dbg(cursor, f"Reading header {hex(header)}")
-        cursor += 1
-
-        if (header & 0xF0) != 0x80:
-            raise ValueError("Invalid header")
-
-        child_count = header & 0x0F
-        print(f"\n== Slot type {child_count} ==") if self.debug else None
-
-        # ---- CHILDREN ----
-        for child_index in range(child_count):
-
-            self._dbg(cursor, f"Entering child #{child_index}")
-
-            while cursor < len(data):
-
-                marker = data[cursor]
-                self._dbg(cursor, f"Reading marker {hex(marker)}")
-                cursor += 1
-
-                if marker not in active_field_map:
-                    raise ValueError(f"Unknown marker {hex(marker)}")
-
-                field_name, field_type = active_field_map[marker]
-
-                # ---- TYPE HANDLING ----
-
-                if field_type == "byte":
-                    value = data[cursor]
-                    cursor += 1
-                    if field_name == 'slot_type':
-                        if value == 0x00:
-                            active_field_map = self.FIELD_MAP_00
-                        elif value == 0x01:
-                            active_field_map = self.FIELD_MAP_01
-                        elif value == 0x02:
-                            active_field_map = self.FIELD_MAP_02
-                        elif value == 0x03:
-                            active_field_map = self.FIELD_MAP_03
-                        elif value == 0x07:
-                            active_field_map = self.FIELD_MAP_LOOPER
-
-                elif field_type == "bool":
-                    raw = data[cursor]
-                    cursor += 1
-
-                    if raw == 0xC2:
-                        value = True
-                    elif raw == 0xC3:
-                        value = False
-                    else:
-                        raise ValueError("Invalid bool encoding")
-
-                elif field_type == "string":
-                    length_byte = data[cursor]
-                    cursor += 1
-
-                    # strlen = length_byte & 0x0F
-                    # Length of the values are stored in one byte.
-                    # a5 => 5 characters, a0 => 10 characters, aa => 11 characters and so on.
-                    # I don't know yet, wie 0xaf is not used for 16 characters but one example with 16 chars
-                    # used 0xb0 => 16 characters as coding. Maybe 0xaf should not be part of a message??
-                    # thus, the values of 0xa0 needs to subtracted from MSB
-                    strlen = (length_byte & 0xF0) - 0xA0 + (length_byte & 0x0F)
-                    raw_bytes = data[cursor:cursor+strlen]
-                    cursor += strlen
-
-                    if cursor < len(data) and data[cursor] == 0x00:
-                        cursor += 1
-
-                    value = raw_bytes.decode("ascii", errors="ignore")
-
-                elif isinstance(field_type, tuple) and field_type[0] == "until_marker":
-                    stop_marker = field_type[1]
-                    start = cursor
-
-                    self._dbg(cursor, "Scanning for stop condition (marker + bool)")
-
-                    while cursor < len(data) - 0:
-                        stop_condition_valid = True
-                        for i in range(0, len(stop_marker)):
-                            try:
-                                l = data[cursor+i]
-                                r = stop_marker[i]
-                                if data[cursor + i] != stop_marker[i]:
-                                    stop_condition_valid = False
-                            except Exception as _:
-                                pass
-                        if stop_condition_valid:
-                            self._dbg(cursor, "Stop condition found")
-                            break
-                        cursor += 1
-
-                    value = data[start:cursor]
-                    if field_name == "info_slot_a":
-                        num_params = value[2]
-                        params, bytes_processed = self.read_params(num_params, value[7:])
-                        self.parameter_a = params
-                    if field_name == "info_slot_b":
-                        num_params = value[2]
-                        params, bytes_processed = self.read_params(num_params, value[7:])
-                        self.parameter_b = params
-
-
-                elif field_type == "raw3":
-                    value = data[cursor:cursor + 3]
-                    cursor += 3
-
-                elif field_type == "until_end":
-                    start = cursor
-                    cursor = len(data)
-                    value = data[start:cursor]
-                    # beauty_str = ''.join('{:02x}'.format(x) for x in value)
-
-                    num_params = value[2]
-                    params, bytes_processed = self.read_params(num_params, value[7:])
-                    self.parameter_b = params
-
-                else:
-                    raise ValueError("Unknown field type")
-
-                setattr(self, field_name, value)
-                self._log_field(marker, field_name, value)
-
-            self._dbg(cursor, f"Finished child #{child_index}")
-
 
 class FootSwitchChild:
     LED_COLORS = [
@@ -315,303 +165,261 @@ class FootSwitchChild:
         'pink', 'auto_color']
 
     """
-    Represents one 0x87 child block.
-    Fields are assigned dynamically as attributes.
+    Represents one 0x87 child block:
+    {0x0a: index, 0x0b: {0x00: .., 0x05: label, 0x06: data, 0x07: enabled, ..}, 0x0c: state, 0x0d: flag1,
+     0x0e: custom_label, 0x0f: flag2, 0x10: led_color}
     """
 
-    FIELD_MAP = {
-        0x0A: ("index", "byte"),
-        0x0B: ("config", "raw3"),
-        0x05: ("label", "string"),
-        0x06: ("data_blob", ("until_marker_bool", 0x07)),
-        0x07: ("enabled", "bool"),
-        0x08: ("optional_param", "byte"), # In very (very) rare cases, such as:
-        0x02: ("optional_param", "byte"), # 91870a000b87000205a6426f6f73740006ce0007100c07c2
-        0x09: ("optional_param", "raw5"), # 0806020009831c001d0729c20cc20ea1000dc210000fc2c0
-        0x29: ("optional_param", "bool"), # we see those 4 parameters
-        0x0C: ("state", "bool"),
-        0x0E: ("custom_label", "string"),
-        0x0D: ("flag1", "bool"),
-        0x10: ("led_color", "byte"),
-        0x0F: ("flag2", "bool"),
-    }
-
-    def __init__(self):
+    INDEX = 0x0a
+    CONFIG = 0x0b
+    LABEL = 0x05
+    DATA_BLOB = 0x06
+    ENABLED = 0x07
+    STATE = 0x0c
+    FLAG1 = 0x0d
+    CUSTOM_LABEL = 0x0e
+    FLAG2 = 0x0f
+    LED_COLOR = 0x10
+
+    def __init__(self, tree=None):
         self.label = '--'
         self.custom_label = '--'
         self.led_color = -1
-
-
-class FootSwitchInfo:
-
-    def __init__(self, hex_string: str, debug=False):
-        self.raw = hex_string
-        self.children = []
-        self.debug = debug
-        self._parse()
-
-    # --------------------------------------------------
-    # DEBUG HELPERS
-    # --------------------------------------------------
-
-    def _dbg(self, cursor, msg):
-        if not self.debug:
+        self.tree = tree
+        if tree is None:
             return
 
-        context = 10
-        start = max(0, cursor - context)
-        end = min(len(self.raw), cursor + context)
+        self.index = tree.get(FootSwitchChild.INDEX)
+        self.config = tree.get(FootSwitchChild.CONFIG, {})
+        if FootSwitchChild.LABEL in self.config:
+            self.label = self.to_str(self.config[FootSwitchChild.LABEL])
+        self.data_blob = self.config.get(FootSwitchChild.DATA_BLOB)
+        self.enabled = self.config.get(FootSwitchChild.ENABLED)
+        self.state = tree.get(FootSwitchChild.STATE)
+        self.flag1 = tree.get(FootSwitchChild.FLAG1)
+        if FootSwitchChild.CUSTOM_LABEL in tree:
+            self.custom_label = self.to_str(tree[FootSwitchChild.CUSTOM_LABEL])
+        self.flag2 = tree.get(FootSwitchChild.FLAG2)
+        self.led_color = tree.get(FootSwitchChild.LED_COLOR, -1)
 
-        snippet = self.raw[start:end].hex(" ")
-        pointer = "   " * (cursor - start) + "^^"
+    @staticmethod
+    def to_str(value):
+        # labels keep their terminating 0x00
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value).decode("ascii", errors="ignore")
+        return str(value)
 
-        print(f"\n[pos={cursor:03}] {msg}")
-        print(snippet)
-        print(pointer)
 
-    def _log_field(self, marker, name, value):
-        if not self.debug:
-            return
-        print(f"    Parsed {hex(marker)} → {name} = {value}")
+class FootSwitchInfo:
+    # View on the assignments of one footswitch: an array of 0x87 children or nil for an unassigned switch
+
+    # in very (very) rare cases the index of a child is followed by an additional 0x00 which seems to be useless:
+    # 9187 -    0a 0000                 <-- see additional 0x00
+    # 		    0b 840003
+    # 		    05 a5 4e6f746500
+    # we need to jump over this byte in oder to make the structure fit again.
+    STRAY_INDEX_BYTE = re.compile(b'\x87\x0a[\x00-\x7f]\x00\x0b')
+    MAX_REPAIRS = 8
+
+    def __init__(self, decoder: MsgPackDecoder, pos: int):
+        self.decoder = decoder
+        self.pos = pos
+        self.end = pos
+        self.children = []
+        self._parse()
 
-    # --------------------------------------------------
-    # PARSER
-    # --------------------------------------------------
+    @property
+    def raw(self):
+        return self.decoder.buf[self.pos:self.end]
 
     def _parse(self):
-        data = self.raw
-        cursor = 0
-
-        # ---- HEADER ----
-        header = data[cursor]
-        self._dbg(cursor, f"Reading header {hex(header)}")
-        cursor += 1
-
-        if data[0] == 0xc0:
-            child = FootSwitchChild()
-            self.children.append(child)
-            return
-
-        if (header & 0xF0) != 0x90:
-            raise ValueError("Invalid header")
-
-        child_count = header & 0x0F
-        print(f"\n== Expecting {child_count} children ==") if self.debug else None
-
-        # ---- CHILDREN ----
-        for child_index in range(child_count):
-
-            if data[cursor] != 0x87:
-                raise ValueError("Expected child marker 0x87")
-
-            self._dbg(cursor, f"Entering child #{child_index}")
-            cursor += 1
-
-            child = FootSwitchChild()
-
-            while cursor < len(data):
-
-                if data[cursor] == 0x87:
-                    self._dbg(cursor, "Next child detected")
-                    break
-
-                marker = data[cursor]
-                self._dbg(cursor, f"Reading marker {hex(marker)}")
-                cursor += 1
-
-                if marker not in FootSwitchChild.FIELD_MAP:
-                    raise ValueError(f"Unknown marker {hex(marker)}")
-
-                field_name, field_type = FootSwitchChild.FIELD_MAP[marker]
-
-                # ---- TYPE HANDLING ----
-
-                if field_type == "byte":
-                    value = data[cursor]
-                    cursor += 1
-                    # in very (very) rare cases I found an addition byte with value 0x00 which seems to be useless.
-                    # correct example:
-                    # 9187 -    0a 00
-                    # 		    0b 840003
-                    # 		    05 a5 4e6f746500
-                    # wrong example:
-                    # 9187 -    0a 0000                 <-- see additional 0x00
-                    # 		    0b 840003
-                    # 		    05 a5 4e6f746500
-                    # we need to jump over this byte in oder to make the structure fit again.
-                    if marker == 0x0a and data[cursor] == 0x00:
-                        cursor += 1
-
-                elif field_type == "raw3":
-                    value = data[cursor:cursor+3]
-                    cursor += 3
-
-                elif field_type == "raw5":
-                    value = data[cursor:cursor+5]
-                    cursor += 5
-
-                elif field_type == "bool":
-                    raw = data[cursor]
-                    cursor += 1
-
-                    if raw == 0xC2:
-                        value = True
-                    elif raw == 0xC3:
-                        value = False
-                    else:
-                        raise ValueError("Invalid bool encoding")
-
-                elif field_type == "string":
-                    length_byte = data[cursor]
-                    cursor += 1
-
-                    # strlen = length_byte & 0x0F
-                    # Length of the values are stored in one byte.
-                    # a5 => 5 characters, a0 => 10 characters, aa => 11 characters and so on.
-                    # I don't know yet, wie 0xaf is not used for 16 characters but one example with 16 chars
-                    # used 0xb0 => 16 characters as coding. Maybe 0xaf should not be part of a message??
-                    # thus, the values of 0xa0 needs to subtracted from MSB
-                    strlen = (length_byte & 0xF0) - 0xA0 + (length_byte & 0x0F)
-                    raw_bytes = data[cursor:cursor+strlen]
-                    cursor += strlen
-
-                    if cursor < len(data) and data[cursor] == 0x00:
-                        cursor += 1
-
-                    value = raw_bytes.decode("ascii", errors="ignore")
-
-                elif isinstance(field_type, tuple) and field_type[0] == "until_marker_bool":
-                    stop_marker = field_type[1]
-                    start = cursor
-
-                    self._dbg(cursor, "Scanning for stop condition (marker + bool)")
-
-                    while cursor < len(data) - 1:
-                        if (
-                            data[cursor] == stop_marker and
-                            data[cursor + 1] in (0xC2, 0xC3)
-                        ):
-                            self._dbg(cursor, "Stop condition found")
-                            break
-                        cursor += 1
-
-                    value = data[start:cursor]
-
-                else:
-                    raise ValueError("Unknown field type")
-
-                setattr(child, field_name, value)
-                self._log_field(marker, field_name, value)
-
-            self.children.append(child)
-            self._dbg(cursor, f"Finished child #{child_index}")
+        try:
+            tree, self.end = self.decoder.decode(self.pos)
+        except MsgPackDecodeError as e:
+            tree = self._decode_repaired()
+            if tree is None:
+                log.warning('Cannot read footswitch data: ' + str(e))
+
+        if isinstance(tree, list) and all(isinstance(child, dict) for child in tree):
+            for child in tree:
+                self.children.append(FootSwitchChild(child))
+        else:
+            if tree is not None:
+                log.warning('Unexpected footswitch data at offset ' + str(self.pos))
+            self.children.append(FootSwitchChild())
+
+    def _decode_repaired(self):
+        data = bytearray(self.decoder.buf[self.pos:])
+        removed = []
+        for _ in range(FootSwitchInfo.MAX_REPAIRS):
+            match = FootSwitchInfo.STRAY_INDEX_BYTE.search(data, removed[-1] if len(removed) else 0)
+            if match is None:
+                return None
+            del data[match.start() + 3]
+            removed.append(match.start() + 3)
+            try:
+                tree, end = MsgPackDecoder(data).decode(0)
+            except MsgPackDecodeError:
+                continue
+            self.end = self.pos + end + len([r for r in removed if r <= end])
+            return tree
+        return None
 
 
 class HxPreset:
-    def __init__(self, data_in: str, preset_no=-1, preset_name=''):
+    # The preset data is a MessagePack document (behind an 8 byte header) holding the actual preset as binary blob
+    # in 0x68: "l6-helix" tag, a table of 12 offsets and the preset map. The offsets point to the keys of the preset
+    # map, so each section can be read on its own - a broken section doesn't keep us from reading the others.
+    DOCUMENT_POS = 8
+    DOCUMENT_LENGTH_POS = 4
+    DOCUMENT_KEY = 0x68
+    NUM_SECTION_OFFSETS = 12
+    SLOTS_KEY = 0x00
+    SLOT_LIST_KEY = 0x16
+    SWITCHES_KEY = 0x03
+    SWITCH_LIST_KEY = 0x08
+
+    # active snapshot: 86 06 0X 07 02 08
+    SNAPSHOT_MARKERS = [
+        (bytes([0x86, 0x06, 0x00, 0x07, 0x02, 0x08]), 1),
+        (bytes([0x86, 0x06, 0x01, 0x07, 0x02, 0x08]), 2),
+        (bytes([0x86, 0x06, 0x02, 0x07, 0x02, 0x08]), 3)
+    ]
+
+    def __init__(self, data_in, preset_no=-1, preset_name=''):
+        # data_in: preset data as bytes (or as hex string)
+        if isinstance(data_in, str):
+            data_in = bytes.fromhex(data_in)
         self.data_in = data_in
-        self.switch_info = []
-        self.slot_info = []
+        self.decoder = MsgPackDecoder(data_in)
         self.preset_no = preset_no
         self.preset_name = preset_name
+        self.preset_pos = -1
+        self.sections = {}
+        self._switch_info = None
+        self._slot_info = None
+        self._snapshot = None
         self._parse()
 
-    def _parse(self):
-        self.switch_info = []
-        self.slot_info = []
-
-        # switch infos
-        fs_info_data = self.extract_footswitch_sections(self.data_in)
-
-        for data in fs_info_data:
-            switch_info = FootSwitchInfo(data, debug=False)
-            self.switch_info.append(switch_info)
-            # print(switch_info)
-
-        # slot infos
-        slot_data = self.extract_slot_sections(self.data_in)
-
-        for data in slot_data:
-            slot_info = SlotInfo(data, debug=False)
-            self.slot_info.append(slot_info)
-            # print(slot_info.parameter_a)
-            # print(slot_info.parameter_b)
-
     @staticmethod
-    def extract_footswitch_sections(data):
-        begin = data.index('0895')
-        assert (begin >= 0)
-        data = data[begin + 4:]
-        end = data.index('049a')
-        assert (end >= 0)
-        data = data[:end]
-        data = bytes.fromhex(data)
-        # look for 9187, 9287, 9387 and so on
-        footswitch_sections_idx = []
-        cursor = 0
-        begin = -1
-        end = -1
-
-        # divide into 5 switch information
-        for peek_cursor in range(0, len(data)):
-            # print("{:x} {:x}".format(data[peek_cursor], data[peek_cursor+1]))
-            if (data[peek_cursor] & 0xF0) == 0x90 and data[peek_cursor + 1] == 0x87:
-                # begin of a new footswitch info section
-                if begin != -1:
-                    footswitch_sections_idx.append((begin, peek_cursor))
-                    begin = -1
-                    end = -1
-                begin = peek_cursor
-            elif data[peek_cursor] == 0xc0:
-                # empty slot
-                if begin != -1:
-                    footswitch_sections_idx.append((begin, peek_cursor))
-                begin = end = peek_cursor
-                footswitch_sections_idx.append((begin, end + 1))
-                begin = -1
-                end = -1
-        if begin > -1:
-            footswitch_sections_idx.append((begin, len(data)))
-
-        footswitch_sections_data = []
-        for section in footswitch_sections_idx:
-            footswitch_sections_data.append(data[section[0]:section[1]])
-
-        return footswitch_sections_data
+    def expected_length(data):
+        # total length of the preset data as announced by its header, -1 while the header is incomplete
+        if len(data) < HxPreset.DOCUMENT_POS:
+            return -1
+        return HxPreset.DOCUMENT_POS + struct.unpack_from('<I', data, HxPreset.DOCUMENT_LENGTH_POS)[0]
+
+    def _parse(self):
+        decoder = self.decoder
+        document = decoder.map_positions(HxPreset.DOCUMENT_POS)
+        if HxPreset.DOCUMENT_KEY not in document:
+            raise ValueError("No preset data found")
+        begin, end = decoder.str_span(document[HxPreset.DOCUMENT_KEY])
+
+        table_begin, table_end = decoder.str_span(decoder.skip(begin))
+        if table_end - table_begin < 4 * HxPreset.NUM_SECTION_OFFSETS:
+            raise ValueError("Invalid section table")
+        offsets = struct.unpack_from('<' + str(HxPreset.NUM_SECTION_OFFSETS) + 'I', decoder.buf, table_begin)
+
+        # offsets[0] is the preset map itself, the remaining ones point to its keys or to the end of the data
+        self.preset_pos = begin + offsets[0]
+        buf = decoder.buf
+        for offset in offsets[1:]:
+            pos = begin + offset
+            if pos < end and buf[pos] < 0x80 and buf[pos] not in self.sections:
+                self.sections[buf[pos]] = pos + 1
+
+        if HxPreset.SLOTS_KEY not in self.sections or HxPreset.SWITCHES_KEY not in self.sections:
+            # no usable offsets - walk the preset map instead
+            self.sections = decoder.map_positions(self.preset_pos)
 
     @staticmethod
-    def extract_slot_sections(data):
-        begin = data.index('8215')
-        assert (begin >= 0)
-        data = data[begin + 14:]
-        end = data.index('0895')
-        assert (end >= 0)
-        data = data[:end]
-        data = bytes.fromhex(data)
-        # look for 9187, 9287, 9387 and so on
-        slot_sections_idx = []
-        cursor = 0
-        begin = -1
-        end = -1
-
-        # divide into 5 switch information
-        for peek_cursor in range(0, len(data)):
-            # print("{:x} {:x}".format(data[peek_cursor], data[peek_cursor+1]))
-            if (data[peek_cursor] & 0xF0) == 0x80 and data[peek_cursor + 1] == 0x13:
-                # begin of a new footswitch info section
-                if begin != -1:
-                    slot_sections_idx.append((begin, peek_cursor))
-                    begin = -1
-                    end = -1
-                begin = peek_cursor
-        if begin > -1:
-            slot_sections_idx.append((begin, len(data)))
-
-        slot_sections_data = []
-        for section in slot_sections_idx:
-            slot_sections_data.append(data[section[0]:section[1]])
-
-        return slot_sections_data
+    def find_snapshot(data):
+        # active snapshot (1..3) of the preset data, -1 if there is no marker
+        for marker, snapshot in HxPreset.SNAPSHOT_MARKERS:
+            if marker in data:
+                return snapshot
+        return -1
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self.find_snapshot(self.data_in)
+        return self._snapshot
+
+    @property
+    def tree(self):
+        # the whole preset map decoded in one pass
+        return self.decoder.decode(self.preset_pos)[0]
+
+    def section(self, key):
+        # decoded section of the preset map, e.g. section(HxPreset.SLOTS_KEY)
+        return self.decoder.decode(self.sections[key])[0]
+
+    @property
+    def slot_info(self):
+        if self._slot_info is None:
+            self._slot_info = self._read_slot_info()
+        return self._slot_info
+
+    @property
+    def switch_info(self):
+        if self._switch_info is None:
+            self._switch_info = self._read_switch_info()
+        return self._switch_info
+
+    def _read_slot_info(self):
+        decoder = self.decoder
+        buf = decoder.buf
+        slot_list = decoder.find_key(self.sections[HxPreset.SLOTS_KEY], HxPreset.SLOT_LIST_KEY)
+        _, num_slots, pos = decoder.container(slot_list)
+
+        slot_info = []
+        for slot_no in range(num_slots):
+            if not self._is_slot(pos):
+                # broken slot data, continue with the next slot map
+                pos = self._find_slot(slot_info[-1].pos + 1 if len(slot_info) else pos)
+                if pos == -1:
+                    log.warning('Preset ' + str(self.preset_no) + ': only ' + str(slot_no) + ' slots found')
+                    break
+            try:
+                end = decoder.skip(pos)
+            except MsgPackDecodeError as e:
+                log.warning('Preset ' + str(self.preset_no) + ': cannot read slot ' + str(slot_no) + ': ' + str(e))
+                end = pos + 2
+            slot_info.append(SlotInfo(decoder, pos, end))
+            pos = end
+        return slot_info
+
+    def _is_slot(self, pos):
+        # slots are maps starting with the slot type
+        buf = self.decoder.buf
+        return pos + 1 < len(buf) and buf[pos] & 0xf0 == 0x80 and buf[pos + 1] == SlotInfo.SLOT_TYPE
+
+    def _find_slot(self, pos):
+        buf = self.decoder.buf
+        pos = buf.find(SlotInfo.SLOT_TYPE, pos + 1)
+        while pos != -1:
+            if self._is_slot(pos - 1):
+                return pos - 1
+            pos = buf.find(SlotInfo.SLOT_TYPE, pos + 1)
+        return -1
+
+    def _read_switch_info(self):
+        decoder = self.decoder
+        switch_list = decoder.find_key(self.sections[HxPreset.SWITCHES_KEY], HxPreset.SWITCH_LIST_KEY)
+
+        _, num_switches, pos = decoder.container(switch_list)
+
+        switch_info = []
+        for _ in range(num_switches):
+            info = FootSwitchInfo(decoder, pos)
+            switch_info.append(info)
+            if info.end == info.pos:
+                # broken data, the following switches cannot be located
+                log.warning('Preset ' + str(self.preset_no) + ': only ' + str(len(switch_info)) + ' footswitches found')
+                break
+            pos = info.end
+        return switch_info
 
     def to_string(self):
 
@@ -626,6 +434,8 @@ class HxPreset:
 
         print("Slots: ")
         for slot_idx in slots_idx:
+            if slot_idx >= len(self.slot_info):
+                break
             module_name_info = self.slot_info[slot_idx].id_to_names()
             beauty_str = ''
             if module_name_info[0] == '' and module_name_info[1] == '':
@@ -642,7 +452,7 @@ class HxPreset:
 
         print("")
         print("Switches: ")
-        for i in range(0, 5):
+        for i in range(0, min(5, len(self.switch_info))):
             for j, child in enumerate(self.switch_info[i].children):
                 if j == 0:
                     print('[{}]: '.format(i + 1), end='')
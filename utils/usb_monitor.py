@@ -1,9 +1,15 @@
 import usb.core
 import usb.util
+import os
+import socket
+import struct
 import time
-import re
 import threading
 import logging
+try:
+    import usb1
+except ImportError:
+    usb1 = None
 log = logging.getLogger(__name__)
 
 
@@ -22,8 +28,23 @@ class UsbDescriptor:
 
 
 class UsbMonitor:
+    # Reports arrival and removal of the white listed devices. Events come from libusb hotplug (python libusb1
+    # package) or the kernel's uevent netlink socket, polling is only used if neither is available. Devices are
+    # matched on idVendor/idProduct, a hotplug event only looks up the one device it is about.
     POLLING_INTERVAL_IN_SEC = 1
-    regex = r"DEVICE ID ([a-f0-9]*:[a-f0-9]*) on Bus ([0-9][0-9][0-9]) Address ([0-9][0-9][0-9]) [=]*"
+    # how long the event loops wait before checking request_terminate
+    EVENT_WAIT_IN_SEC = 0.5
+    # a new device can take a moment until it shows up in the device list of pyusb's libusb context
+    ARRIVAL_RETRIES = 20
+    ARRIVAL_RETRY_DELAY_IN_SEC = 0.01
+
+    NETLINK_KOBJECT_UEVENT = 15
+    UEVENT_GROUP_KERNEL = 1
+    # udev re-sends the kernel events once its rules (device permissions) have been applied
+    UEVENT_GROUP_UDEV = 2
+    UDEV_CONTROL_PATH = '/run/udev/control'
+    UDEV_MESSAGE_PREFIX = b'libudev\0'
+    UDEV_PROPERTIES_POS = 16
 
     def __init__(self, white_list_device_ids=list()):
         self.reported_devices = list()
@@ -31,53 +52,178 @@ class UsbMonitor:
         self.usb_device_lost_cb_list = list()
         self.request_terminate = False
         self.white_list_device_ids = white_list_device_ids
+        self.white_list_ids = set(self.parse_device_id(device_id) for device_id in white_list_device_ids)
         self.monitor_thread = None
+        self.lock = threading.Lock()
 
     @staticmethod
-    def device_to_usb_descriptor(device):
-        matches = re.finditer(UsbMonitor.regex, str(device), re.MULTILINE)
-        for matchNum, match in enumerate(matches, start=1):
+    def parse_device_id(device_id):
+        vendor_id, product_id = device_id.split(':')
+        return int(vendor_id, 16), int(product_id, 16)
 
-            if len(match.groups()) != 3:
-                print('Unexpected group size while looking for USB data (3 expected): ' +
-                      str(len(match.groups())))
-                continue
+    @staticmethod
+    def format_device_id(vendor_id, product_id):
+        return '{:04x}:{:04x}'.format(vendor_id, product_id)
 
-            _ = match.group(0)
-            device_id = match.group(1)
-            bus = match.group(2)
-            address = match.group(3)
+    @staticmethod
+    def device_to_usb_descriptor(device):
+        if device is None:
+            return None
+        return UsbDescriptor(UsbMonitor.format_device_id(device.idVendor, device.idProduct),
+                             '{:03d}'.format(device.bus), '{:03d}'.format(device.address), device)
+
+    def is_white_listed(self, vendor_id, product_id):
+        return (vendor_id, product_id) in self.white_list_ids
+
+    def scan(self):
+        # full comparison of connected and reported devices, used at start and when polling
+        white_list_ids = self.white_list_ids
+        devices = usb.core.find(find_all=True, custom_match=lambda dev: (dev.idVendor, dev.idProduct) in white_list_ids)
+        connected_devices = [self.device_to_usb_descriptor(dev) for dev in devices]
+
+        with self.lock:
+            found = [dev for dev in connected_devices if dev not in self.reported_devices]
+            lost = [dev for dev in self.reported_devices if dev not in connected_devices]
+            self.reported_devices = connected_devices
 
-            return UsbDescriptor(device_id, bus, address, device)
-        return None
+        for dev in found:
+            self.report_found(dev)
+        for dev in lost:
+            self.report_lost(dev)
+
+    def device_arrived(self, vendor_id, product_id, bus, address):
+        if not self.is_white_listed(vendor_id, product_id):
+            return
+        for _ in range(self.ARRIVAL_RETRIES):
+            device = usb.core.find(idVendor=vendor_id, idProduct=product_id, bus=bus, address=address)
+            if device is not None:
+                break
+            time.sleep(self.ARRIVAL_RETRY_DELAY_IN_SEC)
+        else:
+            log.warning('Device ' + self.format_device_id(vendor_id, product_id) + ' arrived but cannot be found')
+            return
+
+        usb_descriptor = self.device_to_usb_descriptor(device)
+        with self.lock:
+            if usb_descriptor in self.reported_devices:
+                return
+            self.reported_devices.append(usb_descriptor)
+        self.report_found(usb_descriptor)
+
+    def device_left(self, bus, address):
+        bus = '{:03d}'.format(bus)
+        address = '{:03d}'.format(address)
+        with self.lock:
+            lost = [dev for dev in self.reported_devices if dev.bus == bus and dev.address == address]
+            for dev in lost:
+                self.reported_devices.remove(dev)
+        for dev in lost:
+            self.report_lost(dev)
+
+    def report_found(self, usb_descriptor):
+        for cb in self.usb_device_found_cb_list:
+            cb(usb_descriptor)
+
+    def report_lost(self, usb_descriptor):
+        for cb in self.usb_device_lost_cb_list:
+            cb(usb_descriptor)
 
     def monitor(self):
         log.info('Looking for connected USB devices: ' + str(self.white_list_device_ids))
-        while not self.request_terminate:
-            connected_devices = list()
-            for dev in usb.core.find(find_all=True):
-
-                usb_descriptor = self.device_to_usb_descriptor(dev)
-
-                if usb_descriptor is not None:
-                    connected_devices.append(usb_descriptor)
-
-            # look for new devices
-            for dev in connected_devices:
-                if dev not in self.reported_devices:
-                    if dev.device_id in self.white_list_device_ids:
-                        for cb in self.usb_device_found_cb_list:
-                            cb(dev)
+        self.scan()
+        for monitor_events in [self.monitor_hotplug, self.monitor_uevents]:
+            if self.request_terminate:
+                return
+            # returns False if the event source is unavailable
+            if monitor_events():
+                return
+        self.monitor_polling()
+
+    def monitor_hotplug(self):
+        if usb1 is None or not usb1.hasCapability(usb1.CAP_HAS_HOTPLUG):
+            return False
+        try:
+            with usb1.USBContext() as context:
+                # no enumeration of present devices, scan() has reported them already
+                context.hotplugRegisterCallback(self.on_hotplug_event, flags=0)
+                log.info('Using libusb hotplug events')
+                while not self.request_terminate:
+                    context.handleEventsTimeout(tv=self.EVENT_WAIT_IN_SEC)
+        except usb1.USBError as e:
+            log.warning('libusb hotplug unavailable: ' + str(e))
+            return False
+        return True
+
+    def on_hotplug_event(self, context, device, event):
+        if event == usb1.HOTPLUG_EVENT_DEVICE_ARRIVED:
+            self.device_arrived(device.getVendorID(), device.getProductID(), device.getBusNumber(),
+                                device.getDeviceAddress())
+        elif event == usb1.HOTPLUG_EVENT_DEVICE_LEFT:
+            self.device_left(device.getBusNumber(), device.getDeviceAddress())
+        return False  # keep the callback registered
+
+    def monitor_uevents(self):
+        if not hasattr(socket, 'AF_NETLINK'):
+            return False
+        group = self.UEVENT_GROUP_UDEV if os.path.exists(self.UDEV_CONTROL_PATH) else self.UEVENT_GROUP_KERNEL
+        try:
+            uevent_socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_KOBJECT_UEVENT)
+            uevent_socket.bind((0, group))
+        except OSError as e:
+            log.warning('Netlink uevents unavailable: ' + str(e))
+            return False
 
-            # look for lost devices
-            for dev in self.reported_devices:
-                if dev not in connected_devices:
-                    if dev.device_id in self.white_list_device_ids:
-                        for cb in self.usb_device_lost_cb_list:
-                            cb(dev)
+        log.info('Using netlink uevents (' + ('udev' if group == self.UEVENT_GROUP_UDEV else 'kernel') + ')')
+        uevent_socket.settimeout(self.EVENT_WAIT_IN_SEC)
+        with uevent_socket:
+            while not self.request_terminate:
+                try:
+                    data = uevent_socket.recv(65536)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    log.warning('Netlink uevents failed: ' + str(e))
+                    return False
+                self.on_uevent(self.parse_uevent(data))
+        return True
 
-            self.reported_devices = connected_devices
+    @staticmethod
+    def parse_uevent(data):
+        # kernel: "ACTION@DEVPATH\0KEY=VALUE\0...", udev: libudev header followed by "KEY=VALUE\0..."
+        if data.startswith(UsbMonitor.UDEV_MESSAGE_PREFIX):
+            properties_pos, properties_len = struct.unpack_from('=II', data, UsbMonitor.UDEV_PROPERTIES_POS)
+            fields = data[properties_pos:properties_pos + properties_len].split(b'\0')
+        else:
+            fields = data.split(b'\0')[1:]
+
+        properties = {}
+        for field in fields:
+            key, sep, value = field.partition(b'=')
+            if sep:
+                properties[key.decode('ascii', 'replace')] = value.decode('ascii', 'replace')
+        return properties
+
+    def on_uevent(self, properties):
+        if properties.get('SUBSYSTEM') != 'usb' or properties.get('DEVTYPE') != 'usb_device':
+            return
+        try:
+            bus = int(properties['BUSNUM'])
+            address = int(properties['DEVNUM'])
+            action = properties['ACTION']
+            if action == 'add':
+                # PRODUCT is idVendor/idProduct/bcdDevice in hex
+                vendor_id, product_id = [int(x, 16) for x in properties['PRODUCT'].split('/')[:2]]
+                self.device_arrived(vendor_id, product_id, bus, address)
+            elif action == 'remove':
+                self.device_left(bus, address)
+        except (KeyError, ValueError) as e:
+            log.warning('Cannot read USB uevent: ' + str(e))
+
+    def monitor_polling(self):
+        log.info('No USB hotplug events available, polling every ' + str(self.POLLING_INTERVAL_IN_SEC) + ' s')
+        while not self.request_terminate:
             time.sleep(self.POLLING_INTERVAL_IN_SEC)
+            self.scan()
 
     def start(self):
         self.monitor_thread = threading.Thread(target=self.monitor, args=())
@@ -0,0 +1,405 @@
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import threading
+import getopt
+from packet_dispatcher import PacketDispatcher
+from preset_archive import PresetArchive
+from utils.usb_monitor import UsbDescriptor
+import logging
+log = logging.getLogger(__name__)
+
+
+class VirtualDeviceClosed(IOError):
+	pass
+
+
+class VirtualEndpoint:
+	# stands in for a pyusb endpoint, only write() and read() as used by HelixUsb are provided
+	def __init__(self, address, write_fct=None, read_fct=None, max_packet_size=512):
+		self.bEndpointAddress = address
+		self.wMaxPacketSize = max_packet_size
+		self.write_fct = write_fct
+		self.read_fct = read_fct
+
+	def write(self, data, timeout=None):
+		self.write_fct(bytes(data))
+		return len(data)
+
+	def read(self, size_or_buffer, timeout=None):
+		return self.read_fct(size_or_buffer)
+
+
+class VirtualHelix:
+	# HX Stomp without hardware: answers the connection handshake, keep-alives, preset name, preset names and preset
+	# data requests and MIDI program changes with packets shaped like the recorded device traffic.
+	# Every packet to the host can be delayed (latency + jitter, order is kept) or dropped (loss). Scripted answers
+	# take precedence over the built-in ones:
+	#   device = VirtualHelix(VirtualHelix.load_corpus('ideas/20260226_all_data.txt'), latency=0.001, loss=0.01)
+	#   device.on([0x19, 0x0, 0x0, 0x18, 0x80, ...], lambda data: device.send(...))
+	#   helix_usb.usb_device_found_cb(device.descriptor())
+	is_virtual = True
+	DEVICE_ID = '0e41:4246'
+	idVendor = 0x0e41
+	idProduct = 0x4246
+	bus = 0
+	address = 0
+
+	PRESET_COUNT = 126
+	NAME_COUNT = 125
+	PAYLOAD_SIZE = 0x100
+	NAME_RECORD_MARKER = bytes([0x81, 0xcd, 0x0])
+	NAME_LENGTH = 16
+	PRESET_NAME_LENGTH = 24
+
+	# source bytes of the device per channel (bytes 4, 5 of a device packet, the host uses them in bytes 6, 7)
+	SOURCE = {0x1: (0xef, 0x3), 0x2: (0xf0, 0x3), 0x80: (0xed, 0x3)}
+
+	def __init__(self, presets=None, names=None, latency=0.0, jitter=0.0, loss=0.0, seed=None, serial='VIRTUAL-0001'):
+		self.presets = list(presets or [])
+		self.names = list(names or [])
+		self.latency = latency
+		self.jitter = jitter
+		self.loss = loss
+		self.random = random.Random(seed)
+		self.serial = serial
+		self.current_preset_no = 0
+
+		self.condition = threading.Condition()
+		# (due, packet no, packet), packets to the host in send order
+		self.to_host = []
+		self.last_due = 0.0
+		self.send_cnt = 0
+		self.closed = False
+		self.seq = {0x1: 0x5, 0x2: 0x5, 0x80: 0x5}
+
+		self.received_cnt = 0
+		self.sent_cnt = 0
+		self.dropped_cnt = 0
+
+		self.script = PacketDispatcher()
+		# replayed answers: request pattern -> recorded answers, next answer
+		self.replay_answers = {}
+		self.replay_pos = {}
+		self.endpoint_0x1 = VirtualEndpoint(0x1, write_fct=self.host_out)
+		self.endpoint_0x81 = VirtualEndpoint(0x81, read_fct=self.host_in)
+		self.endpoint_0x2 = VirtualEndpoint(0x2, write_fct=self.midi_out)
+
+	@staticmethod
+	def load_corpus(path):
+		# preset data as hex, one preset per line (like ideas/20260226_all_data.txt)
+		with open(path, 'r', encoding='utf-8') as file:
+			return [bytes.fromhex(line.strip()) for line in file if line.strip()]
+
+	@staticmethod
+	def load_archive(path):
+		# presets and names of a backup archive, placed at their preset numbers
+		presets = [b''] * VirtualHelix.PRESET_COUNT
+		names = [''] * VirtualHelix.PRESET_COUNT
+		for preset_no, name, data in PresetArchive.read(path):
+			if 0 <= preset_no < VirtualHelix.PRESET_COUNT:
+				presets[preset_no] = data
+				names[preset_no] = name
+		return presets, names
+
+	@staticmethod
+	def load_replay(path):
+		# exchanges recorded from a session capture, see utils/capture_convert.py
+		with open(path, 'r', encoding='utf-8') as file:
+			return json.load(file)['exchanges']
+
+	@staticmethod
+	def replay_pattern(request):
+		# the sequence number and, on x80, session, packet double and request id differ from run to run
+		pattern = list(request)
+		wildcards = [9]
+		if len(pattern) >= 16 and pattern[4] == 0x80:
+			wildcards += [12, 13, 14, 28]
+		for pos in wildcards:
+			if pos < len(pattern):
+				pattern[pos] = "XX"
+		return pattern
+
+	def replay(self, exchanges):
+		# answers requests like the recorded device did, repeated requests get the recorded answers in turn.
+		# Requests which never got an answer keep the built-in handling.
+		for exchange in exchanges:
+			key = tuple(VirtualHelix.replay_pattern(bytes.fromhex(exchange['request'])))
+			answers = [(delay_ms / 1000.0, bytes.fromhex(packet)) for delay_ms, packet in exchange['responses']]
+			self.replay_answers.setdefault(key, []).append(answers)
+		for key, answers in self.replay_answers.items():
+			if any(len(answer) for answer in answers):
+				self.on(list(key), lambda data, key=key: self.on_replay(key), length=len(key))
+
+	def on_replay(self, key):
+		answers = self.replay_answers[key]
+		pos = self.replay_pos.get(key, 0)
+		self.replay_pos[key] = pos + 1
+		for delay, packet in answers[min(pos, len(answers) - 1)]:
+			self.send(packet, delay)
+
+	def descriptor(self):
+		return UsbDescriptor(VirtualHelix.DEVICE_ID, '{:03d}'.format(self.bus), '{:03d}'.format(self.address), self)
+
+	def preset_data(self, preset_no):
+		if len(self.presets) == 0:
+			return b''
+		return self.presets[preset_no % len(self.presets)]
+
+	def preset_name(self, preset_no):
+		if preset_no < len(self.names) and self.names[preset_no]:
+			return self.names[preset_no]
+		return 'Preset ' + str(preset_no)
+
+	def on(self, pattern, fct, length=-1):
+		# fct(data) is called for packets from the host matching pattern instead of the built-in answer
+		self.script.register(pattern, length=length, handler=fct)
+
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+
+	# host -> device
+
+	def host_out(self, data):
+		if self.closed:
+			return
+		self.received_cnt += 1
+		fct = self.script.resolve(data)
+		if fct is not None:
+			fct(data)
+			return
+		handler = VirtualHelix.REQUESTS.resolve(data)
+		if handler is not None:
+			handler(self, data)
+		else:
+			log.debug('No answer for ' + data.hex())
+
+	def midi_out(self, data):
+		# USB-MIDI event packet, program changes switch the preset like the footswitches do
+		if len(data) >= 3 and data[0] == 0x0c and data[1] & 0xf0 == 0xc0:
+			self.current_preset_no = data[2]
+			self.send(self.packet(0x2, [0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x11, 0x0, 0x0, 0x0, 0x82, 0x69, 0x4,
+										0x6a, 0x84, 0x52, 0x1, 0x44, 0x1, 0x79, 0x19, 0x6a, 0x82, 0x6b, 0x0, 0x6c,
+										self.current_preset_no]))
+
+	# device -> host
+
+	def host_in(self, buffer):
+		with self.condition:
+			while True:
+				if self.closed:
+					raise VirtualDeviceClosed('Virtual device closed')
+				if len(self.to_host):
+					wait = self.to_host[0][0] - time.monotonic()
+					if wait <= 0:
+						break
+				else:
+					wait = None
+				self.condition.wait(wait)
+			_, _, packet = heapq.heappop(self.to_host)
+		length = min(len(packet), len(buffer))
+		memoryview(buffer)[:length] = packet[:length]
+		return length
+
+	def send(self, packet, delay=0.0):
+		if self.loss > 0 and self.random.random() < self.loss:
+			self.dropped_cnt += 1
+			return
+		delay += self.latency
+		if self.jitter > 0:
+			delay = max(0.0, delay + self.random.uniform(-self.jitter, self.jitter))
+		with self.condition:
+			# USB keeps the order of an endpoint, jitter only delays
+			due = max(time.monotonic() + delay, self.last_due)
+			self.last_due = due
+			self.send_cnt += 1
+			heapq.heappush(self.to_host, (due, self.send_cnt, bytes(packet)))
+			self.sent_cnt += 1
+			self.condition.notify_all()
+
+	def next_seq(self, channel):
+		seq = self.seq[channel]
+		self.seq[channel] = (seq + 1) & 0xff
+		return seq
+
+	def packet(self, channel, body, seq=None, length=None):
+		# device packet: length, header with the device source and channel, body from byte 11 on, 4 byte aligned
+		if seq is None:
+			seq = self.next_seq(channel)
+		source = VirtualHelix.SOURCE[channel]
+		packet = bytearray([0x0, 0x0, 0x0, 0x18, source[0], source[1], channel, 0x10, 0x0, seq, 0x0])
+		packet += bytes(body)
+		if length is None:
+			length = len(packet) - 8
+		packet[0:2] = length.to_bytes(2, 'little')
+		packet += bytes(-len(packet) % 4)
+		return packet
+
+	def short_packet(self, channel, data):
+		# handshake packets as recorded, byte 4.. are given
+		source = VirtualHelix.SOURCE[channel]
+		return bytes(data[:4]) + bytes([source[0], source[1], channel]) + bytes(data[7:])
+
+	# built-in answers
+
+	def on_open(self, data):
+		# data[4] is the channel the host opens
+		channel = data[4]
+		self.seq[channel] = 0x5
+		self.send(self.short_packet(channel, [0xc, 0x0, 0x0, 0x28, 0x0, 0x0, 0x0, 0x10, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1,
+											  0x0, 0x1, 0x0, 0x2, 0x0, 0x0]))
+
+	def on_open_reply(self, data):
+		channel = data[4]
+		if channel == 0x1 and data[18] == 0x5:
+			# first open of x1 during connect: device info follows
+			self.send(self.packet(0x1, [0x4, 0x9, 0x2] + [0x0] * 34, seq=0x2))
+		else:
+			self.send(self.packet(channel, [0x4, 0x9, 0x2, 0x0, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1, 0x0, 0x0, 0x0, 0x4, 0x50,
+											0x33, 0x33], seq=0x2, length=0x11))
+
+	def on_x1_info_ack(self, data):
+		self.send(self.packet(0x1, [0x8, 0x9, 0x2, 0x0, 0x0], seq=0x3))
+
+	def on_x1_ack_3_reply(self, data):
+		self.send(self.packet(0x1, [0x8, 0x9, 0x2, 0x0, 0x0], seq=0x4))
+
+	def on_keep_alive(self, data):
+		channel = data[4]
+		self.send(self.packet(channel, [0x10, 0x0, 0x0, 0x0, 0x0]))
+
+	def on_preset_name_request(self, data):
+		name = self.preset_name(self.current_preset_no).encode('latin-1', errors='replace')
+		name = name[:VirtualHelix.PRESET_NAME_LENGTH - 1]
+		body = [0x4, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x0, 0x0, 0x67, 0x0,
+				0x68, 0x86, 0x6b, 0xcd, 0x0, 0x0, 0x6c, 0xcd, 0x0, 0x0, 0x6d, 0xb8]
+		body += list(name.ljust(VirtualHelix.PRESET_NAME_LENGTH, b'\x00'))
+		self.send(self.packet(0x80, body))
+
+	def on_preset_request(self, data):
+		self.send_payload(0x80, [0x4, data[12], 0x7, 0x0, 0x0], self.preset_data(self.current_preset_no))
+
+	def on_preset_names_request(self, data):
+		stream = bytearray()
+		for preset_no in range(VirtualHelix.NAME_COUNT):
+			name = self.preset_name(preset_no).encode('latin-1', errors='replace')[:VirtualHelix.NAME_LENGTH]
+			stream += VirtualHelix.NAME_RECORD_MARKER
+			stream += bytes([0x6b, preset_no // 25, 0x6c, preset_no % 25, 0x6d, 0x0])
+			stream += name.ljust(VirtualHelix.NAME_LENGTH, b'\x00')
+		self.send_payload(0x1, [0x4, 0x9, 0x2, 0x0, 0x0], stream)
+
+	def send_payload(self, channel, body, payload):
+		# full packets carry PAYLOAD_SIZE bytes, the last packet stays below 0x100 in its length field
+		pos = 0
+		while pos < len(payload):
+			size = min(VirtualHelix.PAYLOAD_SIZE, len(payload) - pos)
+			if size < VirtualHelix.PAYLOAD_SIZE and size + 8 > 0xff:
+				size = 0xf0
+			self.send(self.packet(channel, body + list(payload[pos:pos + size])))
+			pos += size
+
+	REQUESTS = PacketDispatcher()
+	REQUESTS.register([0xc, 0x0, 0x0, 0x28, "XX", 0x10, "XX", 0x3, 0x0, 0x0, 0x0, 0x2, 0x0, 0x1, 0x0, 0x21], length=16, handler=on_open)
+	REQUESTS.register([0x11, 0x0, 0x0, 0x18, "XX", 0x10, "XX", 0x3, 0x0, "XX", 0x0, 0x4, 0x0, 0x10, 0x0, 0x0, 0x1, 0x0], length=18, handler=on_open_reply)
+	REQUESTS.register([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x20, 0x10], length=14, handler=on_x1_info_ack)
+	REQUESTS.register([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x2, 0x20, 0x10], length=14, handler=on_x1_ack_3_reply)
+	REQUESTS.register([0x8, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0x8, 0x72, 0x1e], length=14, handler=on_keep_alive)
+	REQUESTS.register([0x8, 0x0, 0x0, 0x18, 0x2, 0x10, 0xf0, 0x3, 0x0, "XX", 0x0, 0x10], length=12, handler=on_keep_alive)
+	REQUESTS.register([0x8, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x10], length=12, handler=on_keep_alive)
+	REQUESTS.register([0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0x4, "XX", "XX", "XX", 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x4, 0x4, 0x64, 0x17], length=31, handler=on_preset_name_request)
+	REQUESTS.register([0x19, 0x0, 0x0, 0x18, 0x80, 0x10, 0xed, 0x3, 0x0, "XX", 0x0, 0xc, "XX", "XX", "XX", 0x0, 0x1, 0x0, 0x6, 0x0, 0x9, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, "XX", 0x64, 0x16, 0x65], length=32, handler=on_preset_request)
+	REQUESTS.register([0x1d, 0x0, 0x0, 0x18, 0x1, 0x10, 0xef, 0x3, 0x0, "XX", 0x0, 0xc, "XX", "XX", 0x0, 0x0, 0x1, 0x0, 0x2, 0x0, 0xd, 0x0, 0x0, 0x0, 0x83, 0x66, 0xcd, 0x3, "XX", 0x64, 0x1, 0x65], length=32, handler=on_preset_names_request)
+
+
+def print_usage():
+	print("Usage: %s [options]" % sys.argv[0])
+	print()
+	print('Connects HelixUsb to a virtual HX Stomp and times connect, preset names and a full backup.')
+	print()
+	print("Options:")
+	print('\t-c <file>\tPreset corpus, one preset as hex per line (default: ideas/20260226_all_data.txt)')
+	print('\t-a <file.zip>\tServe the presets of a backup archive instead')
+	print('\t-r <file.json>\tAnswer like a recorded session (replay file of utils/capture_convert.py)')
+	print('\t-l <ms>\t\tLatency of every device packet (default: 0)')
+	print('\t-j <ms>\t\tJitter added to the latency (default: 0)')
+	print('\t-p <ratio>\tPacket loss, 0..1 (default: 0)')
+	print('\t-n <count>\tNumber of presets to back up (default: all)')
+	print('\t-o <file.zip>\tBackup archive to write (default: virtual_backup.zip)')
+	print('\t-h\t\tShow this help text and exit')
+	sys.exit(1)
+
+
+def main(argv):
+	logging.basicConfig(
+		level='WARNING',
+		format="%(asctime)s - %(levelname)s - %(message)s (%(name)s)",
+		datefmt="%Y-%m-%d %H:%M:%S")
+
+	corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ideas', '20260226_all_data.txt')
+	archive_path = None
+	replay_path = None
+	latency = jitter = loss = 0.0
+	preset_cnt = VirtualHelix.PRESET_COUNT
+	backup_path = 'virtual_backup.zip'
+	try:
+		opts, args = getopt.getopt(argv[1:], 'c:a:r:l:j:p:n:o:h', [])
+		for opt, arg in opts:
+			if opt == '-c':
+				corpus_path = arg
+			elif opt == '-a':
+				archive_path = arg
+			elif opt == '-r':
+				replay_path = arg
+			elif opt == '-l':
+				latency = float(arg) / 1000.0
+			elif opt == '-j':
+				jitter = float(arg) / 1000.0
+			elif opt == '-p':
+				loss = float(arg)
+			elif opt == '-n':
+				preset_cnt = int(arg)
+			elif opt == '-o':
+				backup_path = arg
+			else:
+				print_usage()
+	except (getopt.GetoptError, ValueError) as e:
+		print(str(e))
+		print_usage()
+
+	from helix_usb import HelixUsb
+	if archive_path is not None:
+		presets, names = VirtualHelix.load_archive(archive_path)
+	else:
+		presets, names = VirtualHelix.load_corpus(corpus_path), []
+	device = VirtualHelix(presets, names, latency=latency, jitter=jitter, loss=loss, seed=1)
+	if replay_path is not None:
+		device.replay(VirtualHelix.load_replay(replay_path))
+	helix_usb = HelixUsb()
+	# measure the transfers, not the cache
+	helix_usb.preset_cache.path = ':memory:'
+
+	start_time = time.monotonic()
+	helix_usb.usb_device_found_cb(device.descriptor())
+	ready = helix_usb.wait_ready(HelixUsb.BACKUP_READY_TIMEOUT)
+	ready_time = time.monotonic() - start_time
+	print('connect and preset names: {:.3f}s{}'.format(ready_time, '' if ready else ' (not ready)'))
+
+	if ready:
+		start_time = time.monotonic()
+		done_cnt = helix_usb.backup_presets(backup_path, last=preset_cnt - 1)
+		elapsed = time.monotonic() - start_time
+		print('backup: {} presets in {:.3f}s, {:.1f} presets/s'.format(done_cnt, elapsed, done_cnt / max(elapsed, 1e-6)))
+
+	helix_usb.shutdown()
+	print('device: received {} packets, sent {}, dropped {}'.format(
+		device.received_cnt, device.sent_cnt, device.dropped_cnt))
+	return 0 if ready else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv))